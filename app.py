@@ -1,10 +1,22 @@
 # backend/app.py
 
 from flask import Flask
+from jinja2 import FileSystemBytecodeCache
 from services.firebase import init_firebase
+from services.retention import start_retention_scheduler
+from services.spool import init_spool, get_spool
+from services.telemetry import process_frame
+from services.profiler import init_profiler
+from services.local_index import init_local_index
+from services.inactivity import init_inactivity_monitor, get_inactivity_monitor
+from services.state_table import init_state_table, get_state_table
+from services.notifications import init_notifications, get_notification_dispatcher
+from services.sessionizer import init_sessionizer, get_sessionizer
+from services.reports import start_report_scheduler, get_report_status
 from routes.dashboard import dashboard_bp
 from routes.api import api_bp
 from routes.worker import worker_bp
+from routes.reports import reports_bp
 import os
 from dotenv import load_dotenv
 
@@ -12,6 +24,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def init_template_cache(app):
+    """
+    Persistent Jinja bytecode cache, warmed for every template at startup.
+    The first worker after a deploy compiles; the rest load bytecode.
+    """
+    cache_dir = os.getenv("JINJA_CACHE_DIR", os.path.join(app.root_path, ".jinja_cache"))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError as e:
+        print(f"Warning: template cache disabled: {e}")
+        return
+
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(cache_dir)}
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            print(f"Warning: could not precompile template {name}: {e}")
+
+
 def create_app():
     app = Flask(__name__)
 
@@ -21,17 +53,82 @@ def create_app():
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret")
     app.config["DEVICE_ID"] = os.getenv("DEVICE_ID", "helmet_01")
 
+    # Only one process per deployment should run compaction
+    app.config["RETENTION_ENABLED"] = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+
+    # Weekly/monthly report builds; like retention, one process per deployment
+    app.config["REPORTS_ENABLED"] = os.getenv("REPORTS_ENABLED", "false").lower() == "true"
+
+    # Telemetry is written to a local write-ahead spool before being forwarded
+    app.config["SPOOL_ENABLED"] = os.getenv("SPOOL_ENABLED", "true").lower() == "true"
+
+    # Latest per-device state shared by all workers on the host
+    app.config["STATE_TABLE_ENABLED"] = os.getenv("STATE_TABLE_ENABLED", "true").lower() == "true"
+
+    # Build session summaries from telemetry instead of helmet-written history.
+    # Off by default without the state table: per-worker sessions would split
+    # one helmet's frames across several summaries.
+    app.config["SESSIONIZER_ENABLED"] = os.getenv(
+        "SESSIONIZER_ENABLED", str(app.config["STATE_TABLE_ENABLED"])
+    ).lower() == "true"
+
+    # Raise INACTIVE alerts when a helmet stops sending telemetry
+    app.config["INACTIVITY_MONITOR_ENABLED"] = os.getenv("INACTIVITY_MONITOR_ENABLED", "true").lower() == "true"
+
+    # ===============================
+    # Template Bytecode Cache
+    # ===============================
+    # Compiled templates are kept on disk so new workers skip compilation
+    init_template_cache(app)
+
     # ===============================
     # Firebase Init
     # ===============================
     init_firebase()
 
+    # Fall back to in-process indexes if Firestore composite indexes are missing
+    init_local_index()
+
+    # ===============================
+    # Background Jobs
+    # ===============================
+    if app.config["RETENTION_ENABLED"]:
+        start_retention_scheduler()
+
+    if app.config["REPORTS_ENABLED"]:
+        start_report_scheduler()
+
+    if app.config["SPOOL_ENABLED"]:
+        init_spool(process_frame)
+
+    if app.config["STATE_TABLE_ENABLED"]:
+        init_state_table()
+
+    if app.config["SESSIONIZER_ENABLED"]:
+        # After the state table, so session boundaries are shared by workers
+        sessionizer = init_sessionizer()
+        if sessionizer.table is None:
+            print("Warning: sessionizer running without the shared state table; "
+                  "sessions are only correct with a single worker")
+
+    if app.config["INACTIVITY_MONITOR_ENABLED"]:
+        init_inactivity_monitor()
+
+    # Alert notifications (only when NOTIFY_DESTINATIONS is set)
+    init_notifications()
+
+    # ===============================
+    # Request Profiling (opt-in)
+    # ===============================
+    init_profiler(app)
+
     # ===============================
     # Register Blueprints
     # ===============================
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(api_bp, url_prefix="/api")
     app.register_blueprint(worker_bp)
+    app.register_blueprint(reports_bp)
 
     # ===============================
     # Health Check
@@ -42,6 +139,12 @@ def create_app():
             "status": "RUNNING",
             "service": "Drowsiness Detection Backend",
             "firebase": "CONNECTED",
+            "spool": get_spool().status() if get_spool() else "DISABLED",
+            "state_table": get_state_table().status() if get_state_table() else "DISABLED",
+            "inactivity": get_inactivity_monitor().status() if get_inactivity_monitor() else "DISABLED",
+            "sessionizer": get_sessionizer().status() if get_sessionizer() else "DISABLED",
+            "notifications": get_notification_dispatcher().status() if get_notification_dispatcher() else "DISABLED",
+            "reports": get_report_status() or "DISABLED",
         }
 
     return app
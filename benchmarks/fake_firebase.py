@@ -0,0 +1,162 @@
+# backend/benchmarks/fake_firebase.py
+
+# In-memory stand-ins for the Firebase Admin RTDB reference and Firestore
+# client, installed into services.firebase so service code runs unchanged
+# and offline. Reads return the stored objects without copying, so timings
+# measure our code rather than a fake JSON round trip.
+
+import itertools
+
+import services.firebase as firebase
+
+
+# ===============================
+# Realtime Database
+# ===============================
+class FakeQuery:
+    def __init__(self, ref):
+        self.ref = ref
+        self._start = self._end = None
+        self._first = self._last = None
+
+    def start_at(self, key):
+        self._start = key
+        return self
+
+    def end_at(self, key):
+        self._end = key
+        return self
+
+    def limit_to_first(self, n):
+        self._first = n
+        return self
+
+    def limit_to_last(self, n):
+        self._last = n
+        return self
+
+    def get(self):
+        node = self.ref.get()
+        if not isinstance(node, dict):
+            return {}
+        keys = sorted(node)
+        if self._start is not None:
+            keys = [k for k in keys if k >= self._start]
+        if self._end is not None:
+            keys = [k for k in keys if k <= self._end]
+        if self._first is not None:
+            keys = keys[:self._first]
+        if self._last is not None:
+            keys = keys[-self._last:]
+        return {k: node[k] for k in keys}
+
+
+class FakeReference:
+    def __init__(self, root, path=()):
+        self.root = root
+        self.path = path
+
+    def child(self, path):
+        return FakeReference(self.root, self.path + tuple(p for p in path.split("/") if p))
+
+    def _node(self):
+        node = self.root
+        for part in self.path:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    def get(self, shallow=False):
+        node = self._node()
+        if shallow and isinstance(node, dict):
+            return {k: True for k in node}
+        return node
+
+    def set(self, value):
+        self._write(self.path, value)
+
+    def update(self, values):
+        for key, value in values.items():
+            self._write(self.path + tuple(key.split("/")), value)
+
+    def _write(self, path, value):
+        node = self.root
+        for part in path[:-1]:
+            node = node.setdefault(part, {})
+        if isinstance(value, dict) and ".sv" in value:
+            value = (node.get(path[-1]) or 0) + value[".sv"]["increment"]
+        if value is None:
+            node.pop(path[-1], None)
+        else:
+            node[path[-1]] = value
+
+    def order_by_key(self):
+        return FakeQuery(self)
+
+
+# ===============================
+# Firestore
+# ===============================
+_ids = itertools.count()
+
+
+class FakeDocument:
+    def __init__(self, store, collection, doc_id=None):
+        self.store = store
+        self.collection = collection
+        self.id = doc_id or f"auto{next(_ids)}"
+
+    def set(self, data, merge=False):
+        docs = self.store.setdefault(self.collection, {})
+        if merge and self.id in docs:
+            docs[self.id].update(data)
+        else:
+            docs[self.id] = dict(data)
+
+
+class FakeCollection:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def document(self, doc_id=None):
+        return FakeDocument(self.store, self.name, doc_id)
+
+
+class FakeBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append((ref, data, merge))
+
+    def create(self, ref, data):
+        self._ops.append((ref, data, False))
+
+    def commit(self):
+        for ref, data, merge in self._ops:
+            ref.set(data, merge=merge)
+        self._ops = []
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.store = {}
+
+    def collection(self, name):
+        return FakeCollection(self.store, name)
+
+    def batch(self):
+        return FakeBatch()
+
+
+def install(rtdb_data=None):
+    """
+    Point services.firebase at fresh fakes; returns (rtdb_root, firestore)
+    """
+    root = rtdb_data if rtdb_data is not None else {}
+    firestore = FakeFirestore()
+    firebase._rtdb = FakeReference(root)
+    firebase._firestore = firestore
+    return root, firestore
@@ -0,0 +1,97 @@
+# backend/benchmarks/fixtures.py
+
+import random
+from datetime import datetime, timedelta, timezone
+
+# Fixed origin so fixtures (and therefore baselines) never depend on today
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+
+
+def history(n, seed=1):
+    """
+    /devices/{id}/history with n entries in the shapes helmets write:
+    millisecond or second timestamps, finalDuration / duration / neither,
+    and a few sessions still flagged active.
+    """
+    rng = random.Random(seed)
+    start = EPOCH.timestamp()
+    entries = {}
+    for i in range(n):
+        length = rng.randint(300, 4 * 3600)
+        entry = {"startTime": int(start * 1000), "active": False}
+
+        shape = i % 10
+        if shape == 0:
+            entry["startTime"] = int(start)          # seconds, not ms
+        if shape == 9 and i % 100 == 99:
+            entry["active"] = True                   # crashed / still open
+        else:
+            entry["endTime"] = int((start + length) * 1000)
+        if shape in (1, 2, 3):
+            entry["finalDuration"] = length
+        elif shape == 4:
+            entry["duration"] = length
+
+        entries[f"-N{i:09d}"] = entry
+        start += length + rng.randint(600, 4 * 3600)
+    return entries
+
+
+def timestamps(n, seed=2):
+    """
+    Raw RTDB timestamp values: ms ints, second floats, numeric strings, junk
+    """
+    rng = random.Random(seed)
+    base = EPOCH.timestamp()
+    values = []
+    for i in range(n):
+        ts = base + rng.randint(0, 365 * 86400)
+        kind = i % 5
+        if kind == 0:
+            values.append(int(ts * 1000))
+        elif kind == 1:
+            values.append(ts)
+        elif kind == 2:
+            values.append(str(int(ts * 1000)))
+        elif kind == 3:
+            values.append(None)
+        else:
+            values.append("n/a")
+    return values
+
+
+def frames(n, seed=3):
+    """
+    Telemetry frames; roughly 5% trip at least one alert rule
+    """
+    rng = random.Random(seed)
+    base = int(EPOCH.timestamp())
+    result = []
+    for i in range(n):
+        abnormal = rng.random() < 0.05
+        result.append({
+            "pitch": rng.uniform(-35, -10) if abnormal else rng.uniform(-15, 15),
+            "gyroY": rng.uniform(-200, 200),
+            "bodyTemp": rng.uniform(38.0, 39.5) if abnormal else rng.uniform(35.5, 37.5),
+            "heartRate": rng.randint(55, 110),
+            "isDrowsy": abnormal and rng.random() < 0.5,
+            "serverTime": base + i,
+        })
+    return result
+
+
+def alerts(n, device_id="helmet_01", seed=4):
+    rng = random.Random(seed)
+    types = ["DROWSINESS_DETECTED", "HEAD_DOWN", "SUDDEN_NOD", "HIGH_BODY_TEMPERATURE"]
+    return [
+        {
+            "id": f"alert{i}",
+            "device_id": device_id,
+            "type": rng.choice(types),
+            "message": "Benchmark alert",
+            "timestamp": EPOCH + timedelta(seconds=i * 30),
+            "acknowledged": rng.random() < 0.3,
+        }
+        for i in range(n)
+    ]
@@ -0,0 +1,331 @@
+# backend/benchmarks/run.py
+
+# Offline micro-benchmarks against fake Firebase and generated fixtures.
+#
+#   python -m benchmarks.run                      # compare with baselines.json
+#   python -m benchmarks.run --sizes 1k,100k,1M   # include the 1M fixtures
+#   python -m benchmarks.run --update-baseline    # record new baselines
+#
+# Exits 1 when a result is slower / uses more memory than its baseline by
+# more than the threshold.
+
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+
+from flask import Flask
+
+from benchmarks import fake_firebase, fixtures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# ===============================
+# Benchmark Settings
+# ===============================
+# Allowed slowdown / memory growth over the baseline (0.5 = 50%)
+BENCH_TIME_THRESHOLD = float(os.getenv("BENCH_TIME_THRESHOLD", 0.5))
+BENCH_MEMORY_THRESHOLD = float(os.getenv("BENCH_MEMORY_THRESHOLD", 0.25))
+BENCH_SIZES = os.getenv("BENCH_SIZES", "1k,100k")
+BENCH_ROUNDS = int(os.getenv("BENCH_ROUNDS", 5))
+
+# Keep each measurement above this so timer resolution does not matter
+MIN_SAMPLE_SECONDS = 0.2
+
+DEVICE_ID = "helmet_01"
+# A day the generated history has sessions on
+TARGET_DAY = "2025-01-02"
+
+_fixture_cache = {}
+
+
+def _fixture(kind, n):
+    key = (kind, n)
+    if key not in _fixture_cache:
+        _fixture_cache.clear()
+        _fixture_cache[key] = getattr(fixtures, kind)(n)
+    return _fixture_cache[key]
+
+
+def _history_db(n):
+    return {"devices": {DEVICE_ID: {"history": _fixture("history", n)}}}
+
+
+# ===============================
+# Benchmarks
+# ===============================
+# Each benchmark takes a size and returns a zero-argument callable; the
+# setup (fixtures, fakes) is not measured, only calls to the callable.
+def bench_get_rtdb_sessions(n):
+    from services.work_hours import get_rtdb_sessions
+
+    fake_firebase.install(_history_db(n))
+    return lambda: get_rtdb_sessions(DEVICE_ID)
+
+
+def bench_get_daily_worked_hours(n):
+    from services.work_hours import get_daily_worked_hours
+
+    fake_firebase.install(_history_db(n))
+    return lambda: get_daily_worked_hours(DEVICE_ID, TARGET_DAY)
+
+
+def bench_parse_rtdb_timestamp(n):
+    from services.work_hours import _parse_rtdb_timestamp
+
+    values = _fixture("timestamps", n)
+    return lambda: [_parse_rtdb_timestamp(v) for v in values]
+
+
+def bench_generate_alerts(n):
+    from services.alerts import generate_alerts
+
+    frames = _fixture("frames", n)
+
+    def run():
+        # Fresh store per call so repeated rounds do the same work
+        fake_firebase.install()
+        for frame in frames:
+            generate_alerts(DEVICE_ID, frame, fixtures.EPOCH)
+
+    return run
+
+
+def _flask_app():
+    from routes.dashboard import dashboard_bp
+
+    # Not app.create_app(): that connects to Firebase and starts workers
+    app = Flask(
+        "benchmarks",
+        root_path=ROOT,
+        template_folder=os.path.join(ROOT, "templates"),
+        static_folder=os.path.join(ROOT, "static"),
+    )
+    app.config["DEVICE_ID"] = DEVICE_ID
+    app.register_blueprint(dashboard_bp)
+    return app
+
+
+def bench_render_dashboard(n):
+    from flask import render_template
+
+    app = _flask_app()
+    live = fixtures.frames(1)[0]
+    alerts = fixtures.alerts(n)
+
+    def run():
+        with app.test_request_context("/"):
+            return render_template(
+                "dashboard.html",
+                device_id=DEVICE_ID,
+                live=live,
+                alerts=alerts,
+                unacknowledged=len(alerts),
+                worked_hours=12.5,
+            )
+
+    return run
+
+
+def bench_render_sessions(n):
+    app = _flask_app()
+    client = app.test_client()
+    fake_firebase.install(_history_db(n))
+
+    def run():
+        # The real route: streamed rows plus total hours over the whole history
+        response = client.get("/sessions")
+        body = response.get_data()
+        response.close()
+        return body
+
+    return run
+
+
+# name -> (benchmark, fixed size or None to use every requested size)
+BENCHMARKS = {
+    "get_rtdb_sessions": (bench_get_rtdb_sessions, None),
+    "get_daily_worked_hours": (bench_get_daily_worked_hours, None),
+    "_parse_rtdb_timestamp": (bench_parse_rtdb_timestamp, None),
+    "generate_alerts": (bench_generate_alerts, None),
+    # The dashboard shows the latest 10 alerts whatever the history size
+    "render_dashboard": (bench_render_dashboard, 10),
+    "render_sessions": (bench_render_sessions, None),
+}
+
+
+# ===============================
+# Measurement
+# ===============================
+def measure_time(func, rounds):
+    """
+    Best per-call time over `rounds` samples, in seconds. Fast functions
+    are looped inside a sample so each one lasts MIN_SAMPLE_SECONDS.
+    """
+    func()  # warm-up (imports, template compilation, caches)
+
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS:
+            break
+        loops *= 10 if elapsed < MIN_SAMPLE_SECONDS / 10 else 2
+
+    best = elapsed / loops
+    # Slow cases (1M entries) get fewer samples
+    if elapsed > 5:
+        rounds = min(rounds, 2)
+    for _ in range(rounds - 1):
+        gc.collect()
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+
+def measure_peak_memory(func):
+    """
+    Peak memory allocated during one call, in KiB (separate run: tracing
+    slows everything down, so it never overlaps the timed runs)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def run_benchmarks(names, sizes, rounds):
+    results = {}
+    for name in names:
+        bench, fixed_size = BENCHMARKS[name]
+        for label, n in ([(str(fixed_size), fixed_size)] if fixed_size else sizes):
+            key = f"{name}[{label}]"
+            func = bench(n)
+            seconds = measure_time(func, rounds)
+            peak_kb = measure_peak_memory(func)
+            results[key] = {"time_ms": round(seconds * 1000, 4), "peak_kb": round(peak_kb, 1)}
+            print(f"{key:<36} {seconds * 1000:>12.3f} ms {peak_kb:>12.1f} KiB")
+        _fixture_cache.clear()
+    return results
+
+
+# ===============================
+# Baselines
+# ===============================
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def load_baselines(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"environment": {}, "results": {}}
+
+
+def save_baselines(results, path=BASELINE_PATH):
+    """
+    Merge results into the baseline file (other sizes are kept)
+    """
+    baselines = load_baselines(path)
+    baselines["environment"] = _environment()
+    baselines["results"] = dict(sorted({**baselines.get("results", {}), **results}.items()))
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2)
+        f.write("\n")
+
+
+def compare(results, baselines, time_threshold, memory_threshold):
+    """
+    Regressions as human-readable lines; results without a baseline are skipped
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baselines.get("results", {}).get(key)
+        if not base:
+            print(f"No baseline for {key}, skipping comparison")
+            continue
+        checks = (
+            ("time", result["time_ms"], base["time_ms"], time_threshold, "ms"),
+            ("peak memory", result["peak_kb"], base["peak_kb"], memory_threshold, "KiB"),
+        )
+        for metric, value, baseline, threshold, unit in checks:
+            if baseline and value > baseline * (1 + threshold):
+                regressions.append(
+                    f"{key}: {metric} {value:.1f} {unit} vs baseline {baseline:.1f} {unit} "
+                    f"(+{(value / baseline - 1) * 100:.0f}%, allowed +{threshold * 100:.0f}%)"
+                )
+    return regressions
+
+
+# ===============================
+# CLI
+# ===============================
+def _parse_sizes(value):
+    sizes = []
+    for label in value.split(","):
+        label = label.strip()
+        if label not in fixtures.SIZES:
+            raise argparse.ArgumentTypeError(f"unknown size {label!r} (choose from {', '.join(fixtures.SIZES)})")
+        sizes.append((label, fixtures.SIZES[label]))
+    return sizes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for hot service functions")
+    parser.add_argument("--sizes", type=_parse_sizes, default=_parse_sizes(BENCH_SIZES),
+                        help=f"fixture sizes, comma separated ({', '.join(fixtures.SIZES)}); default {BENCH_SIZES}")
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS),
+                        help="run only this benchmark (repeatable)")
+    parser.add_argument("--rounds", type=int, default=BENCH_ROUNDS)
+    parser.add_argument("--threshold", type=float, default=BENCH_TIME_THRESHOLD,
+                        help="allowed slowdown over baseline, e.g. 0.5 for 50%%")
+    parser.add_argument("--memory-threshold", type=float, default=BENCH_MEMORY_THRESHOLD,
+                        help="allowed peak memory growth over baseline")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help=f"write results to {os.path.relpath(BASELINE_PATH, ROOT)} instead of comparing")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only or list(BENCHMARKS), args.sizes, args.rounds)
+
+    if args.update_baseline:
+        save_baselines(results)
+        print(f"Baselines written to {BASELINE_PATH}")
+        return 0
+
+    baselines = load_baselines()
+    if baselines.get("environment") and baselines["environment"] != _environment():
+        print(f"Warning: baselines were recorded on {baselines['environment']}, "
+              f"this is {_environment()}; timings may not be comparable")
+
+    regressions = compare(results, baselines, args.threshold, args.memory_threshold)
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,29 @@
 # backend/routes/api.py
 
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, send_file
 from services.firebase import (
     get_live_ref,
     get_control_ref
 )
-from services.analytics import log_drowsiness_event
-from services.alerts import generate_alerts
+from services.alerts import (
+    evaluate_alerts,
+    acknowledge_alerts,
+    acknowledge_device_alerts,
+    get_unacknowledged_count
+)
 from services.work_hours import is_inactive
+from services.telemetry import process_frame, normalize_frame, frame_timestamp
+from services.spool import get_spool, SpoolUnavailable
+from services.admission import get_admission_controller, SHED, COALESCED
+from services.fleet import get_fleet_overview
+from services.inactivity import get_inactivity_monitor, INACTIVITY_THRESHOLD_MINUTES
+from services.state_table import get_state_table
+from services.notifications import get_notification_dispatcher
+from services.sessionizer import get_sessionizer
+from services import profiler
 from datetime import datetime
+import os
+import re
 
 api_bp = Blueprint("api", __name__)
 
@@ -21,24 +36,81 @@ def receive_telemetry():
     ESP32 pushes live sensor data here
     """
     data = request.json
-    device_id = current_app.config["DEVICE_ID"]
+    device_id = _telemetry_device_id()
+
+    if device_id is None:
+        return jsonify({"error": "Invalid X-Device-Id (1-32 of A-Z a-z 0-9 _ -)"}), 400
 
     if not data:
         return jsonify({"error": "No data"}), 400
 
+    # Reject bad frames before they reach admission, the spool or the rules
+    try:
+        normalize_frame(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # Add server timestamp
     data["serverTime"] = int(datetime.utcnow().timestamp())
 
-    # Push to Firebase Realtime DB
-    live_ref = get_live_ref(device_id)
-    live_ref.update(data)
+    # Run the rules once: admission uses them to classify, storage reuses them
+    try:
+        alerts = evaluate_alerts(device_id, data, frame_timestamp(data))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid telemetry: {e}"}), 400
+
+    # -------- Admission Control --------
+    admission = get_admission_controller()
+    decision = admission.admit(device_id, data, alerts)
+
+    if decision.status == SHED:
+        response = jsonify({"error": "Too many requests", "reason": decision.reason})
+        response.headers["Retry-After"] = str(decision.retry_after)
+        return response, 429
 
-    # -------- Analytics --------
-    if data.get("isDrowsy"):
-        log_drowsiness_event(device_id, data)
+    if decision.status == COALESCED:
+        # A newer frame from the same helmet replaced this one in the queue
+        return jsonify({"status": "COALESCED", "alerts_generated": 0}), 202
 
-    # -------- Alerts --------
-    alerts = generate_alerts(device_id, data)
+    try:
+        # Latest state for every worker on this host
+        table = get_state_table()
+        previous_seen = None
+        if table:
+            state = table.get(device_id)
+            previous_seen = state["serverTime"] if state else None
+            table.update(device_id, data)
+
+        # Push back this helmet's inactivity deadline
+        monitor = get_inactivity_monitor()
+        if monitor:
+            monitor.touch(device_id, data["serverTime"], previous_seen)
+
+        # Spool to local disk first; the replayer forwards to Firebase
+        spool = get_spool()
+        if spool:
+            try:
+                spool.append(device_id, data)
+                fallback_key, spooled = None, True
+            except SpoolUnavailable as e:
+                # Possibly replayed later: reuse its key so that's a no-op
+                print(f"ERROR spooling telemetry, forwarding directly: {e}")
+                fallback_key, spooled = e.key, False
+            except Exception as e:
+                # Not in the spool, so forwarding it here cannot duplicate it
+                print(f"ERROR spooling telemetry, forwarding directly: {e}")
+                fallback_key, spooled = None, False
+            if not spooled:
+                process_frame(device_id, data, idempotency_key=fallback_key, alerts=alerts)
+        else:
+            process_frame(device_id, data, alerts=alerts)
+    finally:
+        admission.release(decision)
+
+    # Per-session drowsy/alert counts (memory only; flushed in the background)
+    sessionizer = get_sessionizer()
+    if sessionizer:
+        sessionizer.observe(device_id, data["serverTime"], bool(data.get("isDrowsy")), len(alerts))
 
     return jsonify({
         "status": "OK",
@@ -46,6 +118,66 @@ def receive_telemetry():
     })
 
 
+# The ID becomes an RTDB path segment, a Firestore document ID and a
+# spool/shared-memory key, so it is restricted to characters safe in all
+DEVICE_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,32}")
+
+
+def _telemetry_device_id():
+    """
+    Helmets identify themselves with X-Device-Id; single-device
+    deployments fall back to the configured DEVICE_ID.
+    Returns None if the header is not a valid device ID.
+    """
+    device_id = request.headers.get("X-Device-Id")
+    if device_id is None:
+        return current_app.config["DEVICE_ID"]
+    return device_id if DEVICE_ID_PATTERN.fullmatch(device_id) else None
+
+
+# Fields of the live node mirrored in the shared state table
+LIVE_FIELDS = ("pitch", "gyroY", "bodyTemp", "heartRate", "isDrowsy", "serverTime")
+
+
+def _shared_state(device_id):
+    """
+    Latest state from the shared-memory table; None if it is disabled,
+    doesn't know the device or a read kept racing a writer
+    """
+    table = get_state_table()
+    return table.get(device_id) if table else None
+
+
+# ===============================
+# GET: Admission Metrics
+# ===============================
+@api_bp.route("/admission", methods=["GET"])
+def get_admission_status():
+    """
+    Shed counts, coalescing and queueing delay for telemetry ingest
+    """
+    return jsonify(get_admission_controller().status())
+
+
+# ===============================
+# GET: Notification Metrics
+# ===============================
+@api_bp.route("/notifications", methods=["GET"])
+def get_notification_status():
+    """
+    Delivery counts, latency and recent dead letters for alert notifications
+    """
+    dispatcher = get_notification_dispatcher()
+    if dispatcher is None:
+        return jsonify({"status": "DISABLED"})
+
+    limit = min(max(request.args.get("dead_letters", 20, type=int), 1), 200)
+    return jsonify({
+        **dispatcher.status(),
+        "dead_letters": dispatcher.dead_letters.recent(limit),
+    })
+
+
 # ===============================
 # GET: Live Data (Dashboard)
 # ===============================
@@ -55,26 +187,54 @@ def get_live_data():
     Dashboard fetches live telemetry
     """
     device_id = current_app.config["DEVICE_ID"]
-    live_ref = get_live_ref(device_id)
 
-    data = live_ref.get()
+    state = _shared_state(device_id)
+    if state and state["serverTime"]:
+        data = {field: state[field] for field in LIVE_FIELDS}
+    else:
+        data = get_live_ref(device_id).get()
+        if isinstance(data, dict) and get_state_table():
+            get_state_table().update(device_id, data)
+
     return jsonify({
         "device_id": device_id,
         "live": data
     })
 
 
+# ===============================
+# GET: Fleet Overview
+# ===============================
+@api_bp.route("/fleet", methods=["GET"])
+def get_fleet():
+    """
+    Live status of every helmet (briefly cached)
+    """
+    try:
+        return jsonify(get_fleet_overview())
+    except Exception as e:
+        print(f"ERROR loading fleet overview: {e}")
+        return jsonify({"error": "Fleet status unavailable"}), 503
+
+
 # ===============================
 # GET: Motor State
 # ===============================
 @api_bp.route("/motor", methods=["GET"])
 def get_motor_state():
     device_id = current_app.config["DEVICE_ID"]
-    control_ref = get_control_ref(device_id)
 
-    state = control_ref.get()
+    shared = _shared_state(device_id)
+    if shared and shared["motor"]:
+        return jsonify({"motor": shared["motor"]})
+
+    state = get_control_ref(device_id).get() or {}
+    motor = state.get("motor", "UNKNOWN")
+    if get_state_table():
+        get_state_table().update(device_id, motor=motor)
+
     return jsonify({
-        "motor": state.get("motor", "UNKNOWN")
+        "motor": motor
     })
 
 
@@ -84,18 +244,125 @@ def get_motor_state():
 @api_bp.route("/inactive", methods=["GET"])
 def check_inactivity():
     """
-    Detect device inactivity
+    Detect device inactivity (from the shared state table or the
+    inactivity monitor when they know the device, otherwise from the
+    live node)
     """
     device_id = current_app.config["DEVICE_ID"]
-    live = get_live_ref(device_id).get()
 
-    last_ts = None
-    if live and "serverTime" in live:
-        last_ts = datetime.utcfromtimestamp(live["serverTime"])
+    state = _shared_state(device_id)
+    monitor = get_inactivity_monitor()
+    # Same threshold as the INACTIVE alerts
+    threshold = monitor.threshold / 60 if monitor else INACTIVITY_THRESHOLD_MINUTES
+    if state and state["serverTime"]:
+        inactive = is_inactive(datetime.utcfromtimestamp(state["serverTime"]), threshold)
+    else:
+        inactive = monitor.is_inactive(device_id) if monitor else None
 
-    inactive = is_inactive(last_ts)
+    if inactive is None:
+        live = get_live_ref(device_id).get()
+
+        last_ts = None
+        if live and "serverTime" in live:
+            last_ts = datetime.utcfromtimestamp(live["serverTime"])
+            if monitor:
+                monitor.seed(device_id, live["serverTime"])
+
+        inactive = is_inactive(last_ts, threshold)
 
     return jsonify({
         "device_id": device_id,
         "inactive": inactive
     })
+
+
+# ===============================
+# GET: Request Profiles
+# ===============================
+@api_bp.route("/profiles", methods=["GET"])
+def list_request_profiles():
+    """
+    Recent sampled request profiles (requires the profile token)
+    """
+    if not profiler.is_authorized(request):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify({"profiles": profiler.list_profiles(limit)})
+
+
+@api_bp.route("/profiles/<path:filename>", methods=["GET"])
+def download_request_profile(filename):
+    if not profiler.is_authorized(request):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    path = profiler.profile_path(filename)
+    if not path:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(os.path.abspath(path), as_attachment=True)
+
+
+# ===============================
+# POST: Bulk Alert Acknowledgement
+# ===============================
+@api_bp.route("/alerts/acknowledge", methods=["POST"])
+def bulk_acknowledge_alerts():
+    """
+    Acknowledge alerts in bulk. Body is one of:
+        {"ids": ["alertId", ...]}
+        {"start": "<ISO time>", "end": "<ISO time>"}   (either bound optional)
+        {"all": true}
+    """
+    device_id = current_app.config["DEVICE_ID"]
+    data = request.json or {}
+
+    if "ids" in data:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not all(_is_alert_id(alert_id) for alert_id in ids):
+            return jsonify({"error": "ids must be a list of alert ID strings"}), 400
+        acknowledged = acknowledge_alerts(ids)
+    elif "start" in data or "end" in data:
+        try:
+            start = _parse_iso(data.get("start"))
+            end = _parse_iso(data.get("end"))
+        except ValueError:
+            return jsonify({"error": "Invalid timestamp"}), 400
+        acknowledged = acknowledge_device_alerts(device_id, start, end)
+    elif data.get("all"):
+        acknowledged = acknowledge_device_alerts(device_id)
+    else:
+        return jsonify({"error": "Provide ids, start/end or all"}), 400
+
+    return jsonify({
+        "status": "OK",
+        "device_id": device_id,
+        "acknowledged": acknowledged,
+        "unacknowledged": get_unacknowledged_count(device_id)
+    })
+
+
+# ===============================
+# GET: Unacknowledged Alert Count
+# ===============================
+@api_bp.route("/alerts/unacknowledged", methods=["GET"])
+def get_unacknowledged_alerts():
+    device_id = current_app.config["DEVICE_ID"]
+    return jsonify({
+        "device_id": device_id,
+        "unacknowledged": get_unacknowledged_count(device_id)
+    })
+
+
+def _is_alert_id(value):
+    """
+    A usable Firestore document ID: non-empty string, no path separator
+    """
+    return isinstance(value, str) and value.strip() not in ("", ".", "..") and "/" not in value
+
+
+def _parse_iso(value):
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        raise ValueError("Timestamps must be ISO strings")
+    return datetime.fromisoformat(value)
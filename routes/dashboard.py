@@ -1,12 +1,20 @@
 # backend/routes/dashboard.py
 
-from flask import Blueprint, render_template, current_app
+from flask import Blueprint, render_template, stream_template, current_app, Response
+from jinja2.environment import TemplateStream
 from services.firebase import get_live_ref, get_firestore, safe_get
-from services.alerts import get_recent_alerts
-from services.work_hours import get_total_worked_hours, get_rtdb_sessions
+from services.alerts import get_recent_alerts, get_unacknowledged_count
+from services.work_hours import (
+    get_total_worked_hours,
+    iter_rtdb_sessions
+)
+from services.concurrency import fan_out, task
+from services.fleet import get_fleet_overview
+from services import local_index
 from google.api_core import exceptions as google_exceptions
 
-from datetime import datetime, timezone
+from datetime import datetime, date, timezone
+import os
 
 dashboard_bp = Blueprint("dashboard", __name__)
 
@@ -18,127 +26,168 @@ dashboard_bp = Blueprint("dashboard", __name__)
 def dashboard():
     device_id = current_app.config["DEVICE_ID"]
 
-    # ---- Live Data ----
-    live_data = safe_get(get_live_ref(device_id), {})
-
-    # ---- Alerts ----
-    alerts = get_recent_alerts(device_id)
-
-    # ---- Worked Hours ----
-    worked_hours = get_total_worked_hours(device_id)
+    # Live data, alerts and worked hours are independent reads
+    results = fan_out({
+        "live": task(safe_get, get_live_ref(device_id), {}, default={}),
+        "alerts": task(get_recent_alerts, device_id, default=[]),
+        "unacknowledged": task(get_unacknowledged_count, device_id, default=0),
+        "worked_hours": task(get_total_worked_hours, device_id, default=0.0),
+    })
 
     return render_template(
         "dashboard.html",
         device_id=device_id,
-        live=live_data,
-        alerts=alerts,
-        worked_hours=worked_hours,
+        live=results["live"],
+        alerts=results["alerts"],
+        unacknowledged=results["unacknowledged"],
+        worked_hours=results["worked_hours"],
     )
 
 
 # ===============================
-# Drowsiness History Page
+# Fleet Overview Page
 # ===============================
-@dashboard_bp.route("/drowsiness-history")
-def drowsiness_history():
-    device_id = current_app.config["DEVICE_ID"]
-    from datetime import datetime, date
-
+@dashboard_bp.route("/fleet")
+def fleet():
     try:
-        db = get_firestore()
-        events = []
+        overview = get_fleet_overview()
+    except Exception as e:
+        print(f"Error loading fleet overview: {e}")
+        overview = {"devices": [], "device_count": 0, "drowsy_count": 0, "inactive_count": 0}
 
-        # Try with index first
-        try:
-            from google.cloud.firestore_v1.base_query import FieldFilter
+    return render_template("fleet.html", fleet=overview)
 
-            docs = (
-                db.collection("drowsy_events")
-                .where(filter=FieldFilter("device_id", "==", device_id))
-                .order_by("timestamp", direction="DESCENDING")
-                .limit(50)
-                .stream()
-            )
 
-            for doc in docs:
-                event = doc.to_dict()
-                event["id"] = doc.id
-                events.append(event)
-        except Exception:
-            # Fallback: get all events and filter in code
-            print("Using fallback query for history")
-            docs = db.collection("drowsy_events").limit(200).stream()
+# ===============================
+# Streamed Pages
+# ===============================
+HISTORY_LIMIT = 50
+HISTORY_PAGE_SIZE = 25
+SESSIONS_LIMIT = 20
 
-            for doc in docs:
-                event = doc.to_dict()
-                if event.get("device_id") == device_id:
-                    event["id"] = doc.id
-                    events.append(event)
+# Template pieces Jinja collects before each write to the client
+STREAM_BUFFER = int(os.getenv("STREAM_BUFFER", 20))
+
+
+def _stream_page(template_name, **context):
+    """
+    Render a template incrementally. The page shell is sent before the
+    row generators in `context` fetch anything, and rows follow page by
+    page as they are read.
+    """
+    stream = TemplateStream(stream_template(template_name, **context))
+    stream.enable_buffering(STREAM_BUFFER)
+    return Response(stream, mimetype="text/html")
 
-            # Sort by timestamp descending
-            events.sort(key=lambda x: x.get("timestamp", datetime.min), reverse=True)
-            events = events[:50]
 
+# ===============================
+# Drowsiness History Page
+# ===============================
+def _drowsy_event_pages(device_id, limit):
+    """
+    Latest drowsy events for a device, read HISTORY_PAGE_SIZE at a time
+    """
+    if local_index.prefer_local("drowsy_events"):
+        # Composite index missing: serve from the in-process index
+        yield from local_index.query_latest("drowsy_events", device_id, limit) or []
+        return
+
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = (
+        get_firestore().collection("drowsy_events")
+        .where(filter=FieldFilter("device_id", "==", device_id))
+        .order_by("timestamp", direction="DESCENDING")
+    )
+
+    fetched = 0
+    last = None
+    try:
+        while fetched < limit:
+            page = query.start_after(last) if last else query
+            size = min(HISTORY_PAGE_SIZE, limit - fetched)
+            docs = list(page.limit(size).stream())
+
+            for doc in docs:
+                event = doc.to_dict()
+                event["id"] = doc.id
+                yield event
+
+            fetched += len(docs)
+            if len(docs) < size:
+                return
+            last = docs[-1]
+    except google_exceptions.FailedPrecondition as e:
+        if fetched:
+            raise
+        print(f"Warning: Firestore index not found for history: {e}")
+        yield from local_index.query_latest("drowsy_events", device_id, limit) or []
+
+
+def _iter_drowsy_events(device_id, summary):
+    """
+    Rows for drowsiness_history.html; fills summary["count"/"today"] as it goes
+    """
+    today = date.today()
+    try:
+        for event in _drowsy_event_pages(device_id, HISTORY_LIMIT):
+            summary["count"] += 1
+            event_date = event.get("timestamp")
+            if isinstance(event_date, datetime):
+                event_date = event_date.date()
+            if event_date == today:
+                summary["today"] += 1
+            yield event
     except Exception as e:
         print(f"Error fetching drowsiness history: {e}")
         import traceback
 
         traceback.print_exc()
-        events = []
 
-    # Calculate today's events
-    today = date.today()
-    today_events = 0
-    for event in events:
-        if event.get("timestamp"):
-            event_date = event["timestamp"]
-            if isinstance(event_date, datetime):
-                if event_date.date() == today:
-                    today_events += 1
-            elif isinstance(event_date, date):
-                if event_date == today:
-                    today_events += 1
 
-    return render_template(
+@dashboard_bp.route("/drowsiness-history")
+def drowsiness_history():
+    device_id = current_app.config["DEVICE_ID"]
+    summary = {"count": 0, "today": 0}
+
+    return _stream_page(
         "drowsiness_history.html",
         device_id=device_id,
-        events=events,
-        today_events=today_events,
+        events=_iter_drowsy_events(device_id, summary),
+        summary=summary,
     )
 
 
 # ===============================
 # Session History Page (RTDB)
 # ===============================
-@dashboard_bp.route("/sessions")
-def session_history():
-    device_id = current_app.config["DEVICE_ID"]
-
+def _iter_sessions(device_id, summary):
+    """
+    Rows for sessions.html, newest first, read a page at a time
+    """
     try:
-        # ✅ Already normalized sessions
-        sessions = get_rtdb_sessions(device_id)
-
-        # Sort latest first
-        sessions.sort(
-            key=lambda s: s.get("start_time"),
-            reverse=True
-        )
-
-        sessions = sessions[:20]
-        total_hours = get_total_worked_hours(device_id)
-
+        for session in iter_rtdb_sessions(device_id, limit=SESSIONS_LIMIT, page_size=SESSIONS_LIMIT):
+            summary["count"] += 1
+            summary["drowsy_events"] += session.get("total_drowsy_events", 0)
+            yield session
     except Exception as e:
         print("Sessions error:", e)
         import traceback
         traceback.print_exc()
-        sessions = []
-        total_hours = 0.0
 
-    return render_template(
-            "sessions.html",
-            device_id=device_id,
-            sessions=sessions,
-            total_hours=total_hours,
-            now=datetime.now(timezone.utc)
-        )
 
+@dashboard_bp.route("/sessions")
+def session_history():
+    device_id = current_app.config["DEVICE_ID"]
+    summary = {"count": 0, "drowsy_events": 0}
+
+    # Total hours need the whole history (plus archived totals); the
+    # template asks for them after the recent sessions have been sent.
+    return _stream_page(
+        "sessions.html",
+        device_id=device_id,
+        sessions=_iter_sessions(device_id, summary),
+        summary=summary,
+        total_hours=lambda: get_total_worked_hours(device_id),
+        now=datetime.now(timezone.utc),
+    )
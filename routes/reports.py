@@ -0,0 +1,60 @@
+# backend/routes/reports.py
+
+from flask import Blueprint, request, jsonify, render_template, Response
+from services.reports import load_report, list_reports, resolve_period, report_csv, report_tables
+
+reports_bp = Blueprint("reports", __name__)
+
+
+# ===============================
+# GET: Stored Reports for a Device
+# ===============================
+@reports_bp.route("/reports/<device_id>", methods=["GET"])
+def get_device_reports(device_id):
+    return jsonify({"device_id": device_id, "reports": list_reports(device_id)})
+
+
+# ===============================
+# GET: One Report
+# ===============================
+@reports_bp.route("/reports/<device_id>/<period>", methods=["GET"])
+def get_report(device_id, period):
+    """
+    A precomputed report (one document read). period is "2025-W03",
+    "2025-01", this-week, last-week, this-month or last-month.
+
+    ?version=N for an older version, ?format=csv for a CSV download,
+    ?format=print for a printable page (save as PDF from the browser).
+    """
+    try:
+        period_id = resolve_period(period)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    version = request.args.get("version")
+    if version is not None:
+        try:
+            version = int(version)
+            if version < 1:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "version must be a positive integer"}), 400
+
+    report = load_report(device_id, period_id, version)
+    if report is None:
+        return jsonify({"error": "Report not found", "device_id": device_id, "period": period_id}), 404
+
+    export = request.args.get("format", "json")
+    if export == "csv":
+        filename = f"report_{device_id}_{period_id}_v{report.get('version', 0)}.csv"
+        return Response(
+            report_csv(report),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={filename}"},
+        )
+    if export == "print":
+        return render_template("report.html", report=report, tables=report_tables(report))
+    if export != "json":
+        return jsonify({"error": "format must be json, csv or print"}), 400
+
+    return jsonify(report)
@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, current_app
-from services.firebase import get_firestore, get_live_ref
-from services.work_hours import get_daily_worked_hours, get_rtdb_sessions
+from services.firebase import get_firestore, get_live_ref, get_device_ref, safe_get
+from services.work_hours import get_daily_worked_hours, get_rtdb_sessions, normalize_summary
+from services.concurrency import fan_out, task
+from services import local_index
+from google.api_core import exceptions as google_exceptions
 from datetime import datetime, timezone
 
 worker_bp = Blueprint("worker", __name__)
@@ -13,28 +16,35 @@ def worker_dashboard():
     """
     device_id = current_app.config["DEVICE_ID"]
 
-    # Get live sensor data for immediate status
-    live_data = get_live_ref(device_id).get() or {}
-
-    # Get comprehensive, today-focused statistics based on RTDB sessions
-    stats = get_daily_worker_stats(device_id)
-
-    # Get a list of today's drowsiness events
-    today_events = get_today_drowsiness_events(device_id)
-
-    # Get data for the currently active session from RTDB
-    session_data = get_current_session_data(device_id)
+    results = fan_out({
+        # Live sensor data for immediate status
+        "live": task(lambda: get_live_ref(device_id).get() or {}, default={}),
+        # Comprehensive, today-focused statistics based on RTDB sessions
+        "stats": task(get_daily_worker_stats, device_id, default=_EMPTY_STATS),
+        # Today's drowsiness events
+        "today_events": task(get_today_drowsiness_events, device_id, default=[]),
+        # Currently active session from RTDB
+        "session_data": task(get_current_session_data, device_id, default=None),
+    })
 
     return render_template(
         "worker_dashboard.html",
         device_id=device_id,
-        live=live_data,
-        stats=stats,
-        today_events=today_events,
-        session_data=session_data,
+        live=results["live"],
+        stats=results["stats"],
+        today_events=results["today_events"],
+        session_data=results["session_data"],
     )
 
 
+_EMPTY_STATS = {
+    "daily_worked_hours": 0,
+    "today_drowsy_events": 0,
+    "today_total_sessions": 0,
+    "today_avg_session_duration": 0,
+}
+
+
 def get_daily_worker_stats(device_id):
     """
     Calculate daily statistics using RTDB sessions + Firestore drowsy events.
@@ -75,23 +85,22 @@ def get_daily_worker_stats(device_id):
         }
     except Exception as e:
         print(f"ERROR getting daily worker stats (RTDB): {e}")
-        return {
-            "daily_worked_hours": 0,
-            "today_drowsy_events": 0,
-            "today_total_sessions": 0,
-            "today_avg_session_duration": 0,
-        }
+        return dict(_EMPTY_STATS)
 
 
 def get_today_drowsiness_events(device_id, limit=50):
     """
     Get today's drowsiness events, newest first, directly from Firestore.
     """
+    today_start = datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    if local_index.prefer_local("drowsy_events"):
+        return local_index.query_latest("drowsy_events", device_id, limit, since=today_start)
+
     try:
         db = get_firestore()
-        today_start = datetime.now(timezone.utc).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
 
         query = (
             db.collection("drowsy_events")
@@ -102,6 +111,9 @@ def get_today_drowsiness_events(device_id, limit=50):
         )
 
         return [doc.to_dict() for doc in query.stream()]
+    except google_exceptions.FailedPrecondition as e:
+        print(f"Warning: Firestore index not found for today's events: {e}")
+        return local_index.query_latest("drowsy_events", device_id, limit, since=today_start) or []
     except Exception as e:
         print(f"ERROR getting today's events: {e}")
         return []
@@ -109,10 +121,14 @@ def get_today_drowsiness_events(device_id, limit=50):
 
 def get_current_session_data(device_id):
     """
-    Get the current active session from RTDB history.
-    A session is considered active if its 'active' flag is True.
+    Get the current active session: the sessionizer's open session if
+    there is one, otherwise the latest session flagged 'active' in RTDB history.
     """
     try:
+        current = _get_sessionizer_session(device_id)
+        if current:
+            return current
+
         sessions = get_rtdb_sessions(device_id)
         active_sessions = [s for s in sessions if s.get("active")]
         if not active_sessions:
@@ -130,9 +146,29 @@ def get_current_session_data(device_id):
             "id": latest.get("id"),
             "start_time": latest.get("start_time"),
             "duration_hours": duration_hours,
-            # We no longer track per-session drowsy counts; default to 0 for UI compatibility
-            "total_drowsy_events": 0,
+            "total_drowsy_events": latest.get("total_drowsy_events", 0),
         }
     except Exception as e:
         print(f"ERROR getting current session data from RTDB: {e}")
         return None
+
+
+def _get_sessionizer_session(device_id):
+    """
+    The open session summary via /current_session (two small reads)
+    """
+    device_ref = get_device_ref(device_id)
+    key = safe_get(device_ref.child("current_session"), None)
+    if not key:
+        return None
+
+    session = normalize_summary(key, safe_get(device_ref.child("sessions").child(key), None))
+    if not session or not session["active"]:
+        return None
+
+    return {
+        "id": session["id"],
+        "start_time": session["start_time"],
+        "duration_hours": round(session["duration_seconds"] / 3600.0, 2),
+        "total_drowsy_events": session["total_drowsy_events"],
+    }
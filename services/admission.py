@@ -0,0 +1,226 @@
+# backend/services/admission.py
+
+import os
+import math
+import time
+import threading
+from collections import deque
+
+from services.alerts import evaluate_alerts
+
+# ===============================
+# Admission Settings
+# ===============================
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", 5))              # frames/sec per device
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", 10))
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 8))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 0.5))
+
+# Critical frames wait this long for a slot, then run over the limit anyway
+CRITICAL_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_CRITICAL_TIMEOUT", 2.0))
+
+CRITICAL = "critical"
+ROUTINE = "routine"
+
+ADMITTED = "ADMITTED"
+COALESCED = "COALESCED"
+SHED = "SHED"
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+class Decision:
+    def __init__(self, status, priority, retry_after=None, reason=None):
+        self.status = status
+        self.priority = priority
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    def __init__(self, device_id, priority):
+        self.device_id = device_id
+        self.priority = priority
+        self.coalesced = False
+
+
+# ===============================
+# Admission Controller
+# ===============================
+class AdmissionController:
+    """
+    Per-device token buckets, a global concurrency limit and two
+    priority classes for /api/telemetry.
+
+    Critical frames (isDrowsy or any alert rule firing) skip the token
+    bucket, jump ahead of routine frames for a processing slot and are
+    never shed. Routine frames need a token and a slot; a newer routine
+    frame from the same device replaces one that is still queued
+    (coalescing), and anything left waiting too long is shed with 429.
+    """
+
+    def __init__(self, rate=ADMISSION_RATE, burst=ADMISSION_BURST,
+                 max_concurrent=ADMISSION_MAX_CONCURRENT, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._buckets = {}
+        self._in_flight = 0
+        self._queues = {CRITICAL: deque(), ROUTINE: deque()}
+        self._queued_routine = {}
+
+        self._delays = deque(maxlen=1000)
+        self.stats = {
+            "admitted": {CRITICAL: 0, ROUTINE: 0},
+            "shed": {"rate_limited": 0, "queue_timeout": 0},
+            "coalesced": 0,
+            "over_limit": 0,
+        }
+
+    # ---------- Classification ----------
+    def classify(self, device_id, frame, alerts=None):
+        """
+        alerts: the frame's evaluate_alerts() result when the caller
+        already has it, so the rules are not run twice
+        """
+        if alerts is None:
+            alerts = evaluate_alerts(device_id, frame)
+        if frame.get("isDrowsy") or alerts:
+            return CRITICAL
+        return ROUTINE
+
+    # ---------- Token Buckets ----------
+    def _take_token(self, device_id, now):
+        """
+        Returns 0 if a token was taken, else seconds until one is available.
+        Caller holds the lock.
+        """
+        tokens, updated = self._buckets.get(device_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            self._buckets[device_id] = (tokens - 1, now)
+            return 0
+        self._buckets[device_id] = (tokens, now)
+        return (1 - tokens) / self.rate
+
+    # ---------- Slots ----------
+    def _head(self):
+        for priority in (CRITICAL, ROUTINE):
+            if self._queues[priority]:
+                return self._queues[priority][0]
+        return None
+
+    def _dequeue(self, waiter):
+        self._queues[waiter.priority].remove(waiter)
+        if self._queued_routine.get(waiter.device_id) is waiter:
+            del self._queued_routine[waiter.device_id]
+
+    def admit(self, device_id, frame, alerts=None):
+        """
+        Decide whether a frame may be processed now.
+        An ADMITTED decision must be followed by release().
+        """
+        priority = self.classify(device_id, frame, alerts)
+        started = time.monotonic()
+
+        with self._lock:
+            if priority == ROUTINE:
+                wait = self._take_token(device_id, started)
+                if wait:
+                    self.stats["shed"]["rate_limited"] += 1
+                    return Decision(SHED, priority, math.ceil(wait), "rate_limited")
+
+            if self._in_flight < self.max_concurrent and self._head() is None:
+                return self._grant(priority, started)
+
+            waiter = _Waiter(device_id, priority)
+            if priority == ROUTINE:
+                previous = self._queued_routine.get(device_id)
+                if previous:
+                    previous.coalesced = True
+                    self._dequeue(previous)
+                self._queued_routine[device_id] = waiter
+            self._queues[priority].append(waiter)
+            self._cond.notify_all()
+
+            timeout = CRITICAL_QUEUE_TIMEOUT if priority == CRITICAL else self.queue_timeout
+            deadline = started + timeout
+
+            while True:
+                if waiter.coalesced:
+                    self.stats["coalesced"] += 1
+                    return Decision(COALESCED, priority, reason="superseded")
+
+                if self._in_flight < self.max_concurrent and self._head() is waiter:
+                    self._dequeue(waiter)
+                    self._cond.notify_all()
+                    return self._grant(priority, started)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(waiter)
+                    self._cond.notify_all()
+                    if priority == CRITICAL:
+                        self.stats["over_limit"] += 1
+                        return self._grant(priority, started)
+                    self.stats["shed"]["queue_timeout"] += 1
+                    return Decision(SHED, priority, 1, "queue_timeout")
+
+                self._cond.wait(remaining)
+
+    def _grant(self, priority, started):
+        self._in_flight += 1
+        self.stats["admitted"][priority] += 1
+        self._delays.append(time.monotonic() - started)
+        return Decision(ADMITTED, priority)
+
+    def release(self, decision):
+        if decision.status != ADMITTED:
+            return
+        with self._lock:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    # ---------- Metrics ----------
+    def status(self):
+        with self._lock:
+            delays = sorted(self._delays)
+            in_flight = self._in_flight
+            queued = {p: len(q) for p, q in self._queues.items()}
+            stats = {
+                "admitted": dict(self.stats["admitted"]),
+                "shed": dict(self.stats["shed"]),
+                "coalesced": self.stats["coalesced"],
+                "over_limit": self.stats["over_limit"],
+            }
+
+        def pct(p):
+            if not delays:
+                return 0.0
+            return round(delays[min(int(len(delays) * p), len(delays) - 1)] * 1000, 2)
+
+        return {
+            **stats,
+            "in_flight": in_flight,
+            "queued": queued,
+            "queue_delay_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+            "limits": {
+                "rate": self.rate,
+                "burst": self.burst,
+                "max_concurrent": self.max_concurrent,
+            },
+        }
+
+
+def get_admission_controller():
+    global _controller
+
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController()
+    return _controller
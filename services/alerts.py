@@ -1,7 +1,10 @@
 # backend/services/alerts.py
 
-from datetime import datetime
+from datetime import datetime, timezone
+from firebase_admin import firestore
 from services.firebase import get_firestore
+from services import local_index
+from services import notifications
 from google.api_core import exceptions as google_exceptions
 
 # ===============================
@@ -11,22 +14,61 @@ TEMP_THRESHOLD = 38.5
 PITCH_THRESHOLD = -20
 GYRO_Y_THRESHOLD = -120
 
+# Firestore caps a WriteBatch at 500 writes; leave room for counter updates
+ACK_CHUNK_SIZE = 400
+
 
 # ===============================
 # Alert Generator
 # ===============================
-def generate_alerts(device_id, live_data):
+def generate_alerts(device_id, live_data, timestamp=None, idempotency_key=None, alerts=None):
     """
     Evaluate live sensor data and generate alerts
+
+    When an idempotency key is given (spool replay), alert documents get
+    deterministic IDs so forwarding the same frame twice stores them once.
+    Pass alerts when the frame was already evaluated to only store them.
+    """
+    if alerts is None:
+        alerts = evaluate_alerts(device_id, live_data, timestamp)
+
+    # Save all alerts
+    if alerts:
+        alert_ids = None
+        if idempotency_key:
+            alert_ids = [f"{idempotency_key}-{a['type']}" for a in alerts]
+        save_alerts(alerts, alert_ids)
+
+    return alerts
+
+
+def get_thresholds(overrides=None):
+    """
+    Current alert thresholds, optionally with some replaced
+    (used by the replay CLI to try out new values)
+    """
+    thresholds = {
+        "temp": TEMP_THRESHOLD,
+        "pitch": PITCH_THRESHOLD,
+        "gyro_y": GYRO_Y_THRESHOLD,
+    }
+    thresholds.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    return thresholds
+
+
+def evaluate_alerts(device_id, live_data, timestamp=None, thresholds=None):
+    """
+    Apply the alert rules to one frame without storing anything
     """
     alerts = []
+    thresholds = thresholds or get_thresholds()
 
     pitch = live_data.get("pitch", 0)
     gyroY = live_data.get("gyroY", 0)
     temp = live_data.get("bodyTemp", 0)
     is_drowsy = live_data.get("isDrowsy", False)
 
-    timestamp = datetime.utcnow()
+    timestamp = timestamp or datetime.utcnow()
 
     # ---- Drowsiness Alert ----
     if is_drowsy:
@@ -38,7 +80,7 @@ def generate_alerts(device_id, live_data):
         ))
 
     # ---- Head Down Alert ----
-    if pitch < PITCH_THRESHOLD:
+    if pitch < thresholds["pitch"]:
         alerts.append(create_alert(
             device_id,
             "HEAD_DOWN",
@@ -47,7 +89,7 @@ def generate_alerts(device_id, live_data):
         ))
 
     # ---- Sudden Nod Alert ----
-    if gyroY < GYRO_Y_THRESHOLD:
+    if gyroY < thresholds["gyro_y"]:
         alerts.append(create_alert(
             device_id,
             "SUDDEN_NOD",
@@ -56,7 +98,7 @@ def generate_alerts(device_id, live_data):
         ))
 
     # ---- High Temperature Alert ----
-    if temp > TEMP_THRESHOLD:
+    if temp > thresholds["temp"]:
         alerts.append(create_alert(
             device_id,
             "HIGH_BODY_TEMPERATURE",
@@ -64,10 +106,6 @@ def generate_alerts(device_id, live_data):
             timestamp
         ))
 
-    # Save all alerts
-    for alert in alerts:
-        save_alert(alert)
-
     return alerts
 
 
@@ -84,6 +122,52 @@ def create_alert(device_id, alert_type, message, timestamp):
     }
 
 
+# ===============================
+# Unacknowledged Counters
+# ===============================
+def get_counter_ref(device_id):
+    """
+    alert_counters/{device_id}
+    """
+    return get_firestore().collection("alert_counters").document(device_id)
+
+
+def counter_value(snap):
+    """
+    Unacknowledged count from a counter snapshot, or None if the counter
+    was never seeded from the alerts collection
+    """
+    data = snap.to_dict() if snap.exists else None
+    if not data or not data.get("seeded"):
+        return None
+    return max(int(data.get("unacknowledged", 0)), 0)
+
+
+def get_unacknowledged_count(device_id):
+    """
+    Number of unacknowledged alerts for a device (single document read).
+
+    Counters only track alerts written since they were introduced, so an
+    unseeded counter is first rebuilt with recount_unacknowledged().
+    """
+    try:
+        count = counter_value(get_counter_ref(device_id).get())
+        if count is None:
+            return recount_unacknowledged(device_id)
+        return count
+    except Exception as e:
+        print(f"Error reading alert counter: {e}")
+        return 0
+
+
+def increment_counter(batch, device_id, amount):
+    batch.set(
+        get_counter_ref(device_id),
+        {"device_id": device_id, "unacknowledged": firestore.Increment(amount)},
+        merge=True,
+    )
+
+
 # ===============================
 # Firestore Logging
 # ===============================
@@ -91,8 +175,65 @@ def save_alert(alert):
     """
     Store alert in Firestore
     """
+    save_alerts([alert])
+
+
+def save_alerts(alerts, alert_ids=None):
+    """
+    Store alerts and bump the per-device unacknowledged counters
+    in a single batch commit.
+
+    With explicit alert_ids the documents are created with a "must not
+    exist" precondition, which keeps the counters from being incremented
+    twice. If any of them was already stored the batch is rejected and
+    the alerts are retried one per commit, so the others still land.
+    Returns the number of alerts stored.
+    """
+    try:
+        refs = _commit_alerts(alerts, alert_ids)
+    except google_exceptions.Conflict:
+        if not alert_ids:
+            raise
+        refs, stored = [], []
+        for alert, alert_id in zip(alerts, alert_ids):
+            try:
+                refs += _commit_alerts([alert], [alert_id])
+                stored.append(alert)
+            except google_exceptions.Conflict:
+                print(f"Alert {alert_id} already stored, skipping duplicate")
+        alerts = stored
+
+    for ref, alert in zip(refs, alerts):
+        local_index.record_write("alerts", ref.id, alert)
+
+    # Outbound delivery happens on the dispatcher's threads
+    if refs:
+        notifications.notify(alerts, [ref.id for ref in refs])
+    return len(refs)
+
+
+def _commit_alerts(alerts, alert_ids=None):
     db = get_firestore()
-    db.collection("alerts").add(alert)
+    batch = db.batch()
+    pending = {}
+
+    refs = []
+    for i, alert in enumerate(alerts):
+        if alert_ids:
+            ref = db.collection("alerts").document(alert_ids[i])
+            batch.create(ref, local_index.with_write_time(alert))
+        else:
+            ref = db.collection("alerts").document()
+            batch.set(ref, local_index.with_write_time(alert))
+        refs.append(ref)
+        if not alert.get("acknowledged"):
+            pending[alert["device_id"]] = pending.get(alert["device_id"], 0) + 1
+
+    for device_id, amount in pending.items():
+        increment_counter(batch, device_id, amount)
+
+    batch.commit()
+    return refs
 
 
 # ===============================
@@ -103,6 +244,9 @@ def get_recent_alerts(device_id, limit=10):
     Fetch recent alerts for dashboard
     Handles missing Firestore indexes gracefully
     """
+    if local_index.prefer_local("alerts"):
+        return local_index.query_latest("alerts", device_id, limit)
+
     try:
         db = get_firestore()
         from google.cloud.firestore_v1.base_query import FieldFilter
@@ -114,22 +258,174 @@ def get_recent_alerts(device_id, limit=10):
 
         return [doc.to_dict() for doc in docs]
     except google_exceptions.FailedPrecondition as e:
-        # Index not created yet - return empty list
+        # Index not created yet - serve from the local index if it is built
         print(f"Warning: Firestore index not found. Please create the index: {e}")
-        return []
+        return local_index.query_latest("alerts", device_id, limit) or []
     except Exception as e:
         print(f"Error fetching alerts: {e}")
         return []
 
 
 # ===============================
-# Acknowledge Alert
+# Acknowledge Alerts
 # ===============================
 def acknowledge_alert(alert_id):
     """
     Mark alert as acknowledged
     """
+    return acknowledge_alerts([alert_id])
+
+
+def _acknowledge_snapshots(snapshots):
+    """
+    Acknowledge one chunk of alert snapshots in a single WriteBatch.
+
+    Each update is guarded by the snapshot's update_time, so if another
+    request acknowledged one of these alerts in the meantime the whole
+    batch is rejected instead of decrementing the counter twice.
+    Returns the number of alerts acknowledged.
+    """
+    db = get_firestore()
+    batch = db.batch()
+    pending = {}
+
+    updates = {"acknowledged": True, "acknowledged_at": datetime.utcnow()}
+    updated = []
+
+    for snap in snapshots:
+        alert = snap.to_dict() or {}
+        if not snap.exists or alert.get("acknowledged"):
+            continue
+        batch.update(
+            snap.reference,
+            local_index.with_write_time(updates),
+            option=db.write_option(last_update_time=snap.update_time),
+        )
+        updated.append(snap.id)
+        device_id = alert.get("device_id")
+        pending[device_id] = pending.get(device_id, 0) + 1
+
+    if not pending:
+        return 0
+
+    for device_id, amount in pending.items():
+        if device_id:
+            increment_counter(batch, device_id, -amount)
+
+    batch.commit()
+    for alert_id in updated:
+        local_index.record_update("alerts", alert_id, updates)
+    return sum(pending.values())
+
+
+def _acknowledge_chunk(refs, retries=3):
+    """
+    Read and acknowledge a chunk of alert references, re-reading on conflicts
+    """
+    db = get_firestore()
+    for attempt in range(retries):
+        try:
+            return _acknowledge_snapshots(list(db.get_all(refs)))
+        except google_exceptions.FailedPrecondition:
+            if attempt == retries - 1:
+                raise
+    return 0
+
+
+def acknowledge_alerts(alert_ids):
+    """
+    Acknowledge alerts by ID in chunked batch commits.
+    Returns the number of alerts that were newly acknowledged.
+    """
+    db = get_firestore()
+    refs = [db.collection("alerts").document(alert_id) for alert_id in alert_ids if alert_id]
+    acknowledged = 0
+
+    for i in range(0, len(refs), ACK_CHUNK_SIZE):
+        acknowledged += _acknowledge_chunk(refs[i:i + ACK_CHUNK_SIZE])
+
+    return acknowledged
+
+
+def acknowledge_device_alerts(device_id, start=None, end=None):
+    """
+    Acknowledge every unacknowledged alert for a device,
+    optionally limited to start <= timestamp < end.
+
+    Only equality filters are used, so Firestore can serve the query from
+    single-field indexes; the time range is applied per page in Python.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    start = _naive_utc(start) if start else None
+    end = _naive_utc(end) if end else None
+
+    db = get_firestore()
+    query = (
+        db.collection("alerts")
+        .where(filter=FieldFilter("device_id", "==", device_id))
+        .where(filter=FieldFilter("acknowledged", "==", False))
+        .order_by("__name__")
+        .limit(ACK_CHUNK_SIZE)
+    )
+
+    acknowledged = 0
+    last = None
+
+    while True:
+        page = query.start_after(last) if last else query
+        snapshots = list(page.stream())
+        if not snapshots:
+            break
+        last = snapshots[-1]
+
+        refs = []
+        for snap in snapshots:
+            ts = (snap.to_dict() or {}).get("timestamp")
+            if start and (not ts or _naive_utc(ts) < start):
+                continue
+            if end and (not ts or _naive_utc(ts) >= end):
+                continue
+            refs.append(snap.reference)
+
+        if refs:
+            acknowledged += _acknowledge_chunk(refs)
+
+        if len(snapshots) < ACK_CHUNK_SIZE:
+            break
+
+    return acknowledged
+
+
+def _naive_utc(value):
+    """
+    Firestore returns aware datetimes; alert bounds are naive UTC like utcnow()
+    """
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def recount_unacknowledged(device_id):
+    """
+    Rebuild a device counter from the alerts collection and mark it
+    seeded. Also the repair tool for a counter that drifted.
+
+    An alert stored between the count and the write is not included;
+    running it again fixes that.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
     db = get_firestore()
-    db.collection("alerts").document(alert_id).update({
-        "acknowledged": True
-    })
+    result = (
+        db.collection("alerts")
+        .where(filter=FieldFilter("device_id", "==", device_id))
+        .where(filter=FieldFilter("acknowledged", "==", False))
+        .count()
+        .get()
+    )
+    count = int(result[0][0].value)
+    get_counter_ref(device_id).set(
+        {"device_id": device_id, "unacknowledged": count, "seeded": True}, merge=True
+    )
+    return count
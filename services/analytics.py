@@ -2,9 +2,10 @@
 
 from datetime import datetime, timezone
 from services.firebase import get_firestore
+from services import local_index
 
 
-def log_drowsiness_event(device_id, live_data):
+def log_drowsiness_event(device_id, live_data, timestamp=None, event_id=None):
     """
     Logs a specific drowsiness event with its context.
 
@@ -14,14 +15,32 @@ def log_drowsiness_event(device_id, live_data):
         under /devices/{device_id}/history.
     """
     try:
-        db = get_firestore()
-        event_ref = db.collection("drowsy_events").document()
-        event_data = {
-            "device_id": device_id,
-            "timestamp": datetime.now(timezone.utc),
-            "pitch": live_data.get("pitch"),
-            "temperature": live_data.get("bodyTemp"),
-        }
-        event_ref.set(event_data)
+        save_drowsiness_event(device_id, live_data, timestamp, event_id)
     except Exception as e:
         print(f"ERROR logging drowsiness event: {e}")
+
+
+def save_drowsiness_event(device_id, live_data, timestamp=None, event_id=None):
+    """
+    Store a drowsiness event, raising on failure.
+    A fixed event_id makes the write idempotent for spool replays.
+    """
+    db = get_firestore()
+    collection = db.collection("drowsy_events")
+    event_ref = collection.document(event_id) if event_id else collection.document()
+    event_data = build_drowsiness_event(device_id, live_data, timestamp)
+    event_ref.set(local_index.with_write_time(event_data))
+    local_index.record_write("drowsy_events", event_ref.id, event_data)
+    return event_data
+
+
+def build_drowsiness_event(device_id, live_data, timestamp=None):
+    """
+    The drowsy_events document for one frame
+    """
+    return {
+        "device_id": device_id,
+        "timestamp": timestamp or datetime.now(timezone.utc),
+        "pitch": live_data.get("pitch"),
+        "temperature": live_data.get("bodyTemp"),
+    }
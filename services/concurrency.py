@@ -0,0 +1,83 @@
+# backend/services/concurrency.py
+
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from services.profiler import follow_thread
+
+# ===============================
+# Shared Pool
+# ===============================
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", 16))
+FANOUT_TIMEOUT = float(os.getenv("FANOUT_TIMEOUT", 5.0))
+
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+
+def get_executor():
+    return _executor
+
+
+def task(func, *args, default=None, timeout=None, **kwargs):
+    """
+    Describe one backend read for fan_out().
+    `default` is returned if the call fails or exceeds its timeout.
+    """
+    return {
+        "func": func,
+        "args": args,
+        "kwargs": kwargs,
+        "default": default,
+        "timeout": FANOUT_TIMEOUT if timeout is None else timeout,
+    }
+
+
+def _timed(func, args, kwargs):
+    started = time.perf_counter()
+    with follow_thread():
+        result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+# ===============================
+# Fan-out
+# ===============================
+def fan_out(tasks, executor=None):
+    """
+    Run independent reads concurrently and return {name: result}.
+
+    tasks: {name: task(...)}
+    executor: pool to use instead of the shared one (e.g. for wide fan-outs
+    that should not crowd out page requests)
+
+    Every call gets its own deadline measured from submission. A call that
+    raises or misses its deadline yields its default so the page can still
+    render with partial data. Threads cannot be cancelled, so a timed-out
+    call keeps running in the pool until the backend returns.
+    """
+    pool = executor or _executor
+    submitted = time.monotonic()
+    futures = {
+        name: (spec, pool.submit(
+            contextvars.copy_context().run, _timed, spec["func"], spec["args"], spec["kwargs"]
+        ))
+        for name, spec in tasks.items()
+    }
+
+    results = {}
+    for name, (spec, future) in futures.items():
+        remaining = max(spec["timeout"] - (time.monotonic() - submitted), 0.0)
+        try:
+            results[name], elapsed = future.result(timeout=remaining)
+            if elapsed > spec["timeout"] / 2:
+                print(f"Slow fan-out call '{name}': {elapsed:.2f}s")
+        except FutureTimeout:
+            print(f"Warning: '{name}' timed out after {spec['timeout']}s, using default")
+            results[name] = spec["default"]
+        except Exception as e:
+            print(f"Warning: '{name}' failed, using default: {e}")
+            results[name] = spec["default"]
+
+    return results
@@ -74,6 +74,15 @@ def get_device_ref(device_id):
     return get_rtdb().child("devices").child(device_id)
 
 
+def list_device_ids():
+    """
+    Device IDs under /devices, via a shallow read so no child data
+    (history in particular) is downloaded.
+    """
+    devices = get_rtdb().child("devices").get(shallow=True) or {}
+    return sorted(devices.keys()) if isinstance(devices, dict) else []
+
+
 def get_live_ref(device_id):
     """
     /devices/{device_id}/live
@@ -0,0 +1,145 @@
+# backend/services/fleet.py
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from services.firebase import get_firestore, get_live_ref, get_control_ref, list_device_ids, safe_get
+from services.alerts import get_counter_ref, counter_value, recount_unacknowledged
+from services.concurrency import fan_out, task
+from services.work_hours import is_inactive
+from services.inactivity import INACTIVITY_THRESHOLD_MINUTES
+
+# ===============================
+# Fleet Settings
+# ===============================
+FLEET_WORKERS = int(os.getenv("FLEET_WORKERS", 32))
+FLEET_CACHE_SECONDS = float(os.getenv("FLEET_CACHE_SECONDS", 5))
+FLEET_TIMEOUT = float(os.getenv("FLEET_TIMEOUT", 10))
+
+# Separate pool so a wide fleet refresh never crowds out page fan-outs
+_executor = ThreadPoolExecutor(max_workers=FLEET_WORKERS, thread_name_prefix="fleet")
+
+_cache = {"data": None, "expires": 0.0}
+_refresh_lock = threading.Lock()
+
+
+# ===============================
+# Per-Device Status
+# ===============================
+def _device_status(device_id, live, control, unacknowledged):
+    live = live if isinstance(live, dict) else {}
+    control = control if isinstance(control, dict) else {}
+
+    last_seen = None
+    if live.get("serverTime"):
+        last_seen = datetime.fromtimestamp(live["serverTime"], tz=timezone.utc)
+
+    return {
+        "device_id": device_id,
+        "pitch": live.get("pitch"),
+        "gyroY": live.get("gyroY"),
+        "bodyTemp": live.get("bodyTemp"),
+        "isDrowsy": bool(live.get("isDrowsy", False)),
+        "motor": control.get("motor", "UNKNOWN"),
+        "last_seen": last_seen.isoformat() if last_seen else None,
+        "inactive": is_inactive(last_seen, INACTIVITY_THRESHOLD_MINUTES),
+        "unacknowledged_alerts": unacknowledged,
+    }
+
+
+def _unacknowledged_counts(device_ids):
+    """
+    All alert counters in one batched Firestore read
+    """
+    counts = {device_id: 0 for device_id in device_ids}
+    if not device_ids:
+        return counts
+
+    db = get_firestore()
+    refs = [get_counter_ref(device_id) for device_id in device_ids]
+    unseeded = []
+    for snap in db.get_all(refs):
+        count = counter_value(snap)
+        if count is None:
+            unseeded.append(snap.id)
+        else:
+            counts[snap.id] = count
+
+    # Counters that predate the upgrade are seeded once from the alerts
+    for device_id in unseeded:
+        try:
+            counts[device_id] = recount_unacknowledged(device_id)
+        except Exception as e:
+            print(f"Error seeding alert counter for {device_id}: {e}")
+    return counts
+
+
+def _load_fleet():
+    device_ids = list_device_ids()
+
+    tasks = {"counters": task(_unacknowledged_counts, device_ids, default={}, timeout=FLEET_TIMEOUT)}
+    for device_id in device_ids:
+        # Only the small live/control nodes; history is never touched
+        tasks[("live", device_id)] = task(
+            safe_get, get_live_ref(device_id), {}, default={}, timeout=FLEET_TIMEOUT
+        )
+        tasks[("control", device_id)] = task(
+            safe_get, get_control_ref(device_id), {}, default={}, timeout=FLEET_TIMEOUT
+        )
+
+    results = fan_out(tasks, executor=_executor)
+    counters = results["counters"]
+
+    devices = [
+        _device_status(
+            device_id,
+            results[("live", device_id)],
+            results[("control", device_id)],
+            counters.get(device_id, 0),
+        )
+        for device_id in device_ids
+    ]
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "device_count": len(devices),
+        "drowsy_count": sum(1 for d in devices if d["isDrowsy"]),
+        "inactive_count": sum(1 for d in devices if d["inactive"]),
+        "devices": devices,
+    }
+
+
+# ===============================
+# Cached Overview
+# ===============================
+def get_fleet_overview():
+    """
+    Status of every helmet, cached for FLEET_CACHE_SECONDS.
+
+    Only one request refreshes an expired cache; concurrent callers
+    keep getting the previous snapshot instead of piling on RTDB.
+    Raises if the first load fails.
+    """
+    now = time.monotonic()
+    if _cache["data"] is not None and now < _cache["expires"]:
+        return _cache["data"]
+
+    if not _refresh_lock.acquire(blocking=_cache["data"] is None):
+        return _cache["data"]
+
+    try:
+        if _cache["data"] is None or time.monotonic() >= _cache["expires"]:
+            try:
+                _cache["data"] = _load_fleet()
+            except Exception as e:
+                # A stale snapshot beats an error; a cold cache has nothing to fall back on
+                if _cache["data"] is None:
+                    raise
+                print(f"ERROR refreshing fleet overview, serving the previous one: {e}")
+            _cache["expires"] = time.monotonic() + FLEET_CACHE_SECONDS
+        return _cache["data"]
+    finally:
+        _refresh_lock.release()
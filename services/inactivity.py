@@ -0,0 +1,285 @@
+# backend/services/inactivity.py
+
+import os
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from services.firebase import get_live_ref
+from services.alerts import create_alert, save_alerts, acknowledge_alerts
+from services.concurrency import fan_out, task
+
+# ===============================
+# Inactivity Settings
+# ===============================
+INACTIVITY_THRESHOLD_MINUTES = float(os.getenv("INACTIVITY_THRESHOLD_MINUTES", 10))
+
+# Alerts per WriteBatch when many helmets go quiet at once
+ALERT_CHUNK_SIZE = 200
+
+# Confirmation reads run on their own pool, a batch at a time, so a mass
+# expiry (e.g. after a Wi-Fi outage) never takes threads from page fan-outs
+INACTIVITY_CONFIRM_WORKERS = int(os.getenv("INACTIVITY_CONFIRM_WORKERS", 8))
+INACTIVITY_CONFIRM_BATCH = int(os.getenv("INACTIVITY_CONFIRM_BATCH", 64))
+
+_confirm_executor = ThreadPoolExecutor(max_workers=INACTIVITY_CONFIRM_WORKERS, thread_name_prefix="inactivity")
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def inactive_alert_id(device_id, last_seen):
+    """
+    Deterministic ID so a quiet period raises one INACTIVE alert,
+    even if several processes notice it.
+    """
+    return f"inactive-{device_id}-{int(last_seen)}"
+
+
+def _live_server_time(device_id):
+    """
+    Newest serverTime any worker has seen: the shared state table if it
+    has the device, otherwise the live node
+    """
+    from services.state_table import get_state_table
+
+    table = get_state_table()
+    state = table.get(device_id) if table else None
+    if state and state["serverTime"]:
+        return state["serverTime"]
+    return get_live_ref(device_id).child("serverTime").get()
+
+
+# ===============================
+# Inactivity Monitor
+# ===============================
+class InactivityMonitor:
+    """
+    Per-device deadlines on a hashed timer wheel with one-second slots.
+
+    touch() moves a device to the slot for last_seen + threshold, which
+    is O(1) (and a no-op while frames keep landing in the same second).
+    A background thread drains due slots once a second and raises
+    INACTIVE alerts; the next frame from the device clears the alert.
+    Cost per frame and per tick does not grow with the number of devices.
+    """
+
+    def __init__(self, threshold_minutes=INACTIVITY_THRESHOLD_MINUTES):
+        self.threshold = threshold_minutes * 60
+        self._lock = threading.Lock()
+        self._slots = defaultdict(set)   # due second -> device IDs
+        self._deadline = {}              # device ID -> due second
+        self._last_seen = {}             # device ID -> epoch seconds
+        self._inactive = {}              # device ID -> INACTIVE alert ID (None if silent)
+        self._cleared = []               # alert IDs to acknowledge
+        self._cursor = int(time.time())
+        self._thread = None
+        self.stats = {"expired": 0, "recovered": 0, "alerts_raised": 0}
+
+    # ---------- Updates ----------
+    def touch(self, device_id, last_seen=None, previous_seen=None):
+        """
+        Record a frame from a device (called on every telemetry frame).
+
+        previous_seen is the newest frame time any worker had before this
+        one (state table). After a gap longer than the threshold the
+        INACTIVE alert for it is acknowledged by its deterministic ID,
+        whichever worker raised it.
+        """
+        last_seen = float(last_seen or time.time())
+        due = int(last_seen + self.threshold) + 1
+
+        with self._lock:
+            quiet_since = max(self._last_seen.get(device_id, 0), float(previous_seen or 0))
+            if last_seen < self._last_seen.get(device_id, 0):
+                return
+            self._last_seen[device_id] = last_seen
+            # A late frame already past its deadline expires on the next tick
+            due = max(due, self._cursor + 1)
+
+            previous = self._deadline.get(device_id)
+            if previous != due:
+                if previous is not None:
+                    self._discard(previous, device_id)
+                self._slots[due].add(device_id)
+                self._deadline[device_id] = due
+
+            if device_id in self._inactive:
+                self.stats["recovered"] += 1
+            alert_id = self._inactive.pop(device_id, None)
+            if not alert_id and quiet_since and last_seen - quiet_since > self.threshold:
+                alert_id = inactive_alert_id(device_id, quiet_since)
+            if alert_id:
+                self._cleared.append(alert_id)
+
+    def seed(self, device_id, last_seen):
+        """
+        Start tracking a device seen before this process started. If it is
+        already past its deadline it is marked inactive without an alert,
+        so restarts do not re-alert on long-idle helmets.
+        """
+        if last_seen and last_seen + self.threshold > time.time():
+            self.touch(device_id, last_seen)
+            return
+        with self._lock:
+            if device_id not in self._last_seen:
+                self._last_seen[device_id] = float(last_seen or 0)
+                self._inactive[device_id] = None
+
+    def _discard(self, due, device_id):
+        slot = self._slots.get(due)
+        if slot is not None:
+            slot.discard(device_id)
+            if not slot:
+                del self._slots[due]
+
+    # ---------- Queries ----------
+    def is_inactive(self, device_id):
+        """
+        True/False for a tracked device, None if this process never saw it
+        """
+        with self._lock:
+            if device_id not in self._last_seen:
+                return None
+            return device_id in self._inactive
+
+    def last_seen(self, device_id):
+        with self._lock:
+            return self._last_seen.get(device_id)
+
+    def status(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "tracked": len(self._last_seen),
+                "inactive": len(self._inactive),
+                "threshold_seconds": self.threshold,
+            }
+
+    # ---------- Timer ----------
+    def _advance(self, now):
+        """
+        Pop every slot up to `now`; returns [(device_id, last_seen)] that expired
+        """
+        expired = []
+        with self._lock:
+            for second in range(self._cursor + 1, now + 1):
+                for device_id in self._slots.pop(second, ()):
+                    self._deadline.pop(device_id, None)
+                    last_seen = self._last_seen.get(device_id, 0)
+                    self._inactive[device_id] = inactive_alert_id(device_id, last_seen)
+                    expired.append((device_id, last_seen))
+            self._cursor = max(self._cursor, now)
+            cleared, self._cleared = self._cleared, []
+            self.stats["expired"] += len(expired)
+        return expired, cleared
+
+    def _rearm(self, device_id, last_seen):
+        """
+        Undo an expiry that turned out to be premature (no alert was raised)
+        """
+        with self._lock:
+            self._inactive.pop(device_id, None)
+            self.stats["expired"] -= 1
+        self.touch(device_id, last_seen)
+
+    def _confirm(self, expired):
+        """
+        Re-check expired devices (state table, then live node) before alerting.
+        Other processes may have received frames this one never saw; only
+        devices that are quiet there too are returned.
+        """
+        reads = {}
+        for i in range(0, len(expired), INACTIVITY_CONFIRM_BATCH):
+            reads.update(fan_out({
+                device_id: task(_live_server_time, device_id)
+                for device_id, _ in expired[i:i + INACTIVITY_CONFIRM_BATCH]
+            }, executor=_confirm_executor))
+
+        confirmed = []
+        for device_id, last_seen in expired:
+            server_time = reads.get(device_id)
+            if server_time and server_time + self.threshold > time.time():
+                self._rearm(device_id, server_time)
+            else:
+                # Shared last-seen time, so every worker derives the same alert ID
+                last_seen = max(server_time or 0, last_seen)
+                with self._lock:
+                    if device_id not in self._inactive:
+                        continue  # came back while we were checking
+                    self._inactive[device_id] = inactive_alert_id(device_id, last_seen)
+                confirmed.append((device_id, last_seen))
+        return confirmed
+
+    def _raise_alerts(self, expired):
+        for i in range(0, len(expired), ALERT_CHUNK_SIZE):
+            chunk = expired[i:i + ALERT_CHUNK_SIZE]
+            alerts, alert_ids = [], []
+            for device_id, last_seen in chunk:
+                minutes = round(self.threshold / 60)
+                alerts.append(create_alert(
+                    device_id,
+                    "INACTIVE",
+                    f"No telemetry received for {minutes} minutes",
+                    datetime.now(timezone.utc),
+                ))
+                alert_ids.append(inactive_alert_id(device_id, last_seen))
+            # Counts only alerts this worker created; IDs another one stored are skipped
+            self.stats["alerts_raised"] += save_alerts(alerts, alert_ids)
+
+    def _run(self):
+        while True:
+            time.sleep(1.0)
+            try:
+                expired, cleared = self._advance(int(time.time()))
+                if expired:
+                    self._raise_alerts(self._confirm(expired))
+                if cleared:
+                    acknowledge_alerts(cleared)
+            except Exception as e:
+                print(f"ERROR in inactivity monitor: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="inactivity", daemon=True)
+            self._thread.start()
+        return self
+
+
+# ===============================
+# Module Helpers
+# ===============================
+def _seed_from_rtdb(monitor):
+    """
+    Load last-seen times for known helmets (shallow device list + live nodes)
+    """
+    from services.fleet import get_fleet_overview
+
+    try:
+        for device in get_fleet_overview().get("devices", []):
+            last_seen = device.get("last_seen")
+            if last_seen:
+                monitor.seed(device["device_id"], datetime.fromisoformat(last_seen).timestamp())
+            else:
+                monitor.seed(device["device_id"], None)
+    except Exception as e:
+        print(f"Warning: could not seed inactivity monitor: {e}")
+
+
+def init_inactivity_monitor(seed=True):
+    global _monitor
+
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = InactivityMonitor().start()
+            if seed:
+                threading.Thread(
+                    target=_seed_from_rtdb, args=(_monitor,), name="inactivity-seed", daemon=True
+                ).start()
+    return _monitor
+
+
+def get_inactivity_monitor():
+    return _monitor
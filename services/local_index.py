@@ -0,0 +1,316 @@
+# backend/services/local_index.py
+
+import os
+import time
+import bisect
+import threading
+from datetime import datetime, timezone, timedelta
+
+from firebase_admin import firestore
+from google.api_core import exceptions as google_exceptions
+from services.firebase import get_firestore
+
+# ===============================
+# Local Index Settings
+# ===============================
+# "auto": build only for collections whose composite index is missing
+# "always": build for every indexed collection, "off": never
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX", "auto").lower()
+LOCAL_INDEX_PAGE_SIZE = int(os.getenv("LOCAL_INDEX_PAGE_SIZE", 1000))
+LOCAL_INDEX_MAX_PER_DEVICE = int(os.getenv("LOCAL_INDEX_MAX_PER_DEVICE", 5000))
+LOCAL_INDEX_REFRESH_SECONDS = float(os.getenv("LOCAL_INDEX_REFRESH_SECONDS", 30))
+# Full rescan, the only way deletes made by other processes reach the index
+LOCAL_INDEX_REBUILD_SECONDS = float(os.getenv("LOCAL_INDEX_REBUILD_SECONDS", 3600))
+# Catch-up re-reads this much before the previous pass (clock skew, slow commits)
+LOCAL_INDEX_OVERLAP_SECONDS = float(os.getenv("LOCAL_INDEX_OVERLAP_SECONDS", 60))
+
+# Server write time, set by every write to an indexed collection
+UPDATED_FIELD = "updated_at"
+
+# Collections queried by (device_id ==, order by timestamp desc)
+INDEXED_COLLECTIONS = ("alerts", "drowsy_events")
+
+_indexes = {}
+_missing = set()
+
+
+def _ts(value):
+    """
+    Sort key for a Firestore timestamp (naive values are UTC)
+    """
+    if not isinstance(value, datetime):
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def with_write_time(data):
+    """
+    data plus the server write time the catch-up query follows; use it
+    for every set/create/update on an indexed collection
+    """
+    return {**data, UPDATED_FIELD: firestore.SERVER_TIMESTAMP}
+
+
+def _catch_up_floor():
+    return datetime.now(timezone.utc) - timedelta(seconds=LOCAL_INDEX_OVERLAP_SECONDS)
+
+
+# ===============================
+# Ordered Index
+# ===============================
+class DeviceTimestampIndex:
+    """
+    In-memory (device_id, timestamp) index for one collection.
+
+    Per device, documents are kept in a list sorted by (timestamp, id), so
+    "latest N for a device" is a slice from the end. Only the newest
+    LOCAL_INDEX_MAX_PER_DEVICE documents per device are retained; that is
+    far more than any page asks for.
+
+    The index is filled by one paged scan ordered on the single-field
+    timestamp index (no composite index needed), then kept current by
+    the write paths in this process and by a periodic catch-up query on
+    the write time (updated_at), which also picks up older frames
+    replayed late and acknowledgements made by other processes. Deletes
+    made elsewhere are only seen by the periodic rebuild.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.ready = False
+        self._lock = threading.Lock()
+        self._keys = {}       # device_id -> sorted [(ts, doc_id)]
+        self._docs = {}       # doc_id -> (device_id, ts, data)
+        self._updated_since = None
+
+    # ---------- Writes ----------
+    def upsert(self, doc_id, data):
+        device_id = data.get("device_id")
+        if not device_id:
+            return
+        ts = _ts(data.get("timestamp"))
+
+        with self._lock:
+            self._remove_locked(doc_id)
+            keys = self._keys.setdefault(device_id, [])
+            bisect.insort(keys, (ts, doc_id))
+            self._docs[doc_id] = (device_id, ts, dict(data))
+
+            if len(keys) > LOCAL_INDEX_MAX_PER_DEVICE:
+                _, oldest = keys.pop(0)
+                self._docs.pop(oldest, None)
+
+    def update(self, doc_id, fields):
+        with self._lock:
+            entry = self._docs.get(doc_id)
+            if entry:
+                entry[2].update(fields)
+
+    def delete(self, doc_id):
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id):
+        entry = self._docs.pop(doc_id, None)
+        if not entry:
+            return
+        device_id, ts, _ = entry
+        keys = self._keys.get(device_id, [])
+        i = bisect.bisect_left(keys, (ts, doc_id))
+        if i < len(keys) and keys[i] == (ts, doc_id):
+            keys.pop(i)
+
+    # ---------- Reads ----------
+    def latest(self, device_id, limit, since=None):
+        """
+        Newest `limit` documents for a device (optionally timestamp >= since),
+        each a copy with its document id under "id".
+        """
+        since_ts = _ts(since) if since else None
+        results = []
+        with self._lock:
+            keys = self._keys.get(device_id, [])
+            for ts, doc_id in reversed(keys):
+                if since_ts is not None and ts < since_ts:
+                    break
+                results.append({**self._docs[doc_id][2], "id": doc_id})
+                if len(results) >= limit:
+                    break
+        return results
+
+    def size(self):
+        with self._lock:
+            return len(self._docs)
+
+    # ---------- Loading ----------
+    def build(self):
+        """
+        Paged scan of the whole collection ordered by timestamp, into
+        fresh maps that replace the current ones (dropping documents
+        deleted since the last build). Writes landing during the scan
+        are picked up by the next catch-up.
+        """
+        started = _catch_up_floor()
+        fresh = DeviceTimestampIndex(self.collection)
+        fresh._scan(get_firestore().collection(self.collection).order_by("timestamp"))
+
+        with self._lock:
+            self._keys, self._docs = fresh._keys, fresh._docs
+            self._updated_since = started
+        self.ready = True
+        print(f"Local index for '{self.collection}' ready ({self.size()} docs)")
+
+    def catch_up(self):
+        """
+        Pick up documents created or updated (by any process) since the
+        previous pass, whatever their timestamp. The window overlaps the
+        previous one; upserts are idempotent.
+        """
+        from google.cloud.firestore_v1.base_query import FieldFilter
+
+        started = _catch_up_floor()
+        query = get_firestore().collection(self.collection)
+        if self._updated_since is not None:
+            query = query.where(filter=FieldFilter(UPDATED_FIELD, ">=", self._updated_since))
+        self._scan(query.order_by(UPDATED_FIELD))
+        self._updated_since = started
+
+    def _scan(self, query):
+        last = None
+        while True:
+            page = query.start_after(last) if last else query
+            docs = list(page.limit(LOCAL_INDEX_PAGE_SIZE).stream())
+            for doc in docs:
+                self.upsert(doc.id, doc.to_dict() or {})
+            if len(docs) < LOCAL_INDEX_PAGE_SIZE:
+                break
+            last = docs[-1]
+
+
+# ===============================
+# Startup Check
+# ===============================
+def _composite_index_missing(collection):
+    """
+    Probe the (device_id ==, timestamp desc) query Firestore needs a
+    composite index for. FailedPrecondition means the index is missing.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    try:
+        list(
+            get_firestore().collection(collection)
+            .where(filter=FieldFilter("device_id", "==", "__index_probe__"))
+            .order_by("timestamp", direction="DESCENDING")
+            .limit(1)
+            .stream()
+        )
+        return False
+    except google_exceptions.FailedPrecondition as e:
+        print(f"Warning: composite index missing for '{collection}', using local index: {e}")
+        return True
+
+
+def check_composite_indexes():
+    """
+    Returns the set of collections whose composite index is missing
+    """
+    _missing.clear()
+    for collection in INDEXED_COLLECTIONS:
+        try:
+            if _composite_index_missing(collection):
+                _missing.add(collection)
+        except Exception as e:
+            print(f"Error probing index for '{collection}': {e}")
+    return set(_missing)
+
+
+def _refresh_loop():
+    next_rebuild = time.monotonic() + LOCAL_INDEX_REBUILD_SECONDS
+    while True:
+        time.sleep(LOCAL_INDEX_REFRESH_SECONDS)
+        rebuild = time.monotonic() >= next_rebuild
+        if rebuild:
+            next_rebuild = time.monotonic() + LOCAL_INDEX_REBUILD_SECONDS
+        for index in list(_indexes.values()):
+            try:
+                if rebuild:
+                    index.build()
+                else:
+                    index.catch_up()
+            except Exception as e:
+                print(f"Error refreshing local index '{index.collection}': {e}")
+
+
+def _initialize():
+    if LOCAL_INDEX_MODE == "always":
+        wanted = set(INDEXED_COLLECTIONS)
+    else:
+        wanted = check_composite_indexes()
+
+    for collection in wanted:
+        index = _indexes[collection] = DeviceTimestampIndex(collection)
+        try:
+            index.build()
+        except Exception as e:
+            print(f"Error building local index for '{collection}': {e}")
+            del _indexes[collection]
+
+    if _indexes:
+        threading.Thread(target=_refresh_loop, name="local-index-refresh", daemon=True).start()
+
+
+def init_local_index():
+    """
+    Check composite indexes and build fallbacks in the background
+    """
+    if LOCAL_INDEX_MODE == "off":
+        return
+    threading.Thread(target=_initialize, name="local-index", daemon=True).start()
+
+
+# ===============================
+# Write-Path Hooks / Queries
+# ===============================
+def is_missing(collection):
+    return collection in _missing
+
+
+def prefer_local(collection):
+    """
+    True when queries on this collection should be served locally
+    """
+    index = _indexes.get(collection)
+    ready = bool(index and index.ready)
+    return ready and (LOCAL_INDEX_MODE == "always" or collection in _missing)
+
+
+def record_write(collection, doc_id, data):
+    index = _indexes.get(collection)
+    if index:
+        index.upsert(doc_id, data)
+
+
+def record_update(collection, doc_id, fields):
+    index = _indexes.get(collection)
+    if index:
+        index.update(doc_id, fields)
+
+
+def record_delete(collection, doc_id):
+    index = _indexes.get(collection)
+    if index:
+        index.delete(doc_id)
+
+
+def query_latest(collection, device_id, limit, since=None):
+    """
+    Latest documents for a device from the local index,
+    or None if no ready index exists for the collection.
+    """
+    index = _indexes.get(collection)
+    if not index or not index.ready:
+        return None
+    return index.latest(device_id, limit, since)
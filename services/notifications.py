@@ -0,0 +1,510 @@
+# backend/services/notifications.py
+
+import os
+import json
+import time
+import fcntl
+import random
+import threading
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from queue import Queue, Empty, Full
+
+# ===============================
+# Notification Settings
+# ===============================
+# Comma-separated "<channel>:<target>", e.g. "webhook:https://hooks.example.com/alerts"
+NOTIFY_DESTINATIONS = os.getenv("NOTIFY_DESTINATIONS", "")
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 10000))
+NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", 4))
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", 5))
+
+# Per destination: alerts per request, how long to wait for a batch to
+# fill, and a token bucket on requests
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 20))
+NOTIFY_BATCH_LINGER = float(os.getenv("NOTIFY_BATCH_LINGER", 1.0))
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", 1.0))                  # requests/sec
+NOTIFY_BURST = float(os.getenv("NOTIFY_BURST", 5))
+NOTIFY_MAX_PENDING = int(os.getenv("NOTIFY_MAX_PENDING", 5000))
+
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 6))
+NOTIFY_BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", 1.0))
+NOTIFY_BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", 300))
+
+NOTIFY_DIR = os.getenv("NOTIFY_DIR", "notifications")
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+class DeliveryError(Exception):
+    """
+    A failed delivery. Non-retryable failures go straight to the dead-letter store.
+    """
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+# ===============================
+# Channels
+# ===============================
+class Channel:
+    """
+    Delivers a batch of alerts to one target. Subclasses implement send()
+    and raise DeliveryError (or any exception, treated as retryable).
+    """
+
+    name = None
+
+    def __init__(self, target):
+        self.target = target
+
+    def send(self, alerts):
+        raise NotImplementedError
+
+
+class WebhookChannel(Channel):
+    """
+    POST {"alerts": [...]} as JSON. SMS and push gateways are reached
+    through their webhook endpoints the same way.
+    """
+
+    name = "webhook"
+
+    def send(self, alerts):
+        body = json.dumps({"alerts": alerts}, default=str).encode()
+        request = urllib.request.Request(
+            self.target,
+            data=body,
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=NOTIFY_TIMEOUT):
+                pass
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After") if e.headers else None
+            raise DeliveryError(
+                f"HTTP {e.code}",
+                retryable=e.code >= 500 or e.code in (408, 429),
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        except (urllib.error.URLError, OSError) as e:
+            raise DeliveryError(str(e))
+
+
+CHANNELS = {WebhookChannel.name: WebhookChannel}
+
+
+def register_channel(channel_cls):
+    """
+    Make a Channel subclass available to NOTIFY_DESTINATIONS by its name
+    """
+    CHANNELS[channel_cls.name] = channel_cls
+    return channel_cls
+
+
+def parse_destinations(spec):
+    channels = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, target = item.partition(":")
+        channel_cls = CHANNELS.get(name)
+        if channel_cls is None or not target:
+            print(f"Warning: ignoring notification destination '{item}'")
+            continue
+        channels.append(channel_cls(target))
+    return channels
+
+
+# ===============================
+# Dead-Letter Store
+# ===============================
+class DeadLetterStore:
+    """
+    Undeliverable batches, one JSON line each, in NOTIFY_DIR/dead_letters.jsonl.
+    Appends are flock'd so every worker can share the file.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or NOTIFY_DIR
+        self.path = os.path.join(self.directory, "dead_letters.jsonl")
+
+    def add(self, destination, alerts, reason, attempts):
+        os.makedirs(self.directory, exist_ok=True)
+        line = json.dumps({
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+            "destination": destination,
+            "reason": reason,
+            "attempts": attempts,
+            "alerts": alerts,
+        }, default=str)
+        with open(self.path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(line + "\n")
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def recent(self, limit=50):
+        try:
+            with open(self.path) as f:
+                lines = deque(f, maxlen=limit)
+        except OSError:
+            return []
+        entries = []
+        for line in reversed(lines):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+        return entries
+
+
+# ===============================
+# Dispatcher
+# ===============================
+class _Destination:
+    def __init__(self, channel):
+        self.channel = channel
+        self.key = f"{channel.name}:{channel.target}"
+        self.pending = deque()           # (alert, enqueued_at)
+        self.tokens = NOTIFY_BURST
+        self.refilled = time.monotonic()
+        self.in_flight = False
+        self.retry = None                # (batch, attempt, due)
+        self.latencies = deque(maxlen=1000)
+        self.stats = {
+            "delivered": 0, "batches": 0, "failures": 0,
+            "retries": 0, "dead_lettered": 0, "last_error": None,
+        }
+
+    def take_token(self, now):
+        self.tokens = min(NOTIFY_BURST, self.tokens + (now - self.refilled) * NOTIFY_RATE)
+        self.refilled = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def token_wait(self, now):
+        """
+        Seconds until take_token() can succeed (0 if it can now)
+        """
+        tokens = min(NOTIFY_BURST, self.tokens + (now - self.refilled) * NOTIFY_RATE)
+        return max(1 - tokens, 0) / NOTIFY_RATE
+
+
+def _backoff(attempt, retry_after=None):
+    delay = min(NOTIFY_BACKOFF_BASE * (2 ** (attempt - 1)), NOTIFY_BACKOFF_MAX)
+    delay = random.uniform(delay / 2, delay)
+    return max(delay, retry_after or 0)
+
+
+def _payload(alert, alert_id):
+    payload = {**alert, "id": alert_id}
+    if isinstance(payload.get("timestamp"), datetime):
+        payload["timestamp"] = payload["timestamp"].isoformat()
+    return payload
+
+
+class NotificationDispatcher:
+    """
+    Fans stored alerts out to notification channels off the request path.
+
+    notify() only puts alerts on a bounded queue. A dispatcher thread
+    moves them into per-destination buffers and hands batches (up to
+    NOTIFY_BATCH_SIZE, or whatever arrived within NOTIFY_BATCH_LINGER) to
+    a worker pool, one request in flight per destination, under a token
+    bucket. Failed batches are retried with jittered exponential backoff
+    and end up in the dead-letter store after NOTIFY_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, channels, dead_letters=None):
+        self.destinations = [_Destination(c) for c in channels]
+        self.dead_letters = dead_letters or DeadLetterStore()
+        self._queue = Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self._pool = ThreadPoolExecutor(max_workers=NOTIFY_WORKERS, thread_name_prefix="notify")
+        self._lock = threading.Lock()
+        self._thread = None
+        self.stats = {"enqueued": 0, "dropped": 0}
+
+    # ---------- Producer side ----------
+    def notify(self, alerts, alert_ids):
+        """
+        Queue alerts for delivery; never blocks. Alerts that do not fit in
+        the queue are written to the dead-letter store instead.
+        """
+        now = time.monotonic()
+        dropped = []
+        for alert, alert_id in zip(alerts, alert_ids):
+            payload = _payload(alert, alert_id)
+            try:
+                self._queue.put_nowait((payload, now))
+                self.stats["enqueued"] += 1
+            except Full:
+                dropped.append(payload)
+
+        if dropped:
+            self.stats["dropped"] += len(dropped)
+            self.dead_letters.add("*", dropped, "queue_full", 0)
+
+    # ---------- Dispatcher thread ----------
+    def _next_wait(self, now):
+        """
+        Time until some destination can send: its retry or batch is due
+        and it has a token (new alerts and finished deliveries wake the
+        dispatcher earlier through the queue)
+        """
+        wait = NOTIFY_BATCH_LINGER
+        with self._lock:
+            for dest in self.destinations:
+                if dest.in_flight:
+                    continue
+                if dest.retry:
+                    due = dest.retry[2] - now
+                elif dest.pending:
+                    due = dest.pending[0][1] + NOTIFY_BATCH_LINGER - now
+                else:
+                    continue
+                wait = min(wait, max(due, dest.token_wait(now)))
+        return max(wait, 0.01)
+
+    def _collect(self, timeout):
+        try:
+            items = [self._queue.get(timeout=timeout)]
+        except Empty:
+            return
+        while len(items) < NOTIFY_QUEUE_SIZE:
+            try:
+                items.append(self._queue.get_nowait())
+            except Empty:
+                break
+
+        # None is only a wake-up from a finished delivery
+        items = [item for item in items if item is not None]
+
+        overflow = {}
+        with self._lock:
+            for dest in self.destinations:
+                for item in items:
+                    if len(dest.pending) >= NOTIFY_MAX_PENDING:
+                        overflow.setdefault(dest, []).append(item[0])
+                    else:
+                        dest.pending.append(item)
+                if dest in overflow:
+                    dest.stats["dead_lettered"] += len(overflow[dest])
+
+        for dest, alerts in overflow.items():
+            self.dead_letters.add(dest.key, alerts, "backlog_full", 0)
+
+    def _flush(self, now):
+        with self._lock:
+            for dest in self.destinations:
+                if dest.in_flight:
+                    continue
+
+                if dest.retry:
+                    batch, attempt, due = dest.retry
+                    if now < due or not dest.take_token(now):
+                        continue
+                    dest.retry = None
+                elif dest.pending:
+                    full = len(dest.pending) >= NOTIFY_BATCH_SIZE
+                    lingered = now - dest.pending[0][1] >= NOTIFY_BATCH_LINGER
+                    if not (full or lingered) or not dest.take_token(now):
+                        continue
+                    size = min(NOTIFY_BATCH_SIZE, len(dest.pending))
+                    batch = [dest.pending.popleft() for _ in range(size)]
+                    attempt = 1
+                else:
+                    continue
+
+                dest.in_flight = True
+                self._pool.submit(self._deliver, dest, batch, attempt)
+
+    def _run(self):
+        while True:
+            try:
+                self._collect(self._next_wait(time.monotonic()))
+                self._flush(time.monotonic())
+            except Exception as e:
+                print(f"ERROR in notification dispatcher: {e}")
+                time.sleep(1)
+
+    # ---------- Workers ----------
+    def _deliver(self, dest, batch, attempt):
+        alerts = [alert for alert, _ in batch]
+        error = None
+        try:
+            dest.channel.send(alerts)
+        except DeliveryError as e:
+            error = e
+        except Exception as e:
+            error = DeliveryError(str(e))
+
+        now = time.monotonic()
+        dead = None
+        with self._lock:
+            dest.in_flight = False
+            if error is None:
+                dest.stats["delivered"] += len(batch)
+                dest.stats["batches"] += 1
+                dest.latencies.extend(now - enqueued for _, enqueued in batch)
+            else:
+                dest.stats["failures"] += 1
+                dest.stats["last_error"] = str(error)
+                if error.retryable and attempt < NOTIFY_MAX_ATTEMPTS:
+                    dest.stats["retries"] += 1
+                    dest.retry = (batch, attempt + 1, now + _backoff(attempt, error.retry_after))
+                else:
+                    dest.stats["dead_lettered"] += len(batch)
+                    dead = str(error)
+
+        if dead is not None:
+            print(f"Notification to {dest.key} failed permanently after {attempt} attempt(s): {dead}")
+            try:
+                self.dead_letters.add(dest.key, alerts, dead, attempt)
+            except Exception as e:
+                print(f"ERROR writing notification dead letter: {e}")
+
+        # Let the dispatcher schedule the next batch without waiting out its timeout
+        try:
+            self._queue.put_nowait(None)
+        except Full:
+            pass
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="notify-dispatch", daemon=True)
+            self._thread.start()
+        return self
+
+    # ---------- Metrics ----------
+    def status(self):
+        destinations = {}
+        with self._lock:
+            for dest in self.destinations:
+                latencies = sorted(dest.latencies)
+
+                def pct(p):
+                    if not latencies:
+                        return 0.0
+                    return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2)
+
+                destinations[dest.key] = {
+                    **dest.stats,
+                    "pending": len(dest.pending),
+                    "retry_pending": len(dest.retry[0]) if dest.retry else 0,
+                    "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)},
+                }
+
+        return {
+            **self.stats,
+            "queued": self._queue.qsize(),
+            "destinations": destinations,
+        }
+
+
+# ===============================
+# Module Helpers
+# ===============================
+def init_notifications(spec=None):
+    """
+    Start the dispatcher if any destination is configured
+    """
+    global _dispatcher
+
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            channels = parse_destinations(NOTIFY_DESTINATIONS if spec is None else spec)
+            if not channels:
+                return None
+            _dispatcher = NotificationDispatcher(channels).start()
+    return _dispatcher
+
+
+def get_notification_dispatcher():
+    return _dispatcher
+
+
+def notify(alerts, alert_ids):
+    """
+    Hand freshly stored alerts to the dispatcher (no-op when disabled)
+    """
+    if _dispatcher is not None and alerts:
+        try:
+            _dispatcher.notify(alerts, alert_ids)
+        except Exception as e:
+            print(f"ERROR queueing notifications: {e}")
+
+
+# ===============================
+# Local HTTP Stand-in
+# ===============================
+def make_stand_in(port=9009, fail_rate=0.0, delay=0.0, status=503, fail_first=0):
+    """
+    Webhook sink for trying the dispatcher locally: logs each batch,
+    optionally sleeps and fails the first `fail_first` requests and a
+    fraction of the rest with `status`.
+
+    Returns (server, received); port 0 picks a free port.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    received = {"requests": 0, "alerts": 0, "failed": 0, "times": []}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            with lock:
+                fail = received["failed"] < fail_first or random.random() < fail_rate
+                if fail:
+                    received["failed"] += 1
+            if fail:
+                self.send_response(status)
+                self.end_headers()
+                return
+
+            alerts = json.loads(body or b"{}").get("alerts", [])
+            with lock:
+                received["requests"] += 1
+                received["alerts"] += len(alerts)
+                received["times"].append(time.monotonic())
+            print(f"batch of {len(alerts)} (total {received['alerts']} in {received['requests']} requests)")
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer(("127.0.0.1", port), Handler), received
+
+
+def serve_stand_in(port=9009, fail_rate=0.0, delay=0.0, status=503, fail_first=0):
+    server, _ = make_stand_in(port, fail_rate, delay, status, fail_first)
+    print(f"Notification stand-in listening on http://127.0.0.1:{server.server_port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local webhook stand-in for notification testing")
+    parser.add_argument("--port", type=int, default=9009)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--status", type=int, default=503, help="Status code for failed requests")
+    parser.add_argument("--fail-first", type=int, default=0, help="Fail this many requests before anything else")
+    args = parser.parse_args()
+    serve_stand_in(args.port, args.fail_rate, args.delay, args.status, args.fail_first)
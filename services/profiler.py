@@ -0,0 +1,342 @@
+# backend/services/profiler.py
+
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime, timezone
+
+# ===============================
+# Profiler Settings
+# ===============================
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 200))
+
+# Per-endpoint sampling, e.g. "dashboard.dashboard=0.01,dashboard.session_history=0.05"
+PROFILE_SAMPLE_RATES = os.getenv("PROFILE_SAMPLE_RATES", "")
+
+# Profile of the request being handled, visible to fan-out threads
+_current = contextvars.ContextVar("profile", default=None)
+_sampler = None
+
+
+def _parse_rates(spec):
+    rates = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        endpoint, rate = item.split("=", 1)
+        try:
+            rates[endpoint.strip()] = float(rate)
+        except ValueError:
+            print(f"Warning: ignoring invalid profile rate '{item}'")
+    return rates
+
+
+# ===============================
+# Sampler
+# ===============================
+class _Profile:
+    def __init__(self, thread_id, route):
+        self.thread_id = thread_id
+        self.route = route
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc)
+        self.stacks = Counter()
+        self.wall_ms = 0.0
+
+
+class Sampler:
+    """
+    One background thread that periodically captures the Python stack of
+    every request thread currently being profiled (sys._current_frames).
+    Nothing is hooked into the interpreter, so unprofiled requests pay
+    nothing and profiled ones pay only for the stack walks.
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def start(self, route):
+        profile = _Profile(threading.get_ident(), route)
+        self.attach(profile)
+        _current.set(profile)
+        return profile
+
+    def stop(self, profile):
+        """
+        Detach the request thread and any fan-out threads still sampling
+        into profile; after this the sampler never touches its stacks
+        """
+        with self._lock:
+            for thread_id in [t for t, p in self._active.items() if p is profile]:
+                del self._active[thread_id]
+            if not self._active:
+                self._wake.clear()
+        _current.set(None)
+        profile.wall_ms = (time.perf_counter() - profile.started) * 1000
+        return profile
+
+    def attach(self, profile, thread_id=None):
+        with self._lock:
+            self._active[thread_id or profile.thread_id] = profile
+            self._ensure_thread()
+        self._wake.set()
+
+    def detach(self, thread_id, profile):
+        with self._lock:
+            if self._active.get(thread_id) is profile:
+                del self._active[thread_id]
+            if not self._active:
+                self._wake.clear()
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._wake.wait()
+            with self._lock:
+                active = dict(self._active)
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, profile in active.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                samples.append((thread_id, profile, _stack_key(frame)))
+            del frames
+            # Count only for threads still attached: stop() may have run
+            # since the snapshot, and the profile is being saved
+            with self._lock:
+                for thread_id, profile, key in samples:
+                    if self._active.get(thread_id) is profile:
+                        profile.stacks[key] += 1
+            time.sleep(self.interval)
+
+
+def _stack_key(frame):
+    """
+    Root-to-leaf tuple of (function, file, line) for one sample
+    """
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+@contextmanager
+def follow_thread():
+    """
+    Sample the current (pool) thread as part of the submitting request's
+    profile, if that request is being profiled. Used by fan_out().
+    """
+    profile = _current.get()
+    if profile is None or _sampler is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    _sampler.attach(profile, thread_id)
+    try:
+        yield
+    finally:
+        _sampler.detach(thread_id, profile)
+
+
+# ===============================
+# Output Formats
+# ===============================
+def _short_file(path):
+    parts = path.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def to_collapsed(profile):
+    """
+    Brendan Gregg collapsed-stack format (flamegraph.pl / speedscope)
+    """
+    lines = []
+    for stack, count in profile.stacks.most_common():
+        names = ";".join(f"{name} ({_short_file(path)}:{line})" for name, path, line in stack)
+        lines.append(f"{names} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(profile, interval_ms):
+    frames, frame_index = [], {}
+    samples, weights = [], []
+
+    for stack, count in profile.stacks.items():
+        sample = []
+        for name, path, line in stack:
+            key = (name, path, line)
+            if key not in frame_index:
+                frame_index[key] = len(frames)
+                frames.append({"name": name, "file": path, "line": line})
+            sample.append(frame_index[key])
+        samples.append(sample)
+        weights.append(count * interval_ms)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": profile.route,
+        "exporter": "drowsy-profiler",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": profile.route,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": round(profile.wall_ms, 3),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+
+# ===============================
+# Storage / Index
+# ===============================
+# Profiles live on disk (not in memory) so every gunicorn worker lists
+# the same set; each profile has a small .meta.json used by the index.
+def save_profile(profile, interval_ms, directory=None):
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    stamp = profile.started_at.strftime("%Y%m%dT%H%M%S%f")
+    safe_route = profile.route.replace("/", "_").replace(".", "_") or "root"
+    name = f"{stamp}-{os.getpid()}-{safe_route}"
+
+    with open(os.path.join(directory, f"{name}.collapsed"), "w") as f:
+        f.write(to_collapsed(profile))
+    with open(os.path.join(directory, f"{name}.speedscope.json"), "w") as f:
+        json.dump(to_speedscope(profile, interval_ms), f)
+
+    entry = {
+        "name": name,
+        "route": profile.route,
+        "started_at": profile.started_at.isoformat(),
+        "wall_ms": round(profile.wall_ms, 2),
+        "samples": sum(profile.stacks.values()),
+        "files": [f"{name}.collapsed", f"{name}.speedscope.json"],
+    }
+    with open(os.path.join(directory, f"{name}.meta.json"), "w") as f:
+        json.dump(entry, f)
+
+    _prune(directory)
+    return entry
+
+
+def _meta_files(directory):
+    try:
+        return sorted(n for n in os.listdir(directory) if n.endswith(".meta.json"))
+    except OSError:
+        return []
+
+
+def _prune(directory):
+    metas = _meta_files(directory)
+    for meta in metas[:max(len(metas) - PROFILE_MAX_FILES, 0)]:
+        name = meta[:-len(".meta.json")]
+        for suffix in (".collapsed", ".speedscope.json", ".meta.json"):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except OSError:
+                pass
+
+
+def list_profiles(limit=50, directory=None):
+    """
+    Recent profiles, newest first
+    """
+    directory = directory or PROFILE_DIR
+    entries = []
+    for meta in reversed(_meta_files(directory)[-limit:]):
+        try:
+            with open(os.path.join(directory, meta)) as f:
+                entries.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return entries
+
+
+def profile_path(filename, directory=None):
+    """
+    Path of a stored profile file, or None for anything that is not one
+    """
+    directory = directory or PROFILE_DIR
+    if os.path.basename(filename) != filename:
+        return None
+    if not filename.endswith((".collapsed", ".speedscope.json")):
+        return None
+    path = os.path.join(directory, filename)
+    return path if os.path.exists(path) else None
+
+
+# ===============================
+# Flask Integration
+# ===============================
+# The index/download endpoints carry the token but are not worth profiling
+_UNPROFILED = {"api.list_request_profiles", "api.download_request_profile", "static"}
+
+
+def is_authorized(req):
+    token = req.headers.get("X-Profile-Token") or req.args.get("profile_token")
+    return bool(PROFILE_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def init_profiler(app):
+    """
+    Profile a request when it carries a valid profile token (header
+    X-Profile-Token or ?profile_token=) or when its endpoint is picked by
+    PROFILE_SAMPLE_RATES. Off unless one of those is configured.
+    """
+    from flask import g, request
+
+    global _sampler
+
+    rates = _parse_rates(PROFILE_SAMPLE_RATES)
+    if not PROFILE_TOKEN and not rates:
+        return None
+
+    sampler = _sampler = Sampler()
+
+    @app.before_request
+    def _start_profile():
+        if request.endpoint in _UNPROFILED:
+            return
+        rate = rates.get(request.endpoint or "", 0.0)
+        if is_authorized(request) or (rate and random.random() < rate):
+            g._profile = sampler.start(request.endpoint or request.path)
+
+    @app.teardown_request
+    def _finish_profile(exc):
+        profile = g.pop("_profile", None)
+        if profile is None:
+            return
+        sampler.stop(profile)
+        try:
+            save_profile(profile, PROFILE_INTERVAL_MS)
+        except Exception as e:
+            print(f"Error saving profile: {e}")
+
+    return sampler
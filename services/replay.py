@@ -0,0 +1,458 @@
+# backend/services/replay.py
+"""
+Replay archived telemetry through the alert rules.
+
+    python -m services.replay telemetry/*.ndjson --pitch-threshold -25
+    python -m services.replay spool/slot-0/segment-*.log --write --replace
+
+Inputs are NDJSON files (optionally .gz), one frame per line with a
+device_id and serverTime (or timestamp), or telemetry spool segments.
+Files are split into chunks that a process pool evaluates in parallel;
+results are merged per device.
+
+Without --write it is a dry run that prints, per device and alert type,
+how many alerts the current thresholds and the proposed ones flag, and
+how many frames were added or removed by the change. With --write the
+proposed alerts and drowsy events are stored with batched writes.
+"""
+
+import os
+import gzip
+import json
+import hashlib
+import time
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+from services.alerts import evaluate_alerts, get_thresholds, increment_counter
+from services.analytics import build_drowsiness_event
+from services import local_index
+from services.spool import _read_record
+from services.telemetry import normalize_frame
+from services.work_hours import _parse_rtdb_timestamp
+
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# Firestore WriteBatch limit
+BATCH_SIZE = 500
+
+
+# ===============================
+# Input
+# ===============================
+def _is_spool_segment(path):
+    return os.path.basename(path).startswith("segment-")
+
+
+def plan_chunks(paths, chunk_bytes=CHUNK_BYTES):
+    """
+    Split inputs into (path, start, end) work items.
+    Gzip files and spool segments are not seekable by line, so they are
+    always a single chunk.
+    """
+    chunks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if path.endswith(".gz") or _is_spool_segment(path):
+            chunks.append((path, 0, size))
+            continue
+        for start in range(0, max(size, 1), chunk_bytes):
+            chunks.append((path, start, min(start + chunk_bytes, size)))
+    return chunks
+
+
+def _source_id(path):
+    """
+    Short stable name for an input file, part of the stored document IDs
+    """
+    return hashlib.sha1(os.path.realpath(path).encode()).hexdigest()[:12]
+
+
+def _iter_ndjson(path, start, end):
+    """
+    (device_id, frame, byte offset) for lines whose first byte falls
+    inside [start, end)
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if start:
+            f.seek(start - 1)
+            # Skip the line that straddles the boundary (the previous chunk owns it)
+            f.readline()
+        position = f.tell()
+        while position < end or path.endswith(".gz"):
+            offset = position
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                frame = json.loads(line)
+            except ValueError:
+                yield None, None, offset
+                continue
+            if not isinstance(frame, dict):
+                yield None, None, offset
+                continue
+            yield frame.get("device_id") or frame.get("deviceId"), frame, offset
+
+
+def _iter_spool(path):
+    import mmap
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = 0
+        while True:
+            record = _read_record(mm, offset)
+            if record is None:
+                break
+            _, payload, next_offset = record
+            data = json.loads(payload)
+            yield data.get("device_id"), data.get("frame") or {}, offset
+            offset = next_offset
+        mm.close()
+
+
+def _frame_time(frame):
+    value = frame.get("serverTime", frame.get("timestamp"))
+    return _parse_rtdb_timestamp(value)
+
+
+# ===============================
+# Worker
+# ===============================
+def _new_device_result():
+    return {
+        "frames": 0,
+        "current": Counter(),
+        "proposed": Counter(),
+        "added": Counter(),
+        "removed": Counter(),
+        "first": None,
+        "last": None,
+    }
+
+
+def process_chunk(job):
+    """
+    Evaluate one chunk with both rule sets. Runs in a worker process.
+
+    Frames the live endpoint would reject (non-numeric readings) are
+    counted as rejected instead of aborting the run.
+    """
+    path, start, end, current, proposed, options = job
+    devices = options.get("devices")
+    since, until = options.get("since"), options.get("until")
+    collect = options.get("write")
+
+    results = defaultdict(_new_device_result)
+    alerts, events = [], []
+    skipped = rejected = 0
+    source = _source_id(path)
+
+    frames = _iter_spool(path) if _is_spool_segment(path) else _iter_ndjson(path, start, end)
+
+    for device_id, frame, offset in frames:
+        timestamp = _frame_time(frame) if frame else None
+        if not device_id or timestamp is None:
+            skipped += 1
+            continue
+        if devices and device_id not in devices:
+            continue
+        if (since and timestamp < since) or (until and timestamp >= until):
+            continue
+
+        try:
+            normalize_frame(frame)
+            old_types = {a["type"] for a in evaluate_alerts(device_id, frame, timestamp, current)}
+            new_alerts = evaluate_alerts(device_id, frame, timestamp, proposed)
+        except (TypeError, ValueError):
+            rejected += 1
+            continue
+        new_types = {a["type"] for a in new_alerts}
+
+        result = results[device_id]
+        result["frames"] += 1
+        ts = timestamp.timestamp()
+        result["first"] = ts if result["first"] is None else min(result["first"], ts)
+        result["last"] = ts if result["last"] is None else max(result["last"], ts)
+
+        # Plain loops: Counter.update() on sets is the hot spot at millions of frames
+        for alert_type in old_types:
+            result["current"][alert_type] += 1
+        for alert_type in new_types:
+            result["proposed"][alert_type] += 1
+        if old_types != new_types:
+            for alert_type in new_types - old_types:
+                result["added"][alert_type] += 1
+            for alert_type in old_types - new_types:
+                result["removed"][alert_type] += 1
+
+        if collect:
+            # Unique per input line/record, so frames in the same second stay apart
+            frame_key = f"{source}-{offset}"
+            alerts.extend((device_id, ts, frame_key, a["type"], a["message"]) for a in new_alerts)
+            if frame.get("isDrowsy"):
+                events.append((device_id, ts, frame_key, frame.get("pitch"), frame.get("bodyTemp")))
+
+    return dict(results), alerts, events, skipped, rejected
+
+
+def _merge(into, results):
+    for device_id, result in results.items():
+        target = into[device_id]
+        target["frames"] += result["frames"]
+        for key in ("current", "proposed", "added", "removed"):
+            target[key].update(result[key])
+        for key, pick in (("first", min), ("last", max)):
+            if result[key] is not None:
+                target[key] = result[key] if target[key] is None else pick(target[key], result[key])
+
+
+# ===============================
+# Writes
+# ===============================
+def _commit_in_batches(db, operations):
+    """
+    operations: iterable of callables taking a batch
+    """
+    batch, pending, commits = db.batch(), 0, 0
+    for operation in operations:
+        operation(batch)
+        pending += 1
+        if pending >= BATCH_SIZE:
+            batch.commit()
+            batch, pending, commits = db.batch(), 0, commits + 1
+    if pending:
+        batch.commit()
+        commits += 1
+    return commits
+
+
+def _delete_range(db, collection, device_id, first, last):
+    """
+    Delete a device's documents with first <= timestamp <= last, keeping
+    the unacknowledged counter in step for alerts.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    lower = datetime.fromtimestamp(first, tz=timezone.utc)
+    upper = datetime.fromtimestamp(last, tz=timezone.utc)
+    query = (
+        db.collection(collection)
+        .where(filter=FieldFilter("device_id", "==", device_id))
+        .order_by("__name__")
+        .limit(BATCH_SIZE)
+    )
+
+    doomed, unacknowledged, cursor = [], 0, None
+    while True:
+        page = list((query.start_after(cursor) if cursor else query).stream())
+        for snap in page:
+            data = snap.to_dict() or {}
+            ts = data.get("timestamp")
+            if isinstance(ts, datetime):
+                ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+                if lower <= ts <= upper:
+                    doomed.append(snap.reference)
+                    if collection == "alerts" and not data.get("acknowledged"):
+                        unacknowledged += 1
+        if len(page) < BATCH_SIZE:
+            break
+        cursor = page[-1]
+
+    operations = [lambda batch, ref=ref: batch.delete(ref) for ref in doomed]
+    if unacknowledged:
+        operations.append(lambda batch: increment_counter(batch, device_id, -unacknowledged))
+    _commit_in_batches(db, operations)
+    return len(doomed)
+
+
+def write_results(device_results, alerts, events, replace=False):
+    """
+    Store proposed alerts and drowsy events.
+
+    Document IDs are derived from device, input file, the frame's offset
+    in it and alert type, so re-running a replay of the same files
+    overwrites instead of duplicating. Backfilled
+    alerts are stored as acknowledged so they do not light up the
+    unacknowledged badge for history nobody needs to act on.
+    """
+    from services.firebase import get_firestore
+
+    db = get_firestore()
+    deleted = 0
+
+    if replace:
+        for device_id, result in device_results.items():
+            if result["first"] is None:
+                continue
+            for collection in ("alerts", "drowsy_events"):
+                deleted += _delete_range(db, collection, device_id, result["first"], result["last"])
+
+    def alert_op(item):
+        device_id, ts, frame_key, alert_type, message = item
+        doc_id = f"replay-{device_id}-{frame_key}-{alert_type}"
+        data = {
+            "device_id": device_id,
+            "type": alert_type,
+            "message": message,
+            "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc),
+            "acknowledged": True,
+            "backfilled": True,
+        }
+        return lambda batch: batch.set(db.collection("alerts").document(doc_id), local_index.with_write_time(data))
+
+    def event_op(item):
+        device_id, ts, frame_key, pitch, temp = item
+        doc_id = f"replay-{device_id}-{frame_key}"
+        data = build_drowsiness_event(
+            device_id,
+            {"pitch": pitch, "bodyTemp": temp},
+            datetime.fromtimestamp(ts, tz=timezone.utc),
+        )
+        data["backfilled"] = True
+        return lambda batch: batch.set(db.collection("drowsy_events").document(doc_id), local_index.with_write_time(data))
+
+    commits = _commit_in_batches(db, map(alert_op, alerts))
+    commits += _commit_in_batches(db, map(event_op, events))
+    return {"deleted": deleted, "alerts": len(alerts), "events": len(events), "commits": commits}
+
+
+# ===============================
+# Orchestration
+# ===============================
+def run_replay(paths, proposed_overrides=None, workers=None, write=False, replace=False,
+               devices=None, since=None, until=None, chunk_bytes=CHUNK_BYTES):
+    current = get_thresholds()
+    proposed = get_thresholds(proposed_overrides)
+    options = {"devices": devices, "since": since, "until": until, "write": write}
+
+    chunks = plan_chunks(paths, chunk_bytes)
+    jobs = [(path, start, end, current, proposed, options) for path, start, end in chunks]
+
+    device_results = defaultdict(_new_device_result)
+    alerts, events = [], []
+    skipped = rejected = 0
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results, chunk_alerts, chunk_events, chunk_skipped, chunk_rejected in pool.map(process_chunk, jobs):
+            _merge(device_results, results)
+            alerts.extend(chunk_alerts)
+            events.extend(chunk_events)
+            skipped += chunk_skipped
+            rejected += chunk_rejected
+    elapsed = time.perf_counter() - started
+
+    frames = sum(r["frames"] for r in device_results.values())
+    report = {
+        "thresholds": {"current": current, "proposed": proposed},
+        "devices": dict(device_results),
+        "frames": frames,
+        "skipped": skipped,
+        "rejected": rejected,
+        "chunks": len(chunks),
+        "elapsed_seconds": round(elapsed, 3),
+        "frames_per_second": round(frames / elapsed) if elapsed else frames,
+    }
+
+    if write:
+        write_started = time.perf_counter()
+        report["written"] = write_results(device_results, alerts, events, replace)
+        report["write_seconds"] = round(time.perf_counter() - write_started, 3)
+
+    return report
+
+
+def print_report(report):
+    thresholds = report["thresholds"]
+    print(f"Current thresholds:  {thresholds['current']}")
+    print(f"Proposed thresholds: {thresholds['proposed']}")
+    print()
+    print(f"{'device':<20} {'alert type':<24} {'current':>9} {'proposed':>9} {'added':>7} {'removed':>8}")
+
+    for device_id in sorted(report["devices"]):
+        result = report["devices"][device_id]
+        types = sorted(set(result["current"]) | set(result["proposed"]))
+        for alert_type in types or ["-"]:
+            print(
+                f"{device_id:<20} {alert_type:<24} {result['current'][alert_type]:>9} "
+                f"{result['proposed'][alert_type]:>9} {result['added'][alert_type]:>7} "
+                f"{result['removed'][alert_type]:>8}"
+            )
+
+    print()
+    print(
+        f"{report['frames']} frames ({report['skipped']} skipped, {report['rejected']} rejected) "
+        f"from {report['chunks']} chunks "
+        f"in {report['elapsed_seconds']}s: {report['frames_per_second']} frames/s"
+    )
+    if "written" in report:
+        written = report["written"]
+        print(
+            f"Wrote {written['alerts']} alerts and {written['events']} drowsy events "
+            f"in {written['commits']} batches ({written['deleted']} replaced) "
+            f"in {report['write_seconds']}s"
+        )
+
+
+def _parse_time(value):
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay archived telemetry through the alert rules")
+    parser.add_argument("paths", nargs="+", help="NDJSON (.ndjson/.jsonl/.gz) files or spool segments")
+    parser.add_argument("--temp-threshold", type=float)
+    parser.add_argument("--pitch-threshold", type=float)
+    parser.add_argument("--gyro-y-threshold", type=float)
+    parser.add_argument("--devices", help="Comma-separated device IDs to include")
+    parser.add_argument("--since", type=_parse_time, help="ISO start time (inclusive)")
+    parser.add_argument("--until", type=_parse_time, help="ISO end time (exclusive)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES // (1024 * 1024))
+    parser.add_argument("--write", action="store_true", help="Store proposed alerts/events")
+    parser.add_argument("--replace", action="store_true",
+                        help="With --write, first delete existing alerts/events in the replayed time span")
+    args = parser.parse_args(argv)
+
+    if args.replace and not args.write:
+        parser.error("--replace requires --write")
+
+    if args.write:
+        from dotenv import load_dotenv
+        from services.firebase import init_firebase
+
+        load_dotenv()
+        init_firebase()
+
+    report = run_replay(
+        args.paths,
+        proposed_overrides={
+            "temp": args.temp_threshold,
+            "pitch": args.pitch_threshold,
+            "gyro_y": args.gyro_y_threshold,
+        },
+        workers=args.workers,
+        write=args.write,
+        replace=args.replace,
+        devices=set(args.devices.split(",")) if args.devices else None,
+        since=args.since,
+        until=args.until,
+        chunk_bytes=args.chunk_mb * 1024 * 1024,
+    )
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,637 @@
+# backend/services/reports.py
+
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from multiprocessing import get_context
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, date, timedelta, timezone
+
+from services.firebase import get_firestore, get_rtdb, get_device_ref, list_device_ids, safe_get
+from services.concurrency import fan_out, task
+from services.sessionizer import session_key
+from services.work_hours import get_rtdb_sessions, normalize_summary
+
+# ===============================
+# Report Settings
+# ===============================
+REPORT_INTERVAL_HOURS = float(os.getenv("REPORT_INTERVAL_HOURS", 6))
+# Process pool size for the cron/CLI run; the in-app scheduler computes inline
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", os.cpu_count() or 1))
+REPORT_READ_WORKERS = int(os.getenv("REPORT_READ_WORKERS", 8))
+REPORT_READ_TIMEOUT = float(os.getenv("REPORT_READ_TIMEOUT", 60))
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", 1000))
+# Versions kept per report; a partial period gets one per run that changes it
+REPORT_MAX_VERSIONS = int(os.getenv("REPORT_MAX_VERSIONS", 20))
+
+REPORT_COLLECTION = "reports"
+REPORT_KINDS = ("weekly", "monthly")
+
+# Bump when the report layout changes; stored with every document
+REPORT_SCHEMA = 1
+
+# Three writes per changed report (latest, version, pruned version); a
+# WriteBatch takes 500
+WRITE_CHUNK_SIZE = 150
+
+PEAK_HOURS = 3
+
+# Device reads are I/O bound and get their own pool, like the fleet refresh
+_executor = ThreadPoolExecutor(max_workers=REPORT_READ_WORKERS, thread_name_prefix="reports")
+
+_lock = threading.Lock()
+_thread = None
+_last_run = None
+
+
+# ===============================
+# Periods
+# ===============================
+# Weekly periods are ISO weeks ("2025-W03", from Monday 00:00 UTC),
+# monthly periods calendar months ("2025-01"). Days and hours of day are
+# UTC throughout, as for the daily worked hours.
+def _week(day):
+    year, week, _ = day.isocalendar()
+    start = datetime.combine(day - timedelta(days=day.weekday()), datetime.min.time(), timezone.utc)
+    return {"id": f"{year}-W{week:02d}", "kind": "weekly", "start": start, "end": start + timedelta(days=7)}
+
+
+def _month(year, month):
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return {"id": f"{year}-{month:02d}", "kind": "monthly", "start": start, "end": end}
+
+
+def parse_period(period_id):
+    """
+    Period dict for "2025-W03" or "2025-01"; ValueError if it is neither
+    """
+    if "-W" in period_id:
+        year, week = period_id.split("-W")
+        return _week(date.fromisocalendar(int(year), int(week), 1))
+    year, month = period_id.split("-")
+    if len(year) != 4 or len(month) != 2:
+        raise ValueError(f"Invalid period: {period_id}")
+    return _month(int(year), int(month))
+
+
+def resolve_period(value, now=None):
+    """
+    Period ID for a period ID or one of this-week, last-week, this-month
+    and last-month
+    """
+    today = (now or datetime.now(timezone.utc)).date()
+    aliases = {
+        "this-week": lambda: _week(today),
+        "last-week": lambda: _week(today - timedelta(days=7)),
+        "this-month": lambda: _month(today.year, today.month),
+        "last-month": lambda: _month(today.year - (today.month == 1), (today.month - 2) % 12 + 1),
+    }
+    if value in aliases:
+        return aliases[value]()["id"]
+    try:
+        return parse_period(value)["id"]
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid period: {value}")
+
+
+def report_periods(now, kinds=REPORT_KINDS):
+    """
+    Periods a run refreshes: the current (partial) and previous week and/or month
+    """
+    aliases = []
+    if "weekly" in kinds:
+        aliases += ["last-week", "this-week"]
+    if "monthly" in kinds:
+        aliases += ["last-month", "this-month"]
+    return [parse_period(resolve_period(alias, now)) for alias in aliases]
+
+
+def report_id(device_id, period_id):
+    return f"{device_id}_{period_id}"
+
+
+def _epoch(value):
+    """
+    Epoch seconds for a Firestore timestamp (naive values are UTC), or None
+    """
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+# ===============================
+# Reads (once per run)
+# ===============================
+def _load_device_sessions(device_id, since, until):
+    """
+    (start, seconds) of each session starting in [since, until), and the
+    archived session count and worked seconds per day. Summaries are keyed
+    by start time, so only the run's range is read; helmet-written history
+    is read whole.
+    """
+    summaries_ref = get_device_ref(device_id).child("sessions")
+    if summaries_ref.order_by_key().limit_to_last(1).get():
+        page = (
+            summaries_ref.order_by_key()
+            .start_at(session_key(since.timestamp()))
+            .end_at(session_key(until.timestamp()))
+            .get()
+        ) or {}
+        sessions = [normalize_summary(key, raw) for key, raw in page.items()]
+    else:
+        sessions = get_rtdb_sessions(device_id)
+
+    spans = []
+    for session in sessions:
+        if not session or not session["start_time"]:
+            continue
+        start = session["start_time"]
+        if since <= start < until:
+            spans.append((start.timestamp(), session["duration_seconds"]))
+
+    # Sessions moved by retention only survive as daily totals
+    daily_ref = get_rtdb().child("archive").child(device_id).child("summary").child("daily")
+    first_day, last_day = since.date().isoformat(), until.date().isoformat()
+    archived = {
+        day: {
+            "sessions": int(totals.get("sessions", 0) or 0),
+            "worked_seconds": float(totals.get("worked_seconds", 0.0) or 0.0),
+        }
+        for day, totals in (safe_get(daily_ref, {}) or {}).items()
+        if isinstance(totals, dict) and first_day <= day < last_day
+    }
+    return {"sessions": spans, "archived": archived}
+
+
+def _scan(collection, field, since, until):
+    """
+    Every document with since <= field < until, in pages ordered on the
+    single-field index (no composite index needed)
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    query = (
+        get_firestore().collection(collection)
+        .where(filter=FieldFilter(field, ">=", since))
+        .where(filter=FieldFilter(field, "<", until))
+        .order_by(field)
+        .limit(REPORT_PAGE_SIZE)
+    )
+    last = None
+    while True:
+        docs = list((query.start_after(last) if last else query).stream())
+        for doc in docs:
+            yield doc.to_dict() or {}
+        if len(docs) < REPORT_PAGE_SIZE:
+            return
+        last = docs[-1]
+
+
+def _load_activity(since, until):
+    """
+    Drowsy events, alerts and compacted daily summaries for the whole
+    fleet, one scan per collection, grouped by device
+    """
+    activity = defaultdict(lambda: {"events": [], "alerts": [], "compacted": {}})
+
+    for event in _scan("drowsy_events", "timestamp", since, until):
+        ts = _epoch(event.get("timestamp"))
+        if event.get("device_id") and ts is not None:
+            activity[event["device_id"]]["events"].append(ts)
+
+    for alert in _scan("alerts", "timestamp", since, until):
+        ts = _epoch(alert.get("timestamp"))
+        if alert.get("device_id") and ts is not None:
+            activity[alert["device_id"]]["alerts"].append(
+                (ts, alert.get("type", "UNKNOWN"), bool(alert.get("acknowledged")))
+            )
+
+    # Raw documents older than the retention window were rolled into
+    # daily_summaries; they keep their counts but lose the time of day
+    for summary in _scan("daily_summaries", "date", since.date().isoformat(), until.date().isoformat()):
+        if summary.get("device_id"):
+            activity[summary["device_id"]]["compacted"][summary["date"]] = {
+                "drowsy_events": int(summary.get("drowsy_events", 0) or 0),
+                "alerts": summary.get("alerts") or {},
+            }
+
+    return activity
+
+
+def _load_existing(period_ids):
+    """
+    Stored reports for the run's periods, all devices, in one query
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    docs = (
+        get_firestore().collection(REPORT_COLLECTION)
+        .where(filter=FieldFilter("period", "in", list(period_ids)))
+        .stream()
+    )
+    return {doc.id: doc.to_dict() or {} for doc in docs}
+
+
+# ===============================
+# Report Builder (worker processes)
+# ===============================
+def _empty_day(day):
+    return {"date": day, "hours_worked": 0.0, "sessions": 0, "drowsy_events": 0, "alerts": 0}
+
+
+def _build_report(device_id, period, data, now):
+    start, end = period["start"].timestamp(), period["end"].timestamp()
+    first_day, last_day = period["start"].date(), period["end"].date()
+
+    days = {}
+    day = first_day
+    while day < last_day:
+        days[day.isoformat()] = _empty_day(day.isoformat())
+        day += timedelta(days=1)
+
+    def day_of(ts):
+        return datetime.fromtimestamp(ts, tz=timezone.utc).date().isoformat()
+
+    def hour_of(ts):
+        return datetime.fromtimestamp(ts, tz=timezone.utc).hour
+
+    worked_seconds = 0.0
+    for session_start, seconds in data["sessions"]:
+        if start <= session_start < end:
+            row = days[day_of(session_start)]
+            row["sessions"] += 1
+            row["hours_worked"] += seconds / 3600.0
+            worked_seconds += seconds
+    for day, totals in data["archived"].items():
+        if day in days:
+            days[day]["sessions"] += totals["sessions"]
+            days[day]["hours_worked"] += totals["worked_seconds"] / 3600.0
+            worked_seconds += totals["worked_seconds"]
+
+    hourly_events = [0] * 24
+    hourly_alerts = [0] * 24
+    alerts = {"total": 0, "acknowledged": 0, "by_type": defaultdict(int)}
+
+    for ts in data["events"]:
+        if start <= ts < end:
+            days[day_of(ts)]["drowsy_events"] += 1
+            hourly_events[hour_of(ts)] += 1
+    for ts, alert_type, acknowledged in data["alerts"]:
+        if start <= ts < end:
+            days[day_of(ts)]["alerts"] += 1
+            hourly_alerts[hour_of(ts)] += 1
+            alerts["total"] += 1
+            alerts["acknowledged"] += acknowledged
+            alerts["by_type"][alert_type] += 1
+    for day, summary in data["compacted"].items():
+        if day not in days:
+            continue
+        days[day]["drowsy_events"] += summary["drowsy_events"]
+        compacted_alerts = summary["alerts"]
+        days[day]["alerts"] += int(compacted_alerts.get("total", 0) or 0)
+        alerts["total"] += int(compacted_alerts.get("total", 0) or 0)
+        alerts["acknowledged"] += int(compacted_alerts.get("acknowledged", 0) or 0)
+        for alert_type, n in (compacted_alerts.get("by_type") or {}).items():
+            alerts["by_type"][alert_type] += int(n or 0)
+
+    hours_worked = worked_seconds / 3600.0
+    drowsy_events = sum(row["drowsy_events"] for row in days.values())
+    for row in days.values():
+        row["hours_worked"] = round(row["hours_worked"], 2)
+
+    # Hours of day ranked by drowsy events plus alerts
+    ranked = sorted(range(24), key=lambda h: (hourly_events[h] + hourly_alerts[h], -h), reverse=True)
+    peak_hours = [
+        {"hour_utc": h, "drowsy_events": hourly_events[h], "alerts": hourly_alerts[h]}
+        for h in ranked[:PEAK_HOURS]
+        if hourly_events[h] + hourly_alerts[h]
+    ]
+
+    return {
+        "device_id": device_id,
+        "period": period["id"],
+        "kind": period["kind"],
+        "start": period["start"].isoformat(),
+        "end": period["end"].isoformat(),
+        "complete": now >= end,
+        "hours_worked": round(hours_worked, 2),
+        "sessions": sum(row["sessions"] for row in days.values()),
+        "drowsy_events": drowsy_events,
+        "drowsy_events_per_hour": round(drowsy_events / hours_worked, 3) if hours_worked else None,
+        "alerts": {**alerts, "by_type": dict(sorted(alerts["by_type"].items()))},
+        "hourly": {"drowsy_events": hourly_events, "alerts": hourly_alerts},
+        "peak_risk_hours": peak_hours,
+        "daily": list(days.values()),
+    }
+
+
+def build_device_reports(job):
+    """
+    Every period's report for one device. Runs in a worker process on
+    plain data (epoch seconds, no Firebase access).
+    """
+    device_id, periods, data, now = job
+    return device_id, [_build_report(device_id, period, data, now) for period in periods]
+
+
+def _digest(report):
+    # "complete" flips once the period ends; the numbers decide versions
+    content = {k: v for k, v in report.items() if k != "complete"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+# ===============================
+# Writes
+# ===============================
+def _write_reports(reports, existing, generated_at):
+    """
+    Store reports whose numbers changed (or that just became complete).
+    reports/{device}_{period} holds the latest version and the newest
+    REPORT_MAX_VERSIONS versions are kept in its versions subcollection.
+    Returns the number written.
+    """
+    db = get_firestore()
+    changed = []
+    for report in reports:
+        doc_id = report_id(report["device_id"], report["period"])
+        previous = existing.get(doc_id) or {}
+        digest = _digest(report)
+        if (previous.get("digest") == digest and previous.get("schema") == REPORT_SCHEMA
+                and previous.get("complete") == report["complete"]):
+            continue
+        changed.append((doc_id, {
+            **report,
+            "schema": REPORT_SCHEMA,
+            "version": int(previous.get("version", 0)) + 1,
+            "digest": digest,
+            "generated_at": generated_at.isoformat(),
+        }))
+
+    for i in range(0, len(changed), WRITE_CHUNK_SIZE):
+        batch = db.batch()
+        for doc_id, document in changed[i:i + WRITE_CHUNK_SIZE]:
+            ref = db.collection(REPORT_COLLECTION).document(doc_id)
+            versions = ref.collection("versions")
+            batch.set(ref, document)
+            batch.set(versions.document(str(document["version"])), document)
+            if document["version"] > REPORT_MAX_VERSIONS:
+                batch.delete(versions.document(str(document["version"] - REPORT_MAX_VERSIONS)))
+        batch.commit()
+    return len(changed)
+
+
+# ===============================
+# Report Run
+# ===============================
+def _compute(jobs, workers):
+    """
+    {device_id: [reports]} using a process pool (inline for one device or worker)
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        return dict(map(build_device_reports, jobs))
+
+    # Spawned, not forked: this process already runs the read pool's
+    # threads, and workers only need the plain data in their job
+    chunksize = max(len(jobs) // (workers * 4), 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        return dict(pool.map(build_device_reports, jobs, chunksize=chunksize))
+
+
+def run_reports(now=None, kinds=REPORT_KINDS, devices=None, workers=1, write=True):
+    """
+    Refresh the weekly/monthly reports of every device (or `devices`).
+
+    Each device's sessions are read once and the Firestore collections
+    are scanned once for the union of the periods; the reports are then
+    computed (on a process pool with workers > 1, the cron/CLI path) and
+    only changed ones are stored.
+    """
+    global _last_run
+
+    if not _lock.acquire(blocking=False):
+        print("Report run already in progress, skipping")
+        return None
+
+    try:
+        started = time.perf_counter()
+        now = now or datetime.now(timezone.utc)
+        periods = report_periods(now, kinds)
+        since = min(p["start"] for p in periods)
+        until = max(p["end"] for p in periods)
+        device_ids = devices or list_device_ids()
+
+        sessions = fan_out({
+            device_id: task(_load_device_sessions, device_id, since, until, timeout=REPORT_READ_TIMEOUT)
+            for device_id in device_ids
+        }, executor=_executor)
+        activity = _load_activity(since, until)
+
+        jobs, skipped = [], []
+        for device_id in device_ids:
+            if sessions.get(device_id) is None:
+                # Never store a report built from a failed read
+                skipped.append(device_id)
+                continue
+            data = {**sessions[device_id], **activity.get(device_id, {"events": [], "alerts": [], "compacted": {}})}
+            jobs.append((device_id, periods, data, now.timestamp()))
+
+        reports = _compute(jobs, workers)
+        flat = [report for device_id in sorted(reports) for report in reports[device_id]]
+
+        written = 0
+        if write:
+            existing = _load_existing(p["id"] for p in periods)
+            written = _write_reports(flat, existing, now)
+
+        result = {
+            "periods": [p["id"] for p in periods],
+            "devices": len(reports),
+            "skipped": skipped,
+            "reports": len(flat),
+            "written": written,
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        _last_run = result
+        print(f"Report run complete: {result}")
+        return result if write else {**result, "built": flat}
+    finally:
+        _lock.release()
+
+
+def _report_loop(interval_seconds):
+    while True:
+        try:
+            run_reports()
+        except Exception as e:
+            print(f"ERROR during report run: {e}")
+        time.sleep(interval_seconds)
+
+
+def start_report_scheduler(interval_hours=None):
+    """
+    Start the background report thread (once per process)
+    """
+    global _thread
+
+    if _thread and _thread.is_alive():
+        return _thread
+
+    hours = REPORT_INTERVAL_HOURS if interval_hours is None else interval_hours
+    _thread = threading.Thread(
+        target=_report_loop,
+        args=(hours * 3600,),
+        name="reports",
+        daemon=True,
+    )
+    _thread.start()
+    return _thread
+
+
+def get_report_status():
+    if _thread is None:
+        return None
+    return {"interval_hours": REPORT_INTERVAL_HOURS, "last_run": _last_run}
+
+
+# ===============================
+# Serving
+# ===============================
+def load_report(device_id, period_id, version=None):
+    """
+    A stored report (latest, or a given version), or None
+    """
+    ref = get_firestore().collection(REPORT_COLLECTION).document(report_id(device_id, period_id))
+    if version is not None:
+        ref = ref.collection("versions").document(str(version))
+    snap = ref.get()
+    return snap.to_dict() if snap.exists else None
+
+
+def list_reports(device_id):
+    """
+    Stored reports for a device (latest versions, without the data), newest period first
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    docs = (
+        get_firestore().collection(REPORT_COLLECTION)
+        .where(filter=FieldFilter("device_id", "==", device_id))
+        .stream()
+    )
+    fields = ("period", "kind", "start", "end", "complete", "version", "generated_at")
+    listing = [{k: (doc.to_dict() or {}).get(k) for k in fields} for doc in docs]
+    return sorted(listing, key=lambda r: (r["start"] or "", r["kind"] or ""), reverse=True)
+
+
+# ===============================
+# Export
+# ===============================
+def report_tables(report):
+    """
+    The report as titled tables of rows (header first), the shape used by
+    the CSV export and the printable page
+    """
+    alerts = report.get("alerts") or {}
+    per_hour = report.get("drowsy_events_per_hour")
+    hourly = report.get("hourly") or {}
+    events_by_hour = hourly.get("drowsy_events") or [0] * 24
+    alerts_by_hour = hourly.get("alerts") or [0] * 24
+
+    return [
+        ("Summary", [
+            ["metric", "value"],
+            ["device_id", report.get("device_id")],
+            ["period", report.get("period")],
+            ["start", report.get("start")],
+            ["end", report.get("end")],
+            ["complete", report.get("complete")],
+            ["hours_worked", report.get("hours_worked")],
+            ["sessions", report.get("sessions")],
+            ["drowsy_events", report.get("drowsy_events")],
+            ["drowsy_events_per_hour", "" if per_hour is None else per_hour],
+            ["alerts", alerts.get("total", 0)],
+            ["alerts_acknowledged", alerts.get("acknowledged", 0)],
+            ["version", report.get("version")],
+            ["generated_at", report.get("generated_at")],
+        ]),
+        ("Alerts by type", [["type", "count"]] + [
+            [alert_type, n] for alert_type, n in (alerts.get("by_type") or {}).items()
+        ]),
+        ("Peak risk hours (UTC)", [["hour_utc", "drowsy_events", "alerts"]] + [
+            [p["hour_utc"], p["drowsy_events"], p["alerts"]] for p in report.get("peak_risk_hours") or []
+        ]),
+        ("Daily", [["date", "hours_worked", "sessions", "drowsy_events", "alerts"]] + [
+            [d["date"], d["hours_worked"], d["sessions"], d["drowsy_events"], d["alerts"]]
+            for d in report.get("daily") or []
+        ]),
+        ("Hour of day (UTC)", [["hour_utc", "drowsy_events", "alerts"]] + [
+            [h, events_by_hour[h], alerts_by_hour[h]] for h in range(24)
+        ]),
+    ]
+
+
+def report_csv(report):
+    """
+    CSV export: one block per table, separated by a blank line
+    """
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for i, (title, rows) in enumerate(report_tables(report)):
+        if i:
+            writer.writerow([])
+        writer.writerow([f"# {title}"])
+        writer.writerows(rows)
+    return out.getvalue()
+
+
+# ===============================
+# Manual / Cron Run
+# ===============================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build weekly/monthly safety reports")
+    parser.add_argument("--at", type=date.fromisoformat,
+                        help="Build as of this date (YYYY-MM-DD), e.g. to backfill older periods")
+    parser.add_argument("--kinds", default=",".join(REPORT_KINDS), help="weekly, monthly or both")
+    parser.add_argument("--devices", help="Comma-separated device IDs (default: all)")
+    parser.add_argument("--workers", type=int, default=REPORT_WORKERS)
+    parser.add_argument("--dry-run", action="store_true", help="Print the reports instead of storing them")
+    args = parser.parse_args(argv)
+
+    kinds = tuple(k.strip() for k in args.kinds.split(","))
+    if not set(kinds) <= set(REPORT_KINDS):
+        parser.error(f"--kinds must be from {', '.join(REPORT_KINDS)}")
+
+    from dotenv import load_dotenv
+    from services.firebase import init_firebase
+
+    load_dotenv()
+    init_firebase()
+
+    now = None
+    if args.at:
+        # End of that day, so its own week/month count as current
+        now = datetime.combine(args.at, datetime.max.time(), timezone.utc)
+    result = run_reports(
+        now=now,
+        kinds=kinds,
+        devices=args.devices.split(",") if args.devices else None,
+        workers=args.workers,
+        write=not args.dry_run,
+    )
+    if args.dry_run and result:
+        for report in result["built"]:
+            print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# backend/services/retention.py
+
+import os
+import time
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from firebase_admin import firestore
+from services.firebase import get_firestore, get_rtdb, get_device_ref, list_device_ids, safe_get
+from services.alerts import increment_counter
+from services import local_index
+from services.work_hours import _parse_rtdb_timestamp
+
+# ===============================
+# Retention Settings
+# ===============================
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 30))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", 6))
+
+# Firestore allows 500 writes per batch; each raw doc costs one delete and
+# shares the summary writes of its page, so stay well below that.
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 200))
+
+# Pause between commits so compaction never competes with live traffic.
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", 0.5))
+
+SUMMARY_COLLECTION = "daily_summaries"
+CHECKPOINT_DOC = ("maintenance", "retention")
+
+_lock = threading.Lock()
+_thread = None
+
+
+# ===============================
+# Checkpoints
+# ===============================
+def _checkpoint_ref():
+    collection, doc = CHECKPOINT_DOC
+    return get_firestore().collection(collection).document(doc)
+
+
+def _load_checkpoint():
+    snap = _checkpoint_ref().get()
+    if not snap.exists:
+        return {}
+    return snap.to_dict() or {}
+
+
+def _save_checkpoint(section, key, value):
+    _checkpoint_ref().set(
+        {section: {key: value}, "updated_at": datetime.now(timezone.utc)},
+        merge=True,
+    )
+
+
+def _summary_id(device_id, day):
+    return f"{device_id}_{day}"
+
+
+def _day_of(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return None
+
+
+# ===============================
+# Firestore Compaction
+# ===============================
+def _summarize_drowsy_events(docs):
+    """
+    Group drowsy events per device/day into summary field increments.
+    """
+    summaries = defaultdict(lambda: defaultdict(int))
+    for doc in docs:
+        event = doc.to_dict() or {}
+        day = _day_of(event.get("timestamp"))
+        if not day:
+            continue
+        summaries[(event.get("device_id"), day)]["drowsy_events"] += 1
+    return {
+        key: {"drowsy_events": firestore.Increment(counts["drowsy_events"])}
+        for key, counts in summaries.items()
+    }
+
+
+def _summarize_alerts(docs):
+    """
+    Group alerts per device/day into total, per-type and acknowledged increments.
+    """
+    summaries = defaultdict(lambda: {"total": 0, "acknowledged": 0, "by_type": defaultdict(int)})
+    for doc in docs:
+        alert = doc.to_dict() or {}
+        day = _day_of(alert.get("timestamp"))
+        if not day:
+            continue
+        counts = summaries[(alert.get("device_id"), day)]
+        counts["total"] += 1
+        counts["by_type"][alert.get("type", "UNKNOWN")] += 1
+        if alert.get("acknowledged"):
+            counts["acknowledged"] += 1
+    return {
+        key: {
+            "alerts": {
+                "total": firestore.Increment(counts["total"]),
+                "acknowledged": firestore.Increment(counts["acknowledged"]),
+                "by_type": {
+                    alert_type: firestore.Increment(n)
+                    for alert_type, n in counts["by_type"].items()
+                },
+            }
+        }
+        for key, counts in summaries.items()
+    }
+
+
+def _count_unacknowledged(docs):
+    counts = defaultdict(int)
+    for doc in docs:
+        alert = doc.to_dict() or {}
+        if alert.get("device_id") and not alert.get("acknowledged"):
+            counts[alert["device_id"]] += 1
+    return counts
+
+
+_SUMMARIZERS = {
+    "drowsy_events": _summarize_drowsy_events,
+    "alerts": _summarize_alerts,
+}
+
+
+def compact_collection(collection, cutoff):
+    """
+    Roll raw documents older than `cutoff` into daily summaries and delete them.
+
+    Each page is committed as one WriteBatch holding both the summary
+    increments and the deletes, so an interrupted run never double counts:
+    whatever was committed is gone from the raw collection. That is also
+    how a run resumes; no timestamp checkpoint is kept, since spool
+    replays can still add documents older than one.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+
+    db = get_firestore()
+    summarize = _SUMMARIZERS[collection]
+    compacted = 0
+
+    while True:
+        docs = list(
+            db.collection(collection)
+            .where(filter=FieldFilter("timestamp", "<", cutoff))
+            .order_by("timestamp")
+            .limit(RETENTION_BATCH_SIZE)
+            .stream()
+        )
+        if not docs:
+            break
+
+        batch = db.batch()
+        for (device_id, day), fields in summarize(docs).items():
+            if not device_id:
+                continue
+            summary_ref = db.collection(SUMMARY_COLLECTION).document(_summary_id(device_id, day))
+            batch.set(summary_ref, {"device_id": device_id, "date": day, **fields}, merge=True)
+        for doc in docs:
+            batch.delete(doc.reference)
+        if collection == "alerts":
+            # Deleted unacknowledged alerts must leave the dashboard badge too
+            for device_id, amount in _count_unacknowledged(docs).items():
+                increment_counter(batch, device_id, -amount)
+        batch.commit()
+        for doc in docs:
+            local_index.record_delete(collection, doc.id)
+
+        compacted += len(docs)
+
+        if len(docs) < RETENTION_BATCH_SIZE:
+            break
+        time.sleep(RETENTION_BATCH_PAUSE)
+
+    return compacted
+
+
+# ===============================
+# RTDB Session Archive
+# ===============================
+def archive_device_sessions(device_id, cutoff, cursor=None, node="history", count=True):
+    """
+    Move closed sessions that ended before `cutoff` to /archive/{device_id}.
+
+    History is paged by key. The returned cursor only advances over the
+    contiguous prefix of archived sessions, so an older session that is
+    still open is revisited on the next run instead of being skipped.
+
+    node is "history" (helmet-written) or "sessions" (sessionizer
+    summaries). With count=False entries are moved without adding to the
+    archived totals, for history whose sessions are already summarized.
+    """
+    history_ref = get_device_ref(device_id).child(node)
+    summary_ref = get_rtdb().child("archive").child(device_id).child("summary")
+    summary = safe_get(summary_ref, {}) or {}
+    worked_seconds = float(summary.get("worked_seconds", 0.0))
+    daily = summary.get("daily") or {}
+
+    archived = 0
+    prefix_open = True
+    scan_from = cursor
+
+    while True:
+        query = history_ref.order_by_key()
+        if scan_from:
+            query = query.start_at(scan_from)
+        page = query.limit_to_first(RETENTION_BATCH_SIZE + 1).get() or {}
+        keys = [k for k in page.keys() if k != scan_from][:RETENTION_BATCH_SIZE]
+        if not keys:
+            break
+
+        updates = {}
+        for sid in keys:
+            raw = page[sid]
+            end_dt = _parse_rtdb_timestamp(raw.get("endTime")) if isinstance(raw, dict) else None
+            closed = isinstance(raw, dict) and not raw.get("active") and end_dt is not None
+
+            if not closed or end_dt >= cutoff:
+                prefix_open = False
+                continue
+
+            start_dt = _parse_rtdb_timestamp(raw.get("startTime")) or end_dt
+            try:
+                seconds = float(raw.get("finalDuration", raw.get("duration")))
+            except (TypeError, ValueError):
+                seconds = max((end_dt - start_dt).total_seconds(), 0.0)
+
+            updates[f"archive/{device_id}/{node}/{sid}"] = raw
+            updates[f"devices/{device_id}/{node}/{sid}"] = None
+            archived += 1
+
+            if count:
+                day = start_dt.date().isoformat()
+                day_summary = daily.setdefault(day, {"sessions": 0, "worked_seconds": 0.0})
+                day_summary["sessions"] += 1
+                day_summary["worked_seconds"] += seconds
+                worked_seconds += seconds
+                updates[f"archive/{device_id}/summary/daily/{day}"] = day_summary
+
+            if prefix_open:
+                cursor = sid
+
+        if updates:
+            # Multi-path update: the move and the running totals land atomically.
+            if count:
+                updates[f"archive/{device_id}/summary/worked_seconds"] = worked_seconds
+            get_rtdb().update(updates)
+            time.sleep(RETENTION_BATCH_PAUSE)
+
+        scan_from = keys[-1]
+        if len(keys) < RETENTION_BATCH_SIZE:
+            break
+
+    return archived, cursor
+
+
+# ===============================
+# Retention Run
+# ===============================
+def run_retention(retention_days=None):
+    """
+    Run one compaction pass over Firestore and RTDB.
+    Safe to call repeatedly; progress is checkpointed in maintenance/retention.
+    """
+    if not _lock.acquire(blocking=False):
+        print("Retention run already in progress, skipping")
+        return None
+
+    try:
+        days = RETENTION_DAYS if retention_days is None else retention_days
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        checkpoint = _load_checkpoint()
+        result = {"cutoff": cutoff.isoformat()}
+
+        for collection in _SUMMARIZERS:
+            result[collection] = compact_collection(collection, cutoff)
+
+        rtdb_cursors = checkpoint.get("rtdb") or {}
+        summary_cursors = checkpoint.get("rtdb_sessions") or {}
+        archived_sessions = 0
+        for device_id in list_device_ids():
+            # Once the sessionizer has imported a device's history, its
+            # summaries carry the worked time and history is only moved
+            summarized = bool(safe_get(get_device_ref(device_id).child("sessions_imported"), False))
+
+            archived, cursor = archive_device_sessions(
+                device_id, cutoff, rtdb_cursors.get(device_id), count=not summarized
+            )
+            archived_sessions += archived
+            if cursor and cursor != rtdb_cursors.get(device_id):
+                _save_checkpoint("rtdb", device_id, cursor)
+
+            if summarized:
+                archived, cursor = archive_device_sessions(
+                    device_id, cutoff, summary_cursors.get(device_id), node="sessions"
+                )
+                archived_sessions += archived
+                if cursor and cursor != summary_cursors.get(device_id):
+                    _save_checkpoint("rtdb_sessions", device_id, cursor)
+        result["sessions"] = archived_sessions
+
+        _save_checkpoint("last_run", "finished_at", datetime.now(timezone.utc))
+        print(f"Retention run complete: {result}")
+        return result
+    finally:
+        _lock.release()
+
+
+def _retention_loop(interval_seconds):
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            print(f"ERROR during retention run: {e}")
+        time.sleep(interval_seconds)
+
+
+def start_retention_scheduler(interval_hours=None):
+    """
+    Start the background compaction thread (once per process).
+    """
+    global _thread
+
+    if _thread and _thread.is_alive():
+        return _thread
+
+    hours = RETENTION_INTERVAL_HOURS if interval_hours is None else interval_hours
+    _thread = threading.Thread(
+        target=_retention_loop,
+        args=(hours * 3600,),
+        name="retention",
+        daemon=True,
+    )
+    _thread.start()
+    return _thread
+
+
+# ===============================
+# Manual / Cron Run
+# ===============================
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from services.firebase import init_firebase
+
+    load_dotenv()
+    init_firebase()
+    run_retention()
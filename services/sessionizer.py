@@ -0,0 +1,300 @@
+# backend/services/sessionizer.py
+
+import os
+import time
+import fcntl
+import tempfile
+import threading
+
+from services.firebase import get_rtdb, get_device_ref, safe_get
+
+# ===============================
+# Sessionizer Settings
+# ===============================
+# A gap longer than this between frames ends a session
+SESSION_GAP_SECONDS = float(os.getenv("SESSION_GAP_SECONDS", 600))
+SESSION_FLUSH_SECONDS = float(os.getenv("SESSION_FLUSH_SECONDS", 5))
+
+_sessionizer = None
+_sessionizer_lock = threading.Lock()
+
+
+def session_key(start):
+    """
+    Summary key for a session starting at `start` (epoch seconds).
+    Zero-padded so key order is start order.
+    """
+    return f"{int(start):012d}"
+
+
+def _increment(amount):
+    # RTDB server-side increment, so every worker can add its own counts
+    return {".sv": {"increment": amount}}
+
+
+# ===============================
+# Session Summaries (RTDB)
+# ===============================
+# /devices/{device_id}/sessions/{session_key}:
+#   startTime, endTime (ms), lastSeen (ms), duration (s), drowsyEvents,
+#   alerts, frames, and once closed active=False, closeReason, source
+# /devices/{device_id}/current_session: session_key of the open session
+def _summary_path(device_id, start):
+    return f"devices/{device_id}/sessions/{session_key(start)}"
+
+
+def _close_updates(device_id, start, last, reason):
+    path = _summary_path(device_id, start)
+    return {
+        f"{path}/startTime": int(start * 1000),
+        f"{path}/endTime": int(last * 1000),
+        f"{path}/lastSeen": int(last * 1000),
+        f"{path}/duration": max(last - start, 0),
+        f"{path}/active": False,
+        f"{path}/closeReason": reason,
+    }
+
+
+def import_history(device_id):
+    """
+    One-time conversion of the helmet-written /history into summaries,
+    so dashboards only ever read /sessions once the sessionizer runs.
+    """
+    from services.work_hours import _load_rtdb_history, _normalize_session
+
+    device_ref = get_device_ref(device_id)
+    if safe_get(device_ref.child("sessions_imported"), False):
+        return 0
+
+    updates = {}
+    now = time.time()
+    for sid, raw in _load_rtdb_history(device_id).items():
+        # now=None: an open entry without a duration counts as 0s instead
+        # of running up to the present (helmets that crashed mid-session)
+        session = _normalize_session(sid, raw, None)
+        if not session or not session["start_time"]:
+            continue
+        start = session["start_time"].timestamp()
+        if session["end_time"]:
+            last = session["end_time"].timestamp()
+        else:
+            last = start + session["duration_seconds"]
+        path = _summary_path(device_id, start)
+        updates[path] = {
+            "startTime": int(start * 1000),
+            "endTime": int(last * 1000),
+            "lastSeen": int(last * 1000),
+            "duration": session["duration_seconds"] or max(last - start, 0),
+            "active": False,
+            "drowsyEvents": 0,
+            "alerts": 0,
+            "frames": 0,
+            "closeReason": "imported" if session["end_time"] or now - last > SESSION_GAP_SECONDS else "imported_open",
+            "source": sid,
+        }
+
+    updates[f"devices/{device_id}/sessions_imported"] = True
+    get_rtdb().update(updates)
+    return len(updates) - 1
+
+
+# ===============================
+# Sessionizer
+# ===============================
+class Sessionizer:
+    """
+    Turns the telemetry stream into sessions as frames arrive.
+
+    A frame more than SESSION_GAP_SECONDS after the previous one starts a
+    new session (and ends the previous one at its last frame); sessions
+    with no frames for that long are ended by a sweep. Boundaries live in
+    the shared state table when it is enabled, so every worker on the host
+    agrees on them; otherwise they are tracked in this process.
+
+    Drowsy/alert/frame counts are accumulated in memory and flushed every
+    SESSION_FLUSH_SECONDS as one multi-path RTDB update using server-side
+    increments.
+    """
+
+    def __init__(self, gap=SESSION_GAP_SECONDS, table=None):
+        self.gap = gap
+        self.table = table
+        self._lock = threading.Lock()
+        self._local = {}           # device_id -> [start, last] without a table
+        self._pending = {}         # (device_id, start) -> counts
+        self._updates = {}         # RTDB path -> value (opens/closes)
+        self._imported = set()
+        self._thread = None
+        self.stats = {"opened": 0, "closed": 0, "expired": 0, "flushes": 0}
+
+    # ---------- Boundaries ----------
+    def _advance_local(self, device_id, server_time):
+        with self._lock:
+            current = self._local.get(device_id)
+            if current and server_time < current[1]:
+                return current[0], False, None
+            if current and server_time - current[1] <= self.gap:
+                current[1] = server_time
+                return current[0], False, None
+            self._local[device_id] = [server_time, server_time]
+            return server_time, True, (tuple(current) if current else None)
+
+    def _expire_local(self, now):
+        expired = []
+        with self._lock:
+            for device_id, (start, last) in list(self._local.items()):
+                if now - last > self.gap:
+                    del self._local[device_id]
+                    expired.append((device_id, start, last))
+        return expired
+
+    # ---------- Frames ----------
+    def observe(self, device_id, server_time, drowsy=False, alerts=0):
+        """
+        Account one telemetry frame (called on the ingest path; memory only)
+        """
+        server_time = int(server_time)
+        if self.table is not None:
+            advanced = self.table.advance_session(device_id, server_time, self.gap)
+        else:
+            advanced = None
+        if advanced is None:
+            advanced = self._advance_local(device_id, server_time)
+        start, opened, closed = advanced
+
+        with self._lock:
+            if closed:
+                self._updates.update(_close_updates(device_id, closed[0], closed[1], "gap"))
+                self.stats["closed"] += 1
+            if opened:
+                # No "active" flag here: another worker's close may be
+                # flushed first, and an open must never undo it. A summary
+                # without endTime is the open session.
+                path = _summary_path(device_id, start)
+                self._updates[f"{path}/startTime"] = start * 1000
+                self._updates[f"devices/{device_id}/current_session"] = session_key(start)
+                self.stats["opened"] += 1
+
+            counts = self._pending.setdefault((device_id, start), {
+                "frames": 0, "drowsyEvents": 0, "alerts": 0, "lastSeen": 0,
+            })
+            counts["frames"] += 1
+            counts["drowsyEvents"] += 1 if drowsy else 0
+            counts["alerts"] += alerts
+            counts["lastSeen"] = max(counts["lastSeen"], server_time)
+
+    # ---------- Background ----------
+    def expire(self, now=None):
+        """
+        End sessions that have had no frames for longer than the gap
+        """
+        now = now or time.time()
+        if self.table is not None:
+            expired = self.table.expire_sessions(now, self.gap)
+        else:
+            expired = self._expire_local(now)
+
+        with self._lock:
+            for device_id, start, last in expired:
+                self._updates.update(_close_updates(device_id, start, last, "stale"))
+                self._updates[f"devices/{device_id}/current_session"] = None
+            self.stats["expired"] += len(expired)
+        return expired
+
+    def flush(self):
+        """
+        Write pending opens/closes and counters in one RTDB update
+        """
+        with self._lock:
+            updates, self._updates = self._updates, {}
+            pending, self._pending = self._pending, {}
+
+        devices = {device_id for device_id, _ in pending}
+        devices.update(path.split("/")[1] for path in updates)
+        for device_id in devices - self._imported:
+            try:
+                import_history(device_id)
+                self._imported.add(device_id)
+            except Exception as e:
+                print(f"Warning: could not import session history for {device_id}: {e}")
+
+        structural = dict(updates)
+
+        # Counters after opens/closes so they land on the same paths
+        for (device_id, start), counts in pending.items():
+            path = _summary_path(device_id, start)
+            for field in ("frames", "drowsyEvents", "alerts"):
+                if counts[field]:
+                    updates[f"{path}/{field}"] = _increment(counts[field])
+            # Not authoritative across workers until the session closes
+            if f"{path}/lastSeen" not in updates:
+                updates[f"{path}/lastSeen"] = counts["lastSeen"] * 1000
+
+        if not updates:
+            return 0
+        try:
+            get_rtdb().update(updates)
+            self.stats["flushes"] += 1
+        except Exception:
+            self._restore(structural, pending)
+            raise
+        return len(updates)
+
+    def _restore(self, structural, pending):
+        """
+        Requeue a failed flush; anything written since takes precedence
+        """
+        with self._lock:
+            self._updates = {**structural, **self._updates}
+            for key, counts in pending.items():
+                merged = self._pending.setdefault(key, {"frames": 0, "drowsyEvents": 0, "alerts": 0, "lastSeen": 0})
+                for field in ("frames", "drowsyEvents", "alerts"):
+                    merged[field] += counts[field]
+                merged["lastSeen"] = max(merged["lastSeen"], counts["lastSeen"])
+
+    def _run(self):
+        sweeper = open(os.path.join(tempfile.gettempdir(), "drowsy_sessions.lock"), "a+")
+        while True:
+            time.sleep(SESSION_FLUSH_SECONDS)
+            try:
+                # With the shared table one worker per host sweeps stale
+                # sessions; without it each worker owns its own
+                if self.table is not None:
+                    fcntl.flock(sweeper, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.expire()
+            except OSError:
+                pass
+            except Exception as e:
+                print(f"ERROR expiring sessions: {e}")
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"ERROR flushing sessions: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="sessionizer", daemon=True)
+            self._thread.start()
+        return self
+
+    def status(self):
+        with self._lock:
+            return {**self.stats, "pending_sessions": len(self._pending), "gap_seconds": self.gap}
+
+
+# ===============================
+# Module Helpers
+# ===============================
+def init_sessionizer():
+    from services.state_table import get_state_table
+
+    global _sessionizer
+
+    with _sessionizer_lock:
+        if _sessionizer is None:
+            _sessionizer = Sessionizer(table=get_state_table()).start()
+    return _sessionizer
+
+
+def get_sessionizer():
+    return _sessionizer
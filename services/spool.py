@@ -0,0 +1,619 @@
+# backend/services/spool.py
+
+import os
+import json
+import mmap
+import time
+import uuid
+import fcntl
+import struct
+import zlib
+import threading
+from datetime import datetime, timezone
+
+from google.api_core import exceptions as google_exceptions
+
+# ===============================
+# Spool Settings
+# ===============================
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", 8 * 1024 * 1024))
+SPOOL_MAX_SEGMENTS = int(os.getenv("SPOOL_MAX_SEGMENTS", 64))
+SPOOL_GROUP_COMMIT_MS = float(os.getenv("SPOOL_GROUP_COMMIT_MS", 5))
+SPOOL_MAX_SLOTS = int(os.getenv("SPOOL_MAX_SLOTS", 32))
+
+# append(sync=True) gives up after this long without the record reaching
+# disk; the caller then forwards the frame itself
+SPOOL_SYNC_TIMEOUT_SECONDS = float(os.getenv("SPOOL_SYNC_TIMEOUT_SECONDS", 2))
+
+# Pause before the flusher retries a failed msync
+SPOOL_FLUSH_RETRY_SECONDS = float(os.getenv("SPOOL_FLUSH_RETRY_SECONDS", 1))
+
+# A frame whose forward keeps failing on its own data is moved to the
+# slot's dead-letter file after this many attempts
+SPOOL_MAX_ATTEMPTS = int(os.getenv("SPOOL_MAX_ATTEMPTS", 3))
+
+# How often a worker looks for slots no live worker holds (e.g. after
+# scaling down) and drains them
+SPOOL_ORPHAN_SCAN_SECONDS = float(os.getenv("SPOOL_ORPHAN_SCAN_SECONDS", 60))
+
+# Errors caused by the frame itself; retrying won't help. Anything else
+# (backend down, timeouts, quota) is retried until it goes through.
+POISON_ERRORS = (ValueError, TypeError, KeyError, AttributeError, google_exceptions.InvalidArgument)
+
+# Persist the replay cursor every N forwarded records (replays are idempotent)
+CURSOR_EVERY = 50
+
+# Record header: payload length, crc32(payload), sequence number
+_HEADER = struct.Struct("<IIQ")
+_PAGE = mmap.PAGESIZE
+
+_spool = None
+
+
+class SpoolUnavailable(RuntimeError):
+    """
+    append() could not make a frame durable. `key` is the idempotency key
+    the frame was written under, or None if it never entered the spool;
+    forwarding with that key cannot duplicate a later replay.
+    """
+
+    def __init__(self, message, key=None):
+        super().__init__(message)
+        self.key = key
+
+
+def _segment_name(number):
+    return f"segment-{number:012d}.log"
+
+
+def _read_record(mm, offset):
+    """
+    Decode the record at `offset`.
+    Returns (seq, payload, next_offset) or None at the end of valid data.
+    """
+    if offset + _HEADER.size > len(mm):
+        return None
+    length, crc, seq = _HEADER.unpack_from(mm, offset)
+    end = offset + _HEADER.size + length
+    if length == 0 or end > len(mm):
+        return None
+    payload = bytes(mm[offset + _HEADER.size:end])
+    if zlib.crc32(payload) != crc:
+        return None
+    return seq, payload, end
+
+
+# ===============================
+# Write-Ahead Spool
+# ===============================
+class TelemetrySpool:
+    """
+    Append-only, segment-based write-ahead log for telemetry frames.
+
+    Frames are written into memory-mapped segment files and msync'd by a
+    flusher thread in groups; append() returns once its record is durable.
+    A replayer thread forwards records in order and only advances its
+    cursor after the forward succeeded, so nothing is lost while the
+    backend is slow or down. Disk use is capped at SPOOL_MAX_SEGMENTS
+    segments; beyond that the oldest segment is dropped. Segment space is
+    allocated up front, so a full disk fails the roll instead of a later
+    write into the map.
+
+    If msync fails the spool is marked failed and the flusher keeps
+    retrying; meanwhile append() raises SpoolUnavailable instead of
+    blocking, and the caller forwards the frame itself.
+
+    Each gunicorn worker locks its own slot directory, so a restarted
+    worker picks up and replays whatever its predecessor left behind.
+    Slots no live worker holds (fewer workers than before) are drained by
+    whichever worker locks them first during its periodic orphan scan.
+
+    A record that fails with a POISON_ERRORS error SPOOL_MAX_ATTEMPTS
+    times is appended to dead-letter.jsonl in the slot and skipped, so it
+    cannot hold up the records behind it. Other failures are retried with
+    backoff for as long as it takes.
+
+    Order is kept per slot, not per helmet: frames of one helmet that
+    were handled by different workers are forwarded by different
+    replayers and can reach Firebase out of order. Events and alerts carry
+    their own timestamps; the live node may briefly show an older frame
+    while one replayer has a backlog.
+    """
+
+    def __init__(self, root, forward, segment_bytes=SPOOL_SEGMENT_BYTES,
+                 max_segments=SPOOL_MAX_SEGMENTS, group_commit_ms=SPOOL_GROUP_COMMIT_MS, slot=None):
+        self.root = root
+        self.forward = forward
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.group_commit = group_commit_ms / 1000.0
+
+        self.path = self._claim_slot(root, slot)
+
+        self._lock = threading.Lock()
+        self._dirty = threading.Condition(self._lock)
+        self._durable_cond = threading.Condition(self._lock)
+        self._readable = threading.Condition(self._lock)
+        self._stopped = False
+        self._failed = None
+
+        self._retired = []
+        self.stats = {
+            "appended": 0,
+            "replayed": 0,
+            "dropped_segments": 0,
+            "forward_failures": 0,
+            "dead_lettered": 0,
+            "orphans_drained": 0,
+            "last_error": None,
+        }
+        self._attempts = 0
+        self._poisoned = False
+
+        self._recover()
+        self.instance = self._load_instance_id(fresh=self._next_seq == 0)
+
+    # ---------- Setup / Recovery ----------
+    def _claim_slot(self, root, only=None):
+        os.makedirs(root, exist_ok=True)
+        for slot in ([only] if only is not None else range(SPOOL_MAX_SLOTS)):
+            path = os.path.join(root, f"slot-{slot}")
+            os.makedirs(path, exist_ok=True)
+            lock_file = open(os.path.join(path, "lock"), "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            return path
+        raise RuntimeError(f"No free spool slot under {root}")
+
+    def _load_instance_id(self, fresh=False):
+        """
+        Idempotency keys are "<instance>-<seq>". Whenever the sequence
+        cannot be recovered it restarts at 0, so a new instance ID is
+        minted to keep keys unique.
+        """
+        id_path = os.path.join(self.path, "instance")
+        if os.path.exists(id_path) and not fresh:
+            with open(id_path) as f:
+                return f.read().strip()
+        instance = uuid.uuid4().hex[:12]
+        self._atomic_write(id_path, instance)
+        return instance
+
+    def _segments(self):
+        names = sorted(n for n in os.listdir(self.path) if n.startswith("segment-"))
+        return [int(n[len("segment-"):-len(".log")]) for n in names]
+
+    def _open_segment(self, number, create=False):
+        path = os.path.join(self.path, _segment_name(number))
+        created = create and not os.path.exists(path)
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+        try:
+            if os.fstat(fd).st_size < self.segment_bytes:
+                # Reserve the blocks now: a sparse file would turn a full
+                # disk into SIGBUS on a later write into the map
+                os.posix_fallocate(fd, 0, self.segment_bytes)
+            return mmap.mmap(fd, self.segment_bytes)
+        except OSError:
+            if created:
+                os.remove(path)
+            raise
+        finally:
+            os.close(fd)
+
+    def _recover(self):
+        """
+        Find the write position after the last valid record and load the
+        replay cursor. A torn record at the tail is zeroed out.
+        """
+        segments = self._segments()
+        self._next_seq = 0
+
+        if not segments:
+            self._write_segment = 0
+            self._mm = self._open_segment(0, create=True)
+            self._write_pos = 0
+        else:
+            self._write_segment = segments[-1]
+            self._mm = self._open_segment(self._write_segment)
+            offset = 0
+            while True:
+                record = _read_record(self._mm, offset)
+                if record is None:
+                    break
+                self._next_seq = record[0] + 1
+                offset = record[2]
+            self._write_pos = offset
+            self._mm[offset:] = bytes(self.segment_bytes - offset)
+            self._mm.flush()
+
+            if self._next_seq == 0:
+                self._next_seq = self._last_seq_before(segments[:-1]) + 1
+
+        self._durable = (self._write_segment, self._write_pos)
+
+        cursor = self._load_cursor()
+        first = self._segments()[0]
+        if cursor and cursor["segment"] >= first:
+            self._read_segment, self._read_pos = cursor["segment"], cursor["offset"]
+        else:
+            self._read_segment, self._read_pos = first, 0
+        self._read_mm = None
+        self._since_cursor = 0
+
+    def _last_seq_before(self, segments):
+        for number in reversed(segments):
+            mm = self._open_segment(number)
+            last, offset = -1, 0
+            while True:
+                record = _read_record(mm, offset)
+                if record is None:
+                    break
+                last, offset = record[0], record[2]
+            mm.close()
+            if last >= 0:
+                return last
+        return -1
+
+    def _atomic_write(self, path, text):
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.path, "cursor.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cursor(self):
+        self._atomic_write(
+            os.path.join(self.path, "cursor.json"),
+            json.dumps({"segment": self._read_segment, "offset": self._read_pos}),
+        )
+        self._since_cursor = 0
+
+    # ---------- Writer ----------
+    def append(self, device_id, frame, sync=True):
+        """
+        Append one frame. With sync=True, returns only once it is on disk.
+        Returns the idempotency key used when the frame is forwarded.
+        Raises SpoolUnavailable if the spool is failing or the record is
+        not durable within SPOOL_SYNC_TIMEOUT_SECONDS.
+        """
+        with self._lock:
+            if self._failed is not None:
+                raise SpoolUnavailable(f"Spool failing: {self._failed}")
+
+            seq = self._next_seq
+            payload = json.dumps({"device_id": device_id, "frame": frame, "seq": seq}).encode()
+            size = _HEADER.size + len(payload)
+            if size > self.segment_bytes:
+                raise ValueError("Telemetry frame larger than a spool segment")
+
+            if self._write_pos + size > self.segment_bytes:
+                self._roll()
+
+            _HEADER.pack_into(self._mm, self._write_pos, len(payload), zlib.crc32(payload), seq)
+            self._mm[self._write_pos + _HEADER.size:self._write_pos + size] = payload
+            self._write_pos += size
+            self._next_seq += 1
+            self.stats["appended"] += 1
+            target = (self._write_segment, self._write_pos)
+            self._dirty.notify()
+
+            if sync:
+                deadline = time.monotonic() + SPOOL_SYNC_TIMEOUT_SECONDS
+                while self._durable < target and not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if self._failed is not None or remaining <= 0:
+                        reason = self._failed or "timed out waiting for the flusher"
+                        raise SpoolUnavailable(f"Spool record not durable: {reason}", self._key(seq))
+                    self._durable_cond.wait(timeout=remaining)
+
+        return self._key(seq)
+
+    def _key(self, seq):
+        return f"{self.instance}-{seq}"
+
+    def _roll(self):
+        """
+        Start a new segment (caller holds the lock). The old map is handed
+        to the flusher, which syncs and closes it. If the new segment
+        cannot be allocated nothing changes and the error propagates.
+        """
+        mm = self._open_segment(self._write_segment + 1, create=True)
+        self._retired.append(self._mm)
+        self._write_segment += 1
+        self._write_pos = 0
+        self._mm = mm
+
+        segments = self._segments()
+        while len(segments) > self.max_segments:
+            oldest = segments.pop(0)
+            if oldest >= self._read_segment:
+                self.stats["dropped_segments"] += 1
+                print(f"Warning: spool full, dropping unreplayed segment {oldest}")
+            os.remove(os.path.join(self.path, _segment_name(oldest)))
+
+    def _flush_loop(self):
+        flushed = 0
+        while True:
+            with self._lock:
+                while (self._durable == (self._write_segment, self._write_pos)
+                       and not self._retired and not self._stopped):
+                    self._dirty.wait()
+                if self._stopped:
+                    return
+
+            # Let concurrent appends join this group commit
+            time.sleep(self.group_commit)
+
+            with self._lock:
+                retired, self._retired = self._retired, []
+                mm, segment, pos = self._mm, self._write_segment, self._write_pos
+                if self._durable[0] != segment:
+                    flushed = 0
+
+            try:
+                while retired:
+                    self._sync(retired[0])
+                    retired.pop(0).close()
+
+                start = (flushed // _PAGE) * _PAGE
+                if pos > start:
+                    self._sync(mm, start, pos - start)
+            except Exception as e:
+                with self._lock:
+                    self._retired = retired + self._retired
+                    if self._failed is None:
+                        print(f"ERROR flushing telemetry spool, appends fall back: {e}")
+                    self._failed = e
+                    self.stats["last_error"] = str(e)
+                    self._durable_cond.notify_all()
+                time.sleep(SPOOL_FLUSH_RETRY_SECONDS)
+                continue
+            flushed = pos
+
+            with self._lock:
+                if self._failed is not None:
+                    print("Telemetry spool flushing again")
+                self._failed = None
+                self._durable = (segment, pos)
+                self._durable_cond.notify_all()
+                self._readable.notify_all()
+
+    def _sync(self, mm, offset=0, size=0):
+        """
+        msync part of a map (all of it by default)
+        """
+        if size:
+            mm.flush(offset, size)
+        else:
+            mm.flush()
+
+    # ---------- Replayer ----------
+    def _next_record(self):
+        """
+        Return (seq, record) for the next durable record, or None if the
+        replayer is caught up. Caller holds the lock.
+        """
+        first = self._segments()[0]
+        if self._read_segment < first:
+            self._read_segment, self._read_pos = first, 0
+            self._close_read_map()
+
+        if (self._read_segment, self._read_pos) >= self._durable:
+            return None
+
+        if self._read_mm is None:
+            self._read_mm = self._open_segment(self._read_segment)
+
+        record = _read_record(self._read_mm, self._read_pos)
+        if record is None:
+            if self._read_segment < self._durable[0]:
+                # Finished a sealed segment: delete it and move on
+                finished = self._read_segment
+                self._close_read_map()
+                self._read_segment, self._read_pos = finished + 1, 0
+                self._save_cursor()
+                os.remove(os.path.join(self.path, _segment_name(finished)))
+                return self._next_record()
+            return None
+
+        seq, payload, end = record
+        return seq, json.loads(payload), end
+
+    def _close_read_map(self):
+        if self._read_mm is not None:
+            self._read_mm.close()
+            self._read_mm = None
+
+    def _attempt(self, next_record):
+        """
+        Forward one record. Returns True once the record is done with
+        (forwarded or dead-lettered), False if it has to be retried.
+        """
+        seq, record, end = next_record
+        try:
+            self.forward(record["device_id"], record["frame"], self._key(seq))
+        except Exception as e:
+            self._attempts += 1
+            self._poisoned = isinstance(e, POISON_ERRORS)
+            self.stats["forward_failures"] += 1
+            self.stats["last_error"] = str(e)
+            if not self._poisoned or self._attempts < SPOOL_MAX_ATTEMPTS:
+                print(f"Spool forward of {self._key(seq)} failed (attempt {self._attempts}): {e}")
+                return False
+            self._dead_letter(seq, record, e)
+        else:
+            self.stats["replayed"] += 1
+
+        with self._lock:
+            self._attempts = 0
+            self._read_pos = end
+            self._since_cursor += 1
+            if self._since_cursor >= CURSOR_EVERY:
+                self._save_cursor()
+        return True
+
+    def _dead_letter(self, seq, record, error):
+        entry = {
+            "key": self._key(seq),
+            "record": record,
+            "error": f"{type(error).__name__}: {error}",
+            "attempts": self._attempts,
+            "failed_at": datetime.now(timezone.utc).isoformat(),
+        }
+        with open(os.path.join(self.path, "dead-letter.jsonl"), "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.stats["dead_lettered"] += 1
+        print(f"Spool record {self._key(seq)} dead-lettered after {self._attempts} attempts: {error}")
+
+    def _replay_loop(self):
+        failures = 0
+        while True:
+            with self._lock:
+                next_record = None if self._stopped else self._next_record()
+                while next_record is None and not self._stopped:
+                    if self._since_cursor:
+                        self._save_cursor()
+                    self._readable.wait(timeout=1.0)
+                    next_record = self._next_record()
+                if self._stopped:
+                    return
+
+            if self._attempt(next_record):
+                failures = 0
+                continue
+
+            failures += 1
+            time.sleep(min(2 ** failures, 30))
+
+    def drain(self):
+        """
+        Forward everything durable, on the calling thread. Stops at the
+        first failure that is worth retrying later. Returns the number of
+        records done with.
+        """
+        done = 0
+        while True:
+            with self._lock:
+                next_record = self._next_record()
+            if next_record is None:
+                break
+            if self._attempt(next_record):
+                done += 1
+            elif not self._poisoned:
+                break
+        with self._lock:
+            if self._since_cursor:
+                self._save_cursor()
+        return done
+
+    # ---------- Orphaned Slots ----------
+    def drain_orphans(self):
+        """
+        Replay slots that no running worker holds. Returns records drained.
+        """
+        drained = 0
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            if not name.startswith("slot-") or path == self.path:
+                continue
+            if not any(n.startswith("segment-") for n in os.listdir(path)):
+                continue
+            try:
+                orphan = TelemetrySpool(
+                    self.root, self.forward, self.segment_bytes, self.max_segments,
+                    slot=int(name[len("slot-"):]),
+                )
+            except (RuntimeError, ValueError):
+                continue  # held by a live worker
+            try:
+                drained += orphan.drain()
+                self.stats["dead_lettered"] += orphan.stats["dead_lettered"]
+            finally:
+                orphan.close()
+        self.stats["orphans_drained"] += drained
+        return drained
+
+    def _orphan_loop(self):
+        while not self._stopped:
+            time.sleep(SPOOL_ORPHAN_SCAN_SECONDS)
+            try:
+                self.drain_orphans()
+            except Exception as e:
+                print(f"ERROR draining orphaned spool slots: {e}")
+
+    # ---------- Lifecycle ----------
+    def start(self):
+        threads = (
+            (self._flush_loop, "spool-flush"),
+            (self._replay_loop, "spool-replay"),
+            (self._orphan_loop, "spool-orphans"),
+        )
+        for target, name in threads:
+            threading.Thread(target=target, name=name, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._dirty.notify_all()
+            self._durable_cond.notify_all()
+            self._readable.notify_all()
+
+    def close(self):
+        """
+        Release the maps and the slot lock (stop() first if started)
+        """
+        with self._lock:
+            self._close_read_map()
+            for mm in self._retired + [self._mm]:
+                mm.close()
+            self._retired = []
+        self._lock_file.close()
+
+    def status(self):
+        with self._lock:
+            backlog = (
+                (self._write_segment - self._read_segment) * self.segment_bytes
+                + self._write_pos - self._read_pos
+            )
+            return {
+                **self.stats,
+                "backlog_bytes": max(backlog, 0),
+                "failing": str(self._failed) if self._failed is not None else None,
+                "segments": len(self._segments()),
+                "path": self.path,
+            }
+
+
+# ===============================
+# Module Helpers
+# ===============================
+def init_spool(forward, root=None):
+    """
+    Create and start the process-wide spool
+    """
+    global _spool
+
+    if _spool is None:
+        _spool = TelemetrySpool(root or SPOOL_DIR, forward).start()
+        print(f"✅ Telemetry spool ready at {_spool.path}")
+    return _spool
+
+
+def get_spool():
+    return _spool
@@ -0,0 +1,380 @@
+# backend/services/state_table.py
+
+import os
+import math
+import time
+import zlib
+import fcntl
+import struct
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory, resource_tracker
+
+from services.firebase import get_control_ref, safe_get
+from services.concurrency import fan_out, task
+
+# ===============================
+# State Table Settings
+# ===============================
+STATE_TABLE_NAME = os.getenv("STATE_TABLE_NAME", "drowsy_state")
+STATE_TABLE_SLOTS = int(os.getenv("STATE_TABLE_SLOTS", 4096))
+STATE_CONTROL_REFRESH_SECONDS = float(os.getenv("STATE_CONTROL_REFRESH_SECONDS", 5))
+STATE_CONTROL_WORKERS = int(os.getenv("STATE_CONTROL_WORKERS", 8))
+STATE_CONTROL_BATCH = int(os.getenv("STATE_CONTROL_BATCH", 64))
+
+# Seqlock retries before a reader gives up and falls back to RTDB
+READ_RETRIES = 100
+
+MAGIC = b"DRWSTATE"
+VERSION = 2
+
+# magic, version, slot count, slot size
+HEADER = struct.Struct("<8sIII")
+HEADER_SIZE = 64
+
+# seq, device_id, pitch, gyroY, bodyTemp, heartRate, serverTime,
+# sessionStart, sessionLast, isDrowsy, motor
+SLOT = struct.Struct("<Q32sddddqqqB15s")
+SEQ = struct.Struct("<Q")
+SLOT_SIZE = 128                  # SLOT.size rounded up to two cache lines
+
+DEVICE_ID_BYTES = 32
+FLOAT_FIELDS = ("pitch", "gyroY", "bodyTemp", "heartRate")
+
+_table = None
+_table_lock = threading.Lock()
+
+# Own pool for the control refresh, so polling every device never takes
+# threads from the page fan-outs
+_control_executor = ThreadPoolExecutor(max_workers=STATE_CONTROL_WORKERS, thread_name_prefix="state-control")
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+# ===============================
+# Shared State Table
+# ===============================
+class StateTable:
+    """
+    Latest state per helmet in a fixed-layout shared memory segment,
+    shared by every gunicorn worker on the host.
+
+    Slots are found by open addressing on crc32(device_id) and are never
+    freed, so a slot index can be cached per process. The full device ID
+    is the key; IDs longer than DEVICE_ID_BYTES get no slot (callers fall
+    back to RTDB / process-local state) rather than share one with every
+    ID that has the same prefix. Each slot carries a
+    sequence counter (seqlock): a writer makes it odd, writes the fields
+    and makes it even again; readers take no lock and retry if the counter
+    was odd or changed while they read. Writers (telemetry, the control
+    refresher) serialize on an flock'd file plus a thread lock.
+    """
+
+    def __init__(self, name=STATE_TABLE_NAME, slots=STATE_TABLE_SLOTS, lock_path=None):
+        self.name = name
+        self.capacity = slots
+        self.lock_path = lock_path or os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._lock_file = open(self.lock_path, "a+")
+        self._thread_lock = threading.Lock()
+        self._index = {}
+        self.stats = {"reads": 0, "retries": 0, "misses": 0, "writes": 0}
+
+        with self._write_lock():
+            self.shm = self._open()
+        self.buf = self.shm.buf
+
+    # ---------- Segment ----------
+    def _open(self):
+        size = HEADER_SIZE + self.capacity * SLOT_SIZE
+        try:
+            shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+            HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, self.capacity, SLOT_SIZE)
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(name=self.name)
+            magic, version, capacity, slot_size = HEADER.unpack_from(shm.buf, 0)
+            if (magic, version, slot_size) != (MAGIC, VERSION, SLOT_SIZE) or shm.size < size:
+                # Left over from an older layout: replace it
+                self._release(shm, unlink=True)
+                return self._open()
+            self.capacity = capacity
+
+        # The segment outlives individual workers; don't let the
+        # resource tracker unlink it when this process exits.
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+    def close(self, unlink=False):
+        """
+        Detach from the segment; unlink=True also removes it (tests, tooling)
+        """
+        self.buf = None
+        if unlink:
+            # Unregistered in _open(); unlink() expects the tracker to know it
+            resource_tracker.register(self.shm._name, "shared_memory")
+        self._release(self.shm, unlink)
+        self._lock_file.close()
+
+    @staticmethod
+    def _release(shm, unlink=False):
+        shm.close()
+        if unlink:
+            shm.unlink()
+
+    @contextmanager
+    def _write_lock(self):
+        with self._thread_lock:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    # ---------- Slots ----------
+    def _offset(self, index):
+        return HEADER_SIZE + index * SLOT_SIZE
+
+    def _find(self, device_id, claim=False):
+        """
+        Slot index for a device, or None. With claim=True (writers only,
+        under the write lock) an empty slot is taken for a new device.
+        """
+        index = self._index.get(device_id)
+        if index is not None:
+            return index
+
+        key = device_id.encode()
+        if not key or len(key) > DEVICE_ID_BYTES:
+            if claim:
+                print(f"Warning: device ID longer than {DEVICE_ID_BYTES} bytes, not tracking {device_id}")
+            return None
+        key = key.ljust(DEVICE_ID_BYTES, b"\0")
+        start = zlib.crc32(key) % self.capacity
+        for probe in range(self.capacity):
+            index = (start + probe) % self.capacity
+            offset = self._offset(index) + SEQ.size
+            stored = bytes(self.buf[offset:offset + DEVICE_ID_BYTES])
+            if stored == key:
+                self._index[device_id] = index
+                return index
+            if stored == b"\0" * DEVICE_ID_BYTES:
+                if not claim:
+                    return None
+                self.buf[offset:offset + DEVICE_ID_BYTES] = key
+                self._index[device_id] = index
+                return index
+
+        if claim:
+            print(f"Warning: state table full ({self.capacity} slots), not tracking {device_id}")
+        return None
+
+    def _read_slot(self, index):
+        offset = self._offset(index)
+        for attempt in range(READ_RETRIES):
+            seq = SEQ.unpack_from(self.buf, offset)[0]
+            if not seq & 1:
+                values = SLOT.unpack_from(self.buf, offset)
+                if values[0] == seq and SEQ.unpack_from(self.buf, offset)[0] == seq:
+                    self.stats["retries"] += attempt
+                    return values
+            time.sleep(0)
+        self.stats["retries"] += READ_RETRIES
+        return None
+
+    # ---------- Public API ----------
+    def get(self, device_id):
+        """
+        Latest state for a device as a dict, or None if the table has
+        nothing for it (callers fall back to RTDB).
+        """
+        self.stats["reads"] += 1
+        index = self._find(device_id)
+        values = self._read_slot(index) if index is not None else None
+        if values is None or values[0] == 0:
+            self.stats["misses"] += 1
+            return None
+
+        seq, _, pitch, gyro_y, body_temp, heart_rate, server_time, _, _, is_drowsy, motor = values
+        state = {"seq": seq, "isDrowsy": bool(is_drowsy)}
+        for field, value in zip(FLOAT_FIELDS, (pitch, gyro_y, body_temp, heart_rate)):
+            state[field] = None if math.isnan(value) else value
+        state["serverTime"] = server_time or None
+        state["motor"] = motor.rstrip(b"\0").decode() or None
+        return state
+
+    def _modify(self, device_id, mutate):
+        """
+        Seqlock write of one slot: mutate(values) edits the unpacked
+        field list in place; its return value is passed through.
+        """
+        with self._write_lock():
+            index = self._find(device_id, claim=True)
+            if index is None:
+                return None
+
+            offset = self._offset(index)
+            values = list(SLOT.unpack_from(self.buf, offset))
+            seq = values[0]
+            if seq == 0:
+                # Fresh slot: fields nobody has written yet read back as None
+                values[2:6] = [math.nan] * len(FLOAT_FIELDS)
+
+            result = mutate(values)
+
+            # The counter stays odd while the fields are written; the even
+            # value is only published once the whole slot is in place
+            SEQ.pack_into(self.buf, offset, seq + 1)
+            values[0] = seq + 1
+            SLOT.pack_into(self.buf, offset, *values)
+            SEQ.pack_into(self.buf, offset, seq + 2)
+
+        self.stats["writes"] += 1
+        return result
+
+    def update(self, device_id, live=None, motor=None):
+        """
+        Write a telemetry frame and/or motor state for a device.
+        Fields not given keep their current values.
+        """
+        def mutate(values):
+            new_motor = motor
+            if live is not None:
+                for i, field in enumerate(FLOAT_FIELDS, start=2):
+                    if field in live:
+                        values[i] = _float(live[field])
+                if "serverTime" in live:
+                    values[6] = int(live["serverTime"] or 0)
+                if "isDrowsy" in live:
+                    values[9] = 1 if live["isDrowsy"] else 0
+                if live.get("motorState"):
+                    new_motor = live["motorState"]
+            if new_motor is not None:
+                values[10] = str(new_motor).encode()[:15]
+            return True
+
+        return bool(self._modify(device_id, mutate))
+
+    def advance_session(self, device_id, server_time, gap):
+        """
+        Session bookkeeping shared by all workers: extends the device's
+        current session, or starts one if there is none or the last frame
+        is more than `gap` seconds old.
+
+        Returns (session_start, opened, closed) where closed is the
+        (start, last) of a session this frame ended, else None. Exactly
+        one caller sees opened=True for a given session.
+        """
+        def mutate(values):
+            start, last = values[7], values[8]
+            if start and server_time < last:
+                return start, False, None       # late frame, session unchanged
+            if start and server_time - last <= gap:
+                values[8] = server_time
+                return start, False, None
+            values[7] = values[8] = server_time
+            return server_time, True, ((start, last) if start else None)
+
+        return self._modify(device_id, mutate)
+
+    def expire_sessions(self, now, stale):
+        """
+        End sessions whose last frame is more than `stale` seconds old.
+        Returns [(device_id, start, last)] for the sessions ended.
+        """
+        def mutate(values):
+            start, last = values[7], values[8]
+            if start and now - last > stale:
+                values[7] = 0
+                return start, last
+            return None
+
+        expired = []
+        for device_id in self.device_ids():
+            ended = self._modify(device_id, mutate)
+            if ended:
+                expired.append((device_id, *ended))
+        return expired
+
+    def device_ids(self):
+        """
+        Every device with a slot (scans the table; not for request paths)
+        """
+        ids = []
+        for index in range(self.capacity):
+            offset = self._offset(index) + SEQ.size
+            stored = bytes(self.buf[offset:offset + DEVICE_ID_BYTES]).rstrip(b"\0")
+            if stored:
+                ids.append(stored.decode())
+        return ids
+
+    def status(self):
+        return {**self.stats, "name": self.name, "capacity": self.capacity}
+
+
+# ===============================
+# Control Refresher
+# ===============================
+def _mirror_controls(table):
+    """
+    One pass of the control refresh: read /control for every device in
+    the table, a batch at a time on the control pool
+    """
+    device_ids = table.device_ids()
+    for i in range(0, len(device_ids), STATE_CONTROL_BATCH):
+        batch = device_ids[i:i + STATE_CONTROL_BATCH]
+        controls = fan_out({
+            device_id: task(safe_get, get_control_ref(device_id), {})
+            for device_id in batch
+        }, executor=_control_executor)
+        for device_id in batch:
+            control = controls.get(device_id)
+            if isinstance(control, dict):
+                table.update(device_id, motor=control.get("motor", "UNKNOWN"))
+
+
+def _refresh_control(table):
+    """
+    Mirror /devices/{id}/control/motor into the table. Motor state is
+    written by the control side, not by telemetry, so one worker (whoever
+    holds the leader lock) polls it for the devices in the table.
+    """
+    leader = open(f"{table.lock_path}.control", "a+")
+    while True:
+        time.sleep(STATE_CONTROL_REFRESH_SECONDS)
+        try:
+            fcntl.flock(leader, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            continue
+        try:
+            _mirror_controls(table)
+        except Exception as e:
+            print(f"Error refreshing motor state: {e}")
+
+
+# ===============================
+# Module Helpers
+# ===============================
+def init_state_table():
+    global _table
+
+    with _table_lock:
+        if _table is None:
+            try:
+                _table = StateTable()
+            except Exception as e:
+                print(f"Warning: shared state table unavailable: {e}")
+                return None
+            threading.Thread(
+                target=_refresh_control, args=(_table,), name="state-control", daemon=True
+            ).start()
+    return _table
+
+
+def get_state_table():
+    return _table
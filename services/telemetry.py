@@ -0,0 +1,92 @@
+# backend/services/telemetry.py
+
+import math
+from datetime import datetime, timezone
+from services.firebase import get_live_ref
+from services.analytics import log_drowsiness_event, save_drowsiness_event
+from services.alerts import generate_alerts
+
+
+# Sensor readings the alert rules and dashboards treat as numbers
+NUMERIC_FIELDS = ("pitch", "gyroY", "bodyTemp", "heartRate")
+
+
+# ===============================
+# Frame Validation
+# ===============================
+def normalize_frame(data):
+    """
+    Validate a telemetry frame and coerce its readings in place: numeric
+    fields become floats (numeric strings are accepted, null removes the
+    field) and isDrowsy a bool. Raises ValueError for anything else, so a
+    bad frame is rejected before it is spooled or evaluated.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Telemetry must be a JSON object")
+
+    for field in NUMERIC_FIELDS:
+        if field not in data:
+            continue
+        value = data[field]
+        if value is None:
+            del data[field]
+            continue
+        if isinstance(value, bool):
+            raise ValueError(f"{field} must be a number")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a number")
+        if not math.isfinite(value):
+            raise ValueError(f"{field} must be finite")
+        data[field] = value
+
+    if "isDrowsy" in data:
+        value = data["isDrowsy"]
+        if isinstance(value, str):
+            if value.lower() not in ("true", "false", "1", "0"):
+                raise ValueError("isDrowsy must be a boolean")
+            value = value.lower() in ("true", "1")
+        elif not isinstance(value, (bool, int)) and value is not None:
+            raise ValueError("isDrowsy must be a boolean")
+        data["isDrowsy"] = bool(value)
+
+    return data
+
+
+# ===============================
+# Frame Processing
+# ===============================
+def process_frame(device_id, data, idempotency_key=None, alerts=None):
+    """
+    Forward one telemetry frame to the backends:
+    RTDB live node, drowsy_events and alerts.
+
+    Without an idempotency key this is the original best-effort request
+    path. With one (spool replay) event/alert IDs are derived from the key
+    and failures propagate, so the replayer can retry the same frame.
+    alerts skips re-running the rules on an already evaluated frame.
+    """
+    # Push to Firebase Realtime DB
+    get_live_ref(device_id).update(data)
+
+    timestamp = frame_timestamp(data)
+
+    # -------- Analytics --------
+    if data.get("isDrowsy"):
+        if idempotency_key:
+            save_drowsiness_event(device_id, data, timestamp, event_id=idempotency_key)
+        else:
+            log_drowsiness_event(device_id, data, timestamp)
+
+    # -------- Alerts --------
+    return generate_alerts(device_id, data, timestamp, idempotency_key, alerts)
+
+
+def frame_timestamp(data):
+    """
+    The frame's serverTime as an aware datetime (None if not stamped)
+    """
+    if data.get("serverTime"):
+        return datetime.fromtimestamp(data["serverTime"], tz=timezone.utc)
+    return None
@@ -1,7 +1,7 @@
 # backend/services/work_hours.py
 
 from datetime import datetime, timezone
-from services.firebase import get_device_ref, safe_get
+from services.firebase import get_device_ref, get_rtdb, safe_get
 
 
 # ===============================
@@ -36,9 +36,81 @@ def _load_rtdb_history(device_id):
     return {}
 
 
+def _normalize_session(sid, raw, now):
+    """
+    One RTDB history entry as a session dict, or None if it is not one
+    """
+    if not isinstance(raw, dict):
+        return None
+
+    start_dt = _parse_rtdb_timestamp(raw.get("startTime"))
+    end_dt = _parse_rtdb_timestamp(raw.get("endTime")) if raw.get("endTime") else None
+    active = bool(raw.get("active", False))
+
+    duration_seconds = 0.0
+    try:
+        if "finalDuration" in raw:
+            duration_seconds = float(raw["finalDuration"])
+        elif "duration" in raw:
+            duration_seconds = float(raw["duration"])
+        elif start_dt:
+            end_for_duration = end_dt or now
+            duration_seconds = max((end_for_duration - start_dt).total_seconds(), 0.0)
+    except Exception:
+        duration_seconds = 0.0
+
+    return {
+        "id": sid,
+        "start_time": start_dt,
+        "end_time": end_dt,
+        "active": active,
+        "duration_seconds": duration_seconds,
+        # Kept for template compatibility; RTDB does not track this per-session.
+        "total_drowsy_events": 0,
+    }
+
+
+def normalize_summary(key, raw):
+    """
+    One sessionizer summary (/devices/{id}/sessions) as a session dict
+    """
+    if not isinstance(raw, dict):
+        return None
+
+    start_dt = _parse_rtdb_timestamp(raw.get("startTime"))
+    end_dt = _parse_rtdb_timestamp(raw.get("endTime")) if raw.get("endTime") else None
+    active = end_dt is None
+
+    try:
+        if "duration" in raw:
+            duration_seconds = float(raw["duration"])
+        else:
+            # Open session: up to its last frame, never "now"
+            last_dt = _parse_rtdb_timestamp(raw.get("lastSeen"))
+            duration_seconds = max((last_dt - start_dt).total_seconds(), 0.0) if last_dt and start_dt else 0.0
+    except Exception:
+        duration_seconds = 0.0
+
+    return {
+        "id": key,
+        "start_time": start_dt,
+        "end_time": end_dt,
+        "active": active,
+        "duration_seconds": duration_seconds,
+        "total_drowsy_events": int(raw.get("drowsyEvents", 0) or 0),
+        "total_alerts": int(raw.get("alerts", 0) or 0),
+    }
+
+
+def _load_session_summaries(device_id):
+    summaries = safe_get(get_device_ref(device_id).child("sessions"), {}) or {}
+    return summaries if isinstance(summaries, dict) else {}
+
+
 def get_rtdb_sessions(device_id):
     """
-    Return a normalized list of sessions from RTDB history.
+    Return a normalized list of sessions: the sessionizer's summaries
+    when the device has them, otherwise sessions from RTDB history.
 
     Each session dict contains:
         - id: RTDB key
@@ -47,43 +119,78 @@ def get_rtdb_sessions(device_id):
         - active: bool
         - duration_seconds: float
     """
+    summaries = _load_session_summaries(device_id)
+    if summaries:
+        return [
+            session for session in (normalize_summary(k, v) for k, v in summaries.items())
+            if session
+        ]
+
     history = _load_rtdb_history(device_id)
     sessions = []
     now = datetime.now(timezone.utc)
 
     for sid, raw in history.items():
-        if not isinstance(raw, dict):
-            continue
+        session = _normalize_session(sid, raw, now)
+        if session:
+            sessions.append(session)
 
-        start_dt = _parse_rtdb_timestamp(raw.get("startTime"))
-        end_dt = _parse_rtdb_timestamp(raw.get("endTime")) if raw.get("endTime") else None
-        active = bool(raw.get("active", False))
+    return sessions
 
-        duration_seconds = 0.0
-        try:
-            if "finalDuration" in raw:
-                duration_seconds = float(raw["finalDuration"])
-            elif "duration" in raw:
-                duration_seconds = float(raw["duration"])
-            elif start_dt:
-                end_for_duration = end_dt or now
-                duration_seconds = max((end_for_duration - start_dt).total_seconds(), 0.0)
-        except Exception:
-            duration_seconds = 0.0
-
-        sessions.append(
-            {
-                "id": sid,
-                "start_time": start_dt,
-                "end_time": end_dt,
-                "active": active,
-                "duration_seconds": duration_seconds,
-                # Kept for template compatibility; RTDB does not track this per-session.
-                "total_drowsy_events": 0,
-            }
-        )
 
-    return sessions
+def iter_rtdb_sessions(device_id, limit=None, page_size=20):
+    """
+    Yield normalized sessions newest first (by key), reading the
+    sessionizer's summaries, or /history for devices without them, one
+    page at a time instead of in full.
+    """
+    summaries_ref = get_device_ref(device_id).child("sessions")
+    if summaries_ref.order_by_key().limit_to_last(1).get():
+        history_ref = summaries_ref
+        now = None
+        normalize = lambda sid, raw, _: normalize_summary(sid, raw)
+    else:
+        history_ref = get_device_ref(device_id).child("history")
+        now = datetime.now(timezone.utc)
+        normalize = _normalize_session
+    end_key = None
+    yielded = 0
+
+    while limit is None or yielded < limit:
+        # end_at is inclusive, so each later page re-reads its boundary key
+        query = history_ref.order_by_key()
+        if end_key is not None:
+            query = query.end_at(end_key)
+        page = query.limit_to_last(page_size + (1 if end_key else 0)).get() or {}
+
+        keys = sorted(page, reverse=True)
+        if end_key is not None:
+            keys = [k for k in keys if k != end_key]
+        if not keys:
+            return
+
+        for sid in keys:
+            session = normalize(sid, page[sid], now)
+            if session:
+                yield session
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+
+        if len(keys) < page_size:
+            return
+        end_key = keys[-1]
+
+
+def get_archived_worked_seconds(device_id):
+    """
+    Worked seconds of sessions the retention job moved to /archive/{device_id}.
+    """
+    summary_ref = get_rtdb().child("archive").child(device_id).child("summary").child("worked_seconds")
+    try:
+        return float(safe_get(summary_ref, 0.0) or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
 
 
 # ===============================
@@ -91,11 +198,13 @@ def get_rtdb_sessions(device_id):
 # ===============================
 def get_total_worked_hours(device_id):
     """
-    Calculate total worked hours using RTDB session history.
+    Calculate total worked hours using RTDB session history
+    plus the totals of sessions that were already archived.
     """
     try:
         sessions = get_rtdb_sessions(device_id)
         total_seconds = sum(s.get("duration_seconds", 0.0) for s in sessions)
+        total_seconds += get_archived_worked_seconds(device_id)
         return round(total_seconds / 3600.0, 2)
     except Exception as e:
         print(f"ERROR calculating total worked hours from RTDB: {e}")
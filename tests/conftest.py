@@ -0,0 +1,13 @@
+# backend/tests/conftest.py
+
+import pytest
+
+from tests.fakes import install
+
+
+@pytest.fixture
+def fake_firebase(monkeypatch):
+    """
+    (rtdb_root, firestore) fakes installed into services.firebase
+    """
+    return install(monkeypatch)
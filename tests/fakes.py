@@ -0,0 +1,297 @@
+# backend/tests/fakes.py
+
+# In-memory Firestore for unit tests: enough of the client API for the
+# service code (queries, batches, preconditions, sentinels) to run
+# unchanged. RTDB reuses the benchmark fake.
+
+import itertools
+from datetime import datetime, timezone, timedelta
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1.transforms import Increment, SERVER_TIMESTAMP, DELETE_FIELD
+
+import services.firebase as firebase
+from benchmarks.fake_firebase import FakeReference
+
+_ids = itertools.count()
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": lambda a, b: a in b,
+}
+
+
+def _normalize(value):
+    """
+    Naive datetimes are UTC, as in Firestore
+    """
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _sort_value(snapshot, field):
+    # "__name__" is the document ID
+    return snapshot.id if field == "__name__" else _normalize(snapshot._data[field])
+
+
+def _is_after(snapshot, cursor, order):
+    for field, descending in order + [("__name__", False)]:
+        a, b = _sort_value(snapshot, field), _sort_value(cursor, field)
+        if a != b:
+            return a < b if descending else a > b
+    return False
+
+
+class Snapshot:
+    def __init__(self, reference, data, update_time):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = update_time
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class _WriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class Document:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name):
+        return Collection(self.db, self.path + (name,))
+
+    def collections(self):
+        names = {p[len(self.path)] for p in self.db.docs if len(p) > len(self.path) + 1 and p[:len(self.path)] == self.path}
+        return [Collection(self.db, self.path + (name,)) for name in sorted(names)]
+
+    def get(self):
+        data, update_time = self.db.docs.get(self.path, (None, None))
+        return Snapshot(self, data, update_time)
+
+    def set(self, data, merge=False):
+        self.db.commit([("set", self, data, merge)])
+
+    def create(self, data):
+        self.db.commit([("create", self, data, None)])
+
+    def update(self, data, option=None):
+        self.db.commit([("update", self, data, option)])
+
+    def delete(self):
+        self.db.commit([("delete", self, None, None)])
+
+
+class Query:
+    def __init__(self, db, path, filters=(), order=(), limit=None, after=None, start=None):
+        self.db = db
+        self.path = path
+        self._filters = list(filters)
+        self._order = list(order)
+        self._limit = limit
+        self._after = after
+        self._start = start
+
+    def _copy(self, **changes):
+        fields = dict(filters=self._filters, order=self._order, limit=self._limit,
+                      after=self._after, start=self._start)
+        fields.update(changes)
+        return Query(self.db, self.path, **fields)
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(order=self._order + [(field, direction == "DESCENDING")])
+
+    def limit(self, n):
+        return self._copy(limit=n)
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot)
+
+    def start_at(self, value):
+        return self._copy(start=value)
+
+    def count(self):
+        return _Count(self)
+
+    def _matches(self):
+        snapshots = []
+        for path, (data, update_time) in self.db.docs.items():
+            if path[:-1] != self.path:
+                continue
+            if not all(f in data and _OPS[op](_normalize(data[f]), _normalize(v)) for f, op, v in self._filters):
+                continue
+            # Firestore leaves out documents without the ordered field
+            if not all(f in data or f == "__name__" for f, _ in self._order):
+                continue
+            snapshots.append(Snapshot(Document(self.db, path), data, update_time))
+
+        snapshots.sort(key=lambda s: s.id)
+        for field, descending in reversed(self._order):
+            snapshots.sort(key=lambda s: _sort_value(s, field), reverse=descending)
+
+        if self._start is not None and self._order:
+            field, _ = self._order[0]
+            snapshots = [s for s in snapshots if _sort_value(s, field) >= _normalize(self._start)]
+        if self._after is not None:
+            # A cursor is a position in the ordering, so it still works
+            # after its document changed or left the result set
+            snapshots = [s for s in snapshots if _is_after(s, self._after, self._order)]
+        if self._limit is not None:
+            snapshots = snapshots[:self._limit]
+        self.db.reads += len(snapshots)
+        return snapshots
+
+    def stream(self):
+        return iter(self._matches())
+
+    def get(self):
+        return self._matches()
+
+
+class _Aggregate:
+    def __init__(self, value):
+        self.value = value
+
+
+class _Count:
+    def __init__(self, query):
+        self.query = query
+
+    def get(self):
+        return [[_Aggregate(len(self.query._matches()))]]
+
+
+class Collection(Query):
+    def __init__(self, db, path):
+        super().__init__(db, path)
+        self.id = path[-1]
+
+    def document(self, doc_id=None):
+        return Document(self.db, self.path + (doc_id or f"auto{next(_ids):06d}",))
+
+
+class Batch:
+    def __init__(self, db):
+        self.db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(("set", ref, data, merge))
+
+    def create(self, ref, data):
+        self._ops.append(("create", ref, data, None))
+
+    def update(self, ref, data, option=None):
+        self._ops.append(("update", ref, data, option))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None, None))
+
+    def commit(self):
+        self.db.commit(self._ops)
+        self._ops = []
+
+
+def _apply(base, current, data, deep, now):
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            base.pop(key, None)
+            continue
+        if value is SERVER_TIMESTAMP:
+            value = now
+        elif isinstance(value, Increment):
+            value = (current.get(key) or 0) + value.value
+        elif isinstance(value, dict):
+            existing = current.get(key) if deep and isinstance(current.get(key), dict) else {}
+            nested = dict(existing)
+            _apply(nested, existing, value, deep, now)
+            value = nested
+        base[key] = value
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}        # path tuple -> (data, update_time)
+        self.reads = 0
+        self.commits = 0
+        self._clock = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def _now(self):
+        self._clock = max(self._clock + timedelta(microseconds=1), datetime.now(timezone.utc))
+        return self._clock
+
+    def collection(self, name):
+        return Collection(self, (name,))
+
+    def batch(self):
+        return Batch(self)
+
+    def write_option(self, last_update_time=None):
+        return _WriteOption(last_update_time)
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+    def commit(self, ops):
+        """
+        All-or-nothing, like a WriteBatch: preconditions first, then writes
+        """
+        for kind, ref, data, option in ops:
+            existing = self.docs.get(ref.path)
+            if kind == "create" and existing:
+                raise google_exceptions.Conflict(f"Document already exists: {'/'.join(ref.path)}")
+            if kind == "update":
+                if not existing:
+                    raise google_exceptions.NotFound(f"No document to update: {'/'.join(ref.path)}")
+                if option and option.last_update_time != existing[1]:
+                    raise google_exceptions.FailedPrecondition("Document changed since it was read")
+
+        now = self._now()
+        for kind, ref, data, merge in ops:
+            if kind == "delete":
+                self.docs.pop(ref.path, None)
+                continue
+            current = dict(self.docs[ref.path][0]) if ref.path in self.docs else {}
+            base = current if kind == "update" or (kind == "set" and merge) else {}
+            # set(merge=True) merges nested maps; update() replaces them
+            _apply(base, current, data, kind == "set" and merge, now)
+            self.docs[ref.path] = (base, now)
+        self.commits += 1
+
+    def data(self, collection):
+        """
+        {doc_id: data} for a top-level collection
+        """
+        return {path[1]: data for path, (data, _) in self.docs.items() if len(path) == 2 and path[0] == collection}
+
+
+def install(monkeypatch, rtdb_data=None):
+    """
+    Point services.firebase at fresh fakes; returns (rtdb_root, firestore)
+    """
+    root = rtdb_data if rtdb_data is not None else {}
+    db = FakeFirestore()
+    monkeypatch.setattr(firebase, "_rtdb", FakeReference(root))
+    monkeypatch.setattr(firebase, "_firestore", db)
+    return root, db
@@ -0,0 +1,29 @@
+# backend/tests/test_admission.py
+
+from services import admission
+from services.admission import AdmissionController, ADMITTED, SHED, CRITICAL, ROUTINE
+
+
+def test_classify_reuses_the_callers_alerts(monkeypatch):
+    def evaluate(*args):
+        raise AssertionError("the frame was already evaluated")
+
+    monkeypatch.setattr(admission, "evaluate_alerts", evaluate)
+    controller = AdmissionController()
+    assert controller.classify("helmet_01", {"pitch": 0.0}, alerts=[]) == ROUTINE
+    assert controller.classify("helmet_01", {"pitch": -40.0}, alerts=[{"type": "HEAD_DOWN"}]) == CRITICAL
+
+
+def test_routine_frames_are_rate_limited_but_critical_ones_are_not():
+    controller = AdmissionController(rate=0.001, burst=1)
+
+    first = controller.admit("helmet_01", {}, alerts=[])
+    assert first.status == ADMITTED
+    controller.release(first)
+
+    shed = controller.admit("helmet_01", {}, alerts=[])
+    assert shed.status == SHED and shed.reason == "rate_limited"
+
+    critical = controller.admit("helmet_01", {"isDrowsy": True}, alerts=[])
+    assert critical.status == ADMITTED and critical.priority == CRITICAL
+    controller.release(critical)
@@ -0,0 +1,102 @@
+# backend/tests/test_alerts.py
+
+from datetime import datetime, timezone
+
+import pytest
+
+from services import alerts
+from services.alerts import acknowledge_alerts, acknowledge_device_alerts, recount_unacknowledged
+
+
+def _alert(device_id, hour, acknowledged=False):
+    return {
+        "device_id": device_id,
+        "type": "HEAD_DOWN",
+        "timestamp": datetime(2025, 1, 10, hour),
+        "acknowledged": acknowledged,
+    }
+
+
+@pytest.fixture
+def db(fake_firebase):
+    _, db = fake_firebase
+    stored = {
+        "a08": _alert("helmet_01", 8),
+        "a09": _alert("helmet_01", 9),
+        "a10": _alert("helmet_01", 10),
+        "a11": _alert("helmet_01", 11, acknowledged=True),
+        "b09": _alert("helmet_02", 9),
+    }
+    for doc_id, alert in stored.items():
+        db.collection("alerts").document(doc_id).set(alert)
+    recount_unacknowledged("helmet_01")
+    recount_unacknowledged("helmet_02")
+    return db
+
+
+def _unacknowledged(db, device_id):
+    return db.data("alert_counters")[device_id]["unacknowledged"]
+
+
+def _acknowledged_ids(db):
+    return sorted(doc_id for doc_id, alert in db.data("alerts").items() if alert["acknowledged"])
+
+
+def test_acknowledge_by_id_decrements_each_device_once(db):
+    assert acknowledge_alerts(["a08", "b09", "a11", "missing"]) == 2
+    assert _acknowledged_ids(db) == ["a08", "a11", "b09"]
+    assert _unacknowledged(db, "helmet_01") == 2
+    assert _unacknowledged(db, "helmet_02") == 0
+
+    # Acknowledging again changes nothing
+    assert acknowledge_alerts(["a08"]) == 0
+    assert _unacknowledged(db, "helmet_01") == 2
+
+
+def test_acknowledge_device_alerts_in_a_time_range(db):
+    # Aware bounds are compared as UTC with the naive stored timestamps
+    start = datetime(2025, 1, 10, 9, tzinfo=timezone.utc)
+    end = datetime(2025, 1, 10, 10)
+    assert acknowledge_device_alerts("helmet_01", start, end) == 1
+    assert _acknowledged_ids(db) == ["a09", "a11"]
+    assert _unacknowledged(db, "helmet_01") == 2
+
+
+def test_acknowledge_all_pages_through_the_device(db, monkeypatch):
+    monkeypatch.setattr(alerts, "ACK_CHUNK_SIZE", 1)
+    assert acknowledge_device_alerts("helmet_01") == 3
+    assert _acknowledged_ids(db) == ["a08", "a09", "a10", "a11"]
+    assert _unacknowledged(db, "helmet_01") == 0
+    assert _unacknowledged(db, "helmet_02") == 1
+
+
+def test_concurrent_ack_is_retried_not_double_counted(db, monkeypatch):
+    get_all = db.get_all
+    raced = []
+
+    def get_all_then_race(refs):
+        snapshots = get_all(refs)
+        if not raced:
+            # Another request acknowledges a09 between our read and commit
+            raced.append(True)
+            acknowledge_alerts(["a09"])
+        return snapshots
+
+    monkeypatch.setattr(db, "get_all", get_all_then_race)
+    assert acknowledge_alerts(["a08", "a09", "a10"]) == 2
+    assert _acknowledged_ids(db) == ["a08", "a09", "a10", "a11"]
+    assert _unacknowledged(db, "helmet_01") == 0
+
+
+def test_ack_gives_up_after_repeated_conflicts(db, monkeypatch):
+    get_all = db.get_all
+
+    def always_raced(refs):
+        snapshots = get_all(refs)
+        db.collection("alerts").document("a08").update({"note": "touched"})
+        return snapshots
+
+    monkeypatch.setattr(db, "get_all", always_raced)
+    with pytest.raises(Exception, match="changed since it was read"):
+        acknowledge_alerts(["a08"])
+    assert _unacknowledged(db, "helmet_01") == 3
@@ -0,0 +1,142 @@
+# backend/tests/test_api.py
+
+import pytest
+from flask import Flask
+
+from routes.api import api_bp
+from services.spool import SpoolUnavailable
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config["DEVICE_ID"] = "helmet_01"
+    app.register_blueprint(api_bp, url_prefix="/api")
+    return app.test_client()
+
+
+def test_malformed_frame_is_rejected_before_the_spool(client, monkeypatch):
+    def spool():
+        raise AssertionError("a bad frame must not reach the spool")
+
+    monkeypatch.setattr("routes.api.get_spool", spool)
+    response = client.post("/api/telemetry", json={"pitch": "bad", "isDrowsy": False})
+    assert response.status_code == 400
+    assert "pitch" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("device_id", ["helmet_01/history/-Nx", "", "a" * 33, "helmet 01", "<b>"])
+def test_invalid_device_id_header_is_rejected(client, monkeypatch, device_id):
+    def evaluate(*args, **kwargs):
+        raise AssertionError("a bad device ID must not reach the rules")
+
+    monkeypatch.setattr("routes.api.evaluate_alerts", evaluate)
+    response = client.post(
+        "/api/telemetry", json={"pitch": "-5", "isDrowsy": False}, headers={"X-Device-Id": device_id}
+    )
+    assert response.status_code == 400
+    assert "X-Device-Id" in response.get_json()["error"]
+
+
+def test_frame_is_evaluated_once(client, monkeypatch):
+    calls = []
+
+    def evaluate(device_id, frame, timestamp=None, thresholds=None):
+        calls.append(frame)
+        return []
+
+    forwarded = []
+    monkeypatch.setattr("routes.api.evaluate_alerts", evaluate)
+    monkeypatch.setattr("services.admission.evaluate_alerts", evaluate)
+    monkeypatch.setattr("services.alerts.evaluate_alerts", evaluate)
+    monkeypatch.setattr("routes.api.get_spool", lambda: None)
+    monkeypatch.setattr("routes.api.process_frame", lambda device_id, data, alerts=None: forwarded.append(alerts))
+
+    response = client.post("/api/telemetry", json={"pitch": "-5", "isDrowsy": False})
+    assert response.status_code == 200
+    assert len(calls) == 1
+    assert forwarded == [[]]
+
+
+def test_spool_failure_falls_back_to_a_keyed_direct_forward(client, monkeypatch):
+    class FailingSpool:
+        def append(self, device_id, frame):
+            raise SpoolUnavailable("Spool record not durable: EIO", "abc123-7")
+
+    forwarded = []
+    monkeypatch.setattr("routes.api.evaluate_alerts", lambda *args, **kwargs: [])
+    monkeypatch.setattr("routes.api.get_spool", FailingSpool)
+    monkeypatch.setattr(
+        "routes.api.process_frame",
+        lambda device_id, data, idempotency_key=None, alerts=None: forwarded.append(idempotency_key),
+    )
+
+    response = client.post("/api/telemetry", json={"pitch": "-5", "isDrowsy": False})
+    assert response.status_code == 200
+    assert forwarded == ["abc123-7"]
+
+
+def test_fleet_returns_json_error_on_cold_cache_failure(client, monkeypatch):
+    def down():
+        raise ConnectionError("RTDB unreachable")
+
+    monkeypatch.setattr("services.fleet._cache", {"data": None, "expires": 0.0})
+    monkeypatch.setattr("services.fleet.list_device_ids", down)
+    response = client.get("/api/fleet")
+    assert response.status_code == 503
+    assert response.get_json() == {"error": "Fleet status unavailable"}
+
+
+def test_fleet_serves_stale_snapshot_when_refresh_fails(client, monkeypatch):
+    def down():
+        raise ConnectionError("RTDB unreachable")
+
+    monkeypatch.setattr("services.fleet._cache", {"data": {"devices": []}, "expires": 0.0})
+    monkeypatch.setattr("services.fleet.list_device_ids", down)
+    response = client.get("/api/fleet")
+    assert response.status_code == 200
+    assert response.get_json() == {"devices": []}
+
+
+@pytest.mark.parametrize("ids", ["a1", [1, 2], ["a1", ""], ["a1", None], ["alerts/a1"]])
+def test_acknowledge_rejects_ids_that_are_not_alert_ids(client, monkeypatch, ids):
+    def acknowledge(alert_ids):
+        raise AssertionError("invalid IDs must not reach Firestore")
+
+    monkeypatch.setattr("routes.api.acknowledge_alerts", acknowledge)
+    response = client.post("/api/alerts/acknowledge", json={"ids": ids})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "ids must be a list of alert ID strings"
+
+
+def test_acknowledge_by_ids(client, fake_firebase):
+    _, db = fake_firebase
+    db.collection("alerts").document("a1").set({"device_id": "helmet_01", "acknowledged": False})
+
+    response = client.post("/api/alerts/acknowledge", json={"ids": ["a1"]})
+    assert response.status_code == 200
+    assert response.get_json()["acknowledged"] == 1
+    assert response.get_json()["unacknowledged"] == 0
+
+
+def test_acknowledge_rejects_a_bad_timestamp(client):
+    response = client.post("/api/alerts/acknowledge", json={"start": "yesterday"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid timestamp"
+
+
+@pytest.mark.parametrize("value, limit", [("abc", 20), ("-5", 1), ("0", 1), ("7", 7), ("1000", 200)])
+def test_notification_dead_letter_limit_is_parsed_and_clamped(client, monkeypatch, value, limit):
+    class Dispatcher:
+        class dead_letters:
+            @staticmethod
+            def recent(n):
+                return [n]
+
+        def status(self):
+            return {}
+
+    monkeypatch.setattr("routes.api.get_notification_dispatcher", Dispatcher)
+    response = client.get(f"/api/notifications?dead_letters={value}")
+    assert response.status_code == 200
+    assert response.get_json()["dead_letters"] == [limit]
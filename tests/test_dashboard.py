@@ -0,0 +1,126 @@
+# backend/tests/test_dashboard.py
+
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from flask import Flask, template_rendered
+
+from routes.dashboard import dashboard_bp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def client():
+    app = Flask(
+        __name__,
+        root_path=ROOT,
+        template_folder=os.path.join(ROOT, "templates"),
+        static_folder=os.path.join(ROOT, "static"),
+    )
+    app.config["DEVICE_ID"] = "helmet_01"
+    app.register_blueprint(dashboard_bp)
+    return app.test_client()
+
+
+@pytest.fixture
+def rendered(client):
+    templates = []
+
+    def record(sender, template, context, **extra):
+        templates.append(template.name)
+
+    template_rendered.connect(record)
+    yield templates
+    template_rendered.disconnect(record)
+
+
+def _page(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.is_streamed
+    return response.get_data(as_text=True)
+
+
+# ===============================
+# Drowsiness History
+# ===============================
+def test_history_streams_events_and_fills_the_counts(client, fake_firebase, rendered):
+    _, db = fake_firebase
+    now = datetime.now()
+    events = {
+        "e1": {"device_id": "helmet_01", "timestamp": now - timedelta(days=2), "pitch": -31},
+        "e2": {"device_id": "helmet_01", "timestamp": now, "pitch": -42, "motorState": "OFF"},
+        "e3": {"device_id": "helmet_02", "timestamp": now, "pitch": -50},
+    }
+    for doc_id, event in events.items():
+        db.collection("drowsy_events").document(doc_id).set(event)
+
+    body = _page(client, "/drowsiness-history")
+
+    assert "Recent Events" in body
+    assert body.count('class="event-card"') == 2
+    # Newest first
+    assert body.index("-42°") < body.index("-31°")
+    assert "Motor State: OFF" in body
+    assert "No Drowsiness Events" not in body
+    # The counts are only known after the rows, so the script at the end sets them
+    assert "getElementById('totalEvents').textContent = '2'" in body
+    assert "getElementById('todayEvents').textContent = '1'" in body
+    assert rendered == ["drowsiness_history.html"]
+
+
+def test_history_without_events_shows_the_empty_state(client, fake_firebase):
+    body = _page(client, "/drowsiness-history")
+
+    assert "No Drowsiness Events" in body
+    assert "Recent Events" not in body
+    assert "getElementById('totalEvents').textContent = '0'" in body
+
+
+def test_history_read_failure_still_renders_the_page(client, fake_firebase, monkeypatch):
+    def down(device_id, limit):
+        raise ConnectionError("Firestore unreachable")
+        yield
+
+    monkeypatch.setattr("routes.dashboard._drowsy_event_pages", down)
+    body = _page(client, "/drowsiness-history")
+
+    assert "No Drowsiness Events" in body
+    assert body.rstrip().endswith("</html>")
+
+
+# ===============================
+# Session History
+# ===============================
+def _ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def test_sessions_stream_newest_first_with_totals(client, fake_firebase, rendered):
+    root, _ = fake_firebase
+    start = datetime(2025, 1, 10, 8, 0, tzinfo=timezone.utc)
+    root["devices"] = {"helmet_01": {"history": {
+        "-N1": {"startTime": _ms(start), "endTime": _ms(start + timedelta(hours=2)), "active": False},
+        "-N2": {"startTime": _ms(start + timedelta(days=1)), "endTime": _ms(start + timedelta(days=1, hours=1)), "active": False},
+    }}}
+
+    body = _page(client, "/sessions")
+
+    assert "Recent Sessions" in body
+    assert "No Session Data" not in body
+    assert body.count('class="session-card') == 2
+    assert body.index("11 Jan 2025") < body.index("10 Jan 2025")
+    assert "getElementById('totalSessions').textContent = '2'" in body
+    assert "getElementById('totalHours').textContent = '3.0'" in body
+    assert rendered == ["sessions.html"]
+
+
+def test_sessions_without_history_show_the_empty_state(client, fake_firebase):
+    body = _page(client, "/sessions")
+
+    assert "No Session Data" in body
+    assert "Recent Sessions" not in body
+    assert "getElementById('totalSessions').textContent = '0'" in body
+    assert "getElementById('totalHours').textContent = '0.0'" in body
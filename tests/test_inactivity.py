@@ -0,0 +1,132 @@
+# backend/tests/test_inactivity.py
+
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from services.alerts import save_alerts, acknowledge_alerts, create_alert
+from services.inactivity import InactivityMonitor, inactive_alert_id
+
+
+@pytest.fixture
+def monitor():
+    return InactivityMonitor(threshold_minutes=1)
+
+
+@pytest.fixture
+def no_notify(monkeypatch):
+    monkeypatch.setattr("services.alerts.notifications.notify", lambda alerts, ids: None)
+
+
+def test_device_expires_at_its_deadline(monitor):
+    now = int(time.time())
+    monitor.touch("helmet_01", now)
+
+    assert monitor._advance(now + 30) == ([], [])
+    assert monitor.is_inactive("helmet_01") is False
+
+    expired, _ = monitor._advance(now + 61)
+    assert expired == [("helmet_01", now)]
+    assert monitor.is_inactive("helmet_01") is True
+    assert monitor.status()["expired"] == 1
+
+
+def test_new_frame_moves_the_deadline(monitor):
+    now = int(time.time())
+    monitor.touch("helmet_01", now)
+    monitor.touch("helmet_01", now + 30)
+    # An out-of-order frame does not pull the deadline back
+    monitor.touch("helmet_01", now + 10)
+
+    assert monitor._advance(now + 61) == ([], [])
+    expired, _ = monitor._advance(now + 91)
+    assert expired == [("helmet_01", now + 30)]
+
+
+def test_late_frame_past_its_deadline_still_expires(monitor):
+    now = int(time.time())
+    monitor.touch("helmet_01", now - 120)
+    expired, _ = monitor._advance(now + 1)
+    assert expired == [("helmet_01", now - 120)]
+
+
+def test_recovery_clears_the_alert_this_worker_raised(monitor):
+    now = int(time.time())
+    monitor.touch("helmet_01", now)
+    monitor._advance(now + 61)
+
+    monitor.touch("helmet_01", now + 70)
+    _, cleared = monitor._advance(now + 71)
+    assert cleared == [inactive_alert_id("helmet_01", now)]
+    assert monitor.status()["recovered"] == 1
+
+
+def test_recovery_clears_an_alert_raised_by_another_worker(monitor, fake_firebase, no_notify):
+    _, db = fake_firebase
+    quiet_since = int(time.time()) - 700
+    alert_id = inactive_alert_id("helmet_01", quiet_since)
+    save_alerts([create_alert("helmet_01", "INACTIVE", "quiet", datetime.now(timezone.utc))], [alert_id])
+
+    # This worker never tracked the helmet; the state table knows its last frame
+    monitor.touch("helmet_01", quiet_since + 700, previous_seen=quiet_since)
+    _, cleared = monitor._advance(int(time.time()))
+    assert cleared == [alert_id]
+
+    assert acknowledge_alerts(cleared) == 1
+    assert db.data("alerts")[alert_id]["acknowledged"] is True
+
+
+def test_only_alerts_actually_created_are_counted(monitor, fake_firebase, no_notify):
+    _, db = fake_firebase
+    last_seen = int(time.time()) - 120
+    # Another worker already raised helmet_01's alert
+    save_alerts([create_alert("helmet_01", "INACTIVE", "quiet", datetime.now(timezone.utc))],
+                [inactive_alert_id("helmet_01", last_seen)])
+
+    monitor._raise_alerts([("helmet_01", last_seen), ("helmet_02", last_seen)])
+
+    assert monitor.status()["alerts_raised"] == 1
+    assert inactive_alert_id("helmet_02", last_seen) in db.data("alerts")
+    counters = db.data("alert_counters")
+    assert counters["helmet_01"]["unacknowledged"] == 1
+    assert counters["helmet_02"]["unacknowledged"] == 1
+
+
+def test_confirmation_reads_use_their_own_pool_in_batches(monitor, monkeypatch):
+    from services import inactivity
+
+    calls = []
+
+    def fan_out(tasks, executor=None):
+        calls.append((len(tasks), executor))
+        return {device_id: None for device_id in tasks}
+
+    monkeypatch.setattr(inactivity, "fan_out", fan_out)
+    monkeypatch.setattr(inactivity, "INACTIVITY_CONFIRM_BATCH", 2)
+    now = int(time.time()) - 120
+    expired = [(f"helmet_{i:02d}", now) for i in range(5)]
+    for device_id, _ in expired:
+        monitor.touch(device_id, now)
+    assert len(monitor._advance(int(time.time()) + 2)[0]) == 5
+
+    assert monitor._confirm(expired) == expired
+    assert [n for n, _ in calls] == [2, 2, 1]
+    assert {executor for _, executor in calls} == {inactivity._confirm_executor}
+
+
+def test_inactive_endpoint_uses_the_monitor_threshold(monitor, monkeypatch):
+    from flask import Flask
+    from routes.api import api_bp
+
+    app = Flask(__name__)
+    app.config["DEVICE_ID"] = "helmet_01"
+    app.register_blueprint(api_bp, url_prefix="/api")
+
+    # Quiet for 2 minutes: past this monitor's 1-minute threshold, not the 10-minute default
+    two_minutes_ago = int(time.time()) - 120
+    monkeypatch.setattr("routes.api.get_inactivity_monitor", lambda: monitor)
+    monkeypatch.setattr("routes.api._shared_state", lambda device_id: {"serverTime": two_minutes_ago})
+
+    response = app.test_client().get("/api/inactive")
+    assert response.get_json()["inactive"] is True
@@ -0,0 +1,81 @@
+# backend/tests/test_local_index.py
+
+from datetime import datetime, timezone
+
+from services import local_index
+from services.local_index import DeviceTimestampIndex
+from services.alerts import save_alerts, acknowledge_alerts
+
+
+def _alert(minute, **fields):
+    return {
+        "device_id": "helmet_01",
+        "type": "HEAD_DOWN",
+        "timestamp": datetime(2025, 1, 1, 8, minute, tzinfo=timezone.utc),
+        "acknowledged": False,
+        **fields,
+    }
+
+
+def _ids(index, limit=10):
+    return [doc["id"] for doc in index.latest("helmet_01", limit)]
+
+
+def _other_process_writes(db, doc_id, data):
+    db.collection("alerts").document(doc_id).set(local_index.with_write_time(data))
+
+
+def test_build_orders_by_timestamp(fake_firebase):
+    _, db = fake_firebase
+    for minute in (5, 1, 3):
+        _other_process_writes(db, f"a{minute}", _alert(minute))
+
+    index = DeviceTimestampIndex("alerts")
+    index.build()
+    assert index.ready
+    assert _ids(index) == ["a5", "a3", "a1"]
+    assert _ids(index, limit=2) == ["a5", "a3"]
+
+
+def test_catch_up_picks_up_late_frames_and_remote_acks(fake_firebase):
+    _, db = fake_firebase
+    _other_process_writes(db, "a5", _alert(5))
+    index = DeviceTimestampIndex("alerts")
+    index.build()
+
+    # A spool replay lands an older frame; another worker acknowledges one
+    _other_process_writes(db, "a1", _alert(1))
+    ref = db.collection("alerts").document("a5")
+    ref.update(local_index.with_write_time({"acknowledged": True}))
+
+    index.catch_up()
+    latest = index.latest("helmet_01", 10)
+    assert [doc["id"] for doc in latest] == ["a5", "a1"]
+    assert latest[0]["acknowledged"] is True
+
+
+def test_rebuild_drops_documents_deleted_elsewhere(fake_firebase):
+    _, db = fake_firebase
+    for minute in (1, 2):
+        _other_process_writes(db, f"a{minute}", _alert(minute))
+    index = DeviceTimestampIndex("alerts")
+    index.build()
+
+    db.collection("alerts").document("a1").delete()
+    index.catch_up()
+    assert _ids(index) == ["a2", "a1"]
+
+    index.build()
+    assert _ids(index) == ["a2"]
+
+
+def test_service_writes_carry_the_write_time(fake_firebase, monkeypatch):
+    _, db = fake_firebase
+    monkeypatch.setattr("services.alerts.notifications.notify", lambda alerts, ids: None)
+
+    save_alerts([_alert(1)], ["a1"])
+    assert isinstance(db.data("alerts")["a1"]["updated_at"], datetime)
+
+    written = db.data("alerts")["a1"]["updated_at"]
+    assert acknowledge_alerts(["a1"]) == 1
+    assert db.data("alerts")["a1"]["updated_at"] > written
@@ -0,0 +1,137 @@
+# backend/tests/test_notifications.py
+
+import threading
+import time
+
+import pytest
+
+from services import notifications
+from services.notifications import (
+    NotificationDispatcher, DeadLetterStore, WebhookChannel, make_stand_in,
+)
+
+
+@pytest.fixture(autouse=True)
+def fast_settings(monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFY_BATCH_LINGER", 0.05)
+    monkeypatch.setattr(notifications, "NOTIFY_BACKOFF_BASE", 0.05)
+    monkeypatch.setattr(notifications, "NOTIFY_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(notifications, "NOTIFY_TIMEOUT", 2)
+
+
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(**options):
+        server, received = make_stand_in(port=0, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/", received
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _dispatcher(url, tmp_path):
+    return NotificationDispatcher([WebhookChannel(url)], DeadLetterStore(str(tmp_path))).start()
+
+
+def _alerts(n):
+    alerts = [{"device_id": "helmet_01", "type": "HEAD_DOWN", "message": "m"} for _ in range(n)]
+    return alerts, [f"a{i}" for i in range(n)]
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def _destination(dispatcher):
+    return next(iter(dispatcher.status()["destinations"].values()))
+
+
+def test_batches_are_delivered(stand_in, tmp_path):
+    url, received = stand_in()
+    dispatcher = _dispatcher(url, tmp_path)
+
+    dispatcher.notify(*_alerts(3))
+    _wait_for(lambda: received["alerts"] == 3)
+
+    _wait_for(lambda: _destination(dispatcher)["delivered"] == 3)
+    assert received["requests"] == 1
+    assert _destination(dispatcher)["failures"] == 0
+
+
+def test_failed_batch_is_retried(stand_in, tmp_path):
+    url, received = stand_in(fail_first=2)
+    dispatcher = _dispatcher(url, tmp_path)
+
+    dispatcher.notify(*_alerts(2))
+    _wait_for(lambda: received["alerts"] == 2)
+
+    _wait_for(lambda: _destination(dispatcher)["delivered"] == 2)
+    status = _destination(dispatcher)
+    assert received["failed"] == 2
+    assert status["retries"] == 2
+    assert status["dead_lettered"] == 0
+
+
+def test_persistent_failure_is_dead_lettered(stand_in, tmp_path):
+    url, received = stand_in(fail_rate=1.0)
+    dispatcher = _dispatcher(url, tmp_path)
+
+    dispatcher.notify(*_alerts(2))
+    _wait_for(lambda: _destination(dispatcher)["dead_lettered"] == 2)
+
+    assert received["failed"] == notifications.NOTIFY_MAX_ATTEMPTS
+    [entry] = dispatcher.dead_letters.recent()
+    assert entry["attempts"] == notifications.NOTIFY_MAX_ATTEMPTS
+    assert entry["reason"] == "HTTP 503"
+    assert [a["id"] for a in entry["alerts"]] == ["a0", "a1"]
+
+
+def test_client_error_is_not_retried(stand_in, tmp_path):
+    url, received = stand_in(fail_rate=1.0, status=400)
+    dispatcher = _dispatcher(url, tmp_path)
+
+    dispatcher.notify(*_alerts(1))
+    _wait_for(lambda: _destination(dispatcher)["dead_lettered"] == 1)
+    assert received["failed"] == 1
+
+
+def test_rate_limit_spaces_requests_without_busy_waiting(stand_in, tmp_path, monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFY_BATCH_SIZE", 1)
+    monkeypatch.setattr(notifications, "NOTIFY_BURST", 1)
+    monkeypatch.setattr(notifications, "NOTIFY_RATE", 5.0)
+    url, received = stand_in()
+    dispatcher = _dispatcher(url, tmp_path)
+
+    flushes = []
+    flush = dispatcher._flush
+    monkeypatch.setattr(dispatcher, "_flush", lambda now: (flushes.append(now), flush(now)))
+
+    dispatcher.notify(*_alerts(4))
+    _wait_for(lambda: received["requests"] == 4)
+
+    times = received["times"]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 0.15
+    # Woken per token and per finished delivery, not every 10 ms
+    assert len(flushes) < 25
+
+
+def test_next_wait_waits_for_a_token(tmp_path, monkeypatch):
+    monkeypatch.setattr(notifications, "NOTIFY_BATCH_LINGER", 10)
+    dispatcher = NotificationDispatcher([WebhookChannel("http://127.0.0.1:9/")], DeadLetterStore(str(tmp_path)))
+    dest = dispatcher.destinations[0]
+    now = time.monotonic()
+    dest.tokens, dest.refilled = 0.0, now
+    dest.retry = ([], 2, now - 1)
+
+    assert dispatcher._next_wait(now) == pytest.approx(1 / notifications.NOTIFY_RATE)
@@ -0,0 +1,71 @@
+# backend/tests/test_profiler.py
+
+import threading
+import time
+
+from services import profiler
+from services.profiler import Sampler
+
+
+class _Request:
+    def __init__(self, headers=None, args=None):
+        self.headers = headers or {}
+        self.args = args or {}
+
+
+def test_is_authorized(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_TOKEN", "s3cret")
+    assert profiler.is_authorized(_Request(headers={"X-Profile-Token": "s3cret"}))
+    assert profiler.is_authorized(_Request(args={"profile_token": "s3cret"}))
+    assert not profiler.is_authorized(_Request(headers={"X-Profile-Token": "s3cre"}))
+    assert not profiler.is_authorized(_Request())
+
+    monkeypatch.setattr(profiler, "PROFILE_TOKEN", "")
+    assert not profiler.is_authorized(_Request(headers={"X-Profile-Token": ""}))
+
+
+def test_stacks_are_frozen_once_the_profile_stops():
+    sampler = Sampler(interval_ms=1)
+    done = threading.Event()
+    attached = threading.Event()
+    profile = sampler.start("test")
+
+    def fan_out_worker():
+        # A pool thread that outlives the request it was sampled for
+        sampler.attach(profile, threading.get_ident())
+        attached.set()
+        while not done.is_set():
+            sum(range(1000))
+        sampler.detach(threading.get_ident(), profile)
+
+    worker = threading.Thread(target=fan_out_worker)
+    worker.start()
+    try:
+        attached.wait(2)
+        deadline = time.monotonic() + 2
+        while sum(profile.stacks.values()) < 5 and time.monotonic() < deadline:
+            time.sleep(0.005)
+
+        sampler.stop(profile)
+        snapshot = dict(profile.stacks)
+        time.sleep(0.05)
+        assert dict(profile.stacks) == snapshot
+        assert snapshot
+    finally:
+        done.set()
+        worker.join()
+
+
+def test_save_profile_writes_index_entry(tmp_path):
+    sampler = Sampler(interval_ms=1)
+    profile = sampler.start("dashboard.dashboard")
+    deadline = time.monotonic() + 2
+    while not profile.stacks and time.monotonic() < deadline:
+        sum(range(1000))
+    sampler.stop(profile)
+
+    entry = profiler.save_profile(profile, 1, directory=str(tmp_path))
+    assert entry["samples"] == sum(profile.stacks.values())
+    assert profiler.list_profiles(directory=str(tmp_path)) == [entry]
+    for name in entry["files"]:
+        assert profiler.profile_path(name, directory=str(tmp_path))
@@ -0,0 +1,68 @@
+# backend/tests/test_replay.py
+
+import json
+
+from services.alerts import get_thresholds
+from services.replay import plan_chunks, process_chunk, write_results, run_replay
+
+
+def _write_ndjson(path, frames):
+    with open(path, "w") as f:
+        for frame in frames:
+            f.write((frame if isinstance(frame, str) else json.dumps(frame)) + "\n")
+    return str(path)
+
+
+def _frame(**fields):
+    return {"device_id": "helmet_01", "serverTime": 1735718400, "pitch": 0, "gyroY": 0, "bodyTemp": 36.5, **fields}
+
+
+def _run_chunks(path, write=True):
+    current = get_thresholds()
+    proposed = get_thresholds({"pitch": -10})
+    options = {"devices": None, "since": None, "until": None, "write": write}
+    outputs = [process_chunk((p, start, end, current, proposed, options)) for p, start, end in plan_chunks([path])]
+    assert len(outputs) == 1
+    return outputs[0]
+
+
+def test_bad_frames_are_rejected_not_fatal(tmp_path):
+    path = _write_ndjson(tmp_path / "t.ndjson", [
+        _frame(pitch=-15),
+        _frame(pitch="bad"),
+        "not json",
+        "[1, 2]",
+        _frame(pitch=-30),
+    ])
+    results, alerts, events, skipped, rejected = _run_chunks(path)
+
+    assert rejected == 1
+    assert skipped == 2
+    assert results["helmet_01"]["frames"] == 2
+    assert results["helmet_01"]["added"]["HEAD_DOWN"] == 1
+
+
+def test_frames_in_the_same_second_get_distinct_documents(tmp_path, fake_firebase):
+    _, db = fake_firebase
+    path = _write_ndjson(tmp_path / "t.ndjson", [
+        _frame(isDrowsy=True, pitch=-30),
+        _frame(isDrowsy=True, pitch=-31),
+    ])
+    results, alerts, events, _, _ = _run_chunks(path)
+
+    written = write_results(results, alerts, events)
+    assert written["alerts"] == 4 and written["events"] == 2
+    assert len(db.data("alerts")) == 4
+    assert len(db.data("drowsy_events")) == 2
+
+    # Re-running the same file overwrites the same documents
+    write_results(results, alerts, events)
+    assert len(db.data("alerts")) == 4
+    assert len(db.data("drowsy_events")) == 2
+
+
+def test_run_replay_counts_rejected_frames(tmp_path):
+    path = _write_ndjson(tmp_path / "t.ndjson", [_frame(), _frame(bodyTemp="hot")])
+    report = run_replay([path], {"pitch": -10}, workers=1)
+    assert report["frames"] == 1
+    assert report["rejected"] == 1
@@ -0,0 +1,160 @@
+# backend/tests/test_reports.py
+
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask
+
+from services import reports
+from services.reports import resolve_period, parse_period, build_device_reports, run_reports, load_report
+from services.sessionizer import session_key
+from routes.reports import reports_bp
+
+
+def _at(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+# ===============================
+# Periods
+# ===============================
+@pytest.mark.parametrize("alias, expected", [
+    ("this-week", "2025-W02"),
+    ("last-week", "2025-W01"),
+    ("this-month", "2025-01"),
+    ("last-month", "2024-12"),
+    ("2024-W52", "2024-W52"),
+    ("2024-07", "2024-07"),
+])
+def test_resolve_period(alias, expected):
+    assert resolve_period(alias, now=_at(2025, 1, 8, 12)) == expected
+
+
+@pytest.mark.parametrize("value", ["2025", "2025-1", "2025-13", "2025-W54", "W03", "next-week", ""])
+def test_resolve_period_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        resolve_period(value, now=_at(2025, 1, 8))
+
+
+def test_iso_week_spans_the_year_boundary():
+    week = parse_period("2025-W01")
+    assert week["start"] == _at(2024, 12, 30)
+    assert week["end"] == _at(2025, 1, 6)
+
+    month = parse_period("2024-12")
+    assert (month["start"], month["end"]) == (_at(2024, 12, 1), _at(2025, 1, 1))
+
+
+# ===============================
+# Building
+# ===============================
+def _data(**overrides):
+    data = {"sessions": [], "archived": {}, "events": [], "alerts": [], "compacted": {}}
+    data.update(overrides)
+    return data
+
+
+def test_report_counts_live_and_archived_activity():
+    week = parse_period("2025-W02")     # Mon 2025-01-06 .. Mon 2025-01-13
+    data = _data(
+        sessions=[
+            (_at(2025, 1, 7, 8).timestamp(), 4 * 3600),
+            (_at(2025, 1, 7, 14).timestamp(), 2 * 3600),
+            (_at(2025, 1, 20, 8).timestamp(), 3600),          # other week
+        ],
+        archived={"2025-01-06": {"sessions": 2, "worked_seconds": 6 * 3600}},
+        events=[_at(2025, 1, 7, 9, 15).timestamp(), _at(2025, 1, 7, 9, 45).timestamp()],
+        alerts=[(_at(2025, 1, 7, 9, 20).timestamp(), "HEAD_DOWN", True),
+                (_at(2025, 1, 7, 15).timestamp(), "HIGH_TEMP", False)],
+        compacted={"2025-01-06": {"drowsy_events": 4,
+                                  "alerts": {"total": 3, "acknowledged": 1, "by_type": {"HEAD_DOWN": 3}}}},
+    )
+    _, [report] = build_device_reports(("helmet_01", [week], data, _at(2025, 1, 9).timestamp()))
+
+    assert report["period"] == "2025-W02"
+    assert report["complete"] is False
+    assert report["hours_worked"] == 12.0
+    assert report["sessions"] == 4
+    assert report["drowsy_events"] == 6
+    assert report["drowsy_events_per_hour"] == 0.5
+    assert report["alerts"] == {"total": 5, "acknowledged": 2, "by_type": {"HEAD_DOWN": 4, "HIGH_TEMP": 1}}
+    assert report["peak_risk_hours"][0] == {"hour_utc": 9, "drowsy_events": 2, "alerts": 1}
+
+    daily = {row["date"]: row for row in report["daily"]}
+    assert len(daily) == 7
+    assert daily["2025-01-06"] == {"date": "2025-01-06", "hours_worked": 6.0, "sessions": 2,
+                                   "drowsy_events": 4, "alerts": 3}
+    assert daily["2025-01-07"]["sessions"] == 2
+    assert daily["2025-01-07"]["hours_worked"] == 6.0
+
+
+def test_report_is_complete_once_the_period_ends():
+    month = parse_period("2025-01")
+    _, [report] = build_device_reports(("helmet_01", [month], _data(), _at(2025, 2, 1).timestamp()))
+    assert report["complete"] is True
+    assert report["drowsy_events_per_hour"] is None
+    assert len(report["daily"]) == 31
+
+
+# ===============================
+# Runs and storage
+# ===============================
+def _session(root, start, hours):
+    start_ts = start.timestamp()
+    sessions = root.setdefault("devices", {}).setdefault("helmet_01", {}).setdefault("sessions", {})
+    sessions[session_key(start_ts)] = {
+        "startTime": int(start_ts * 1000),
+        "endTime": int((start_ts + hours * 3600) * 1000),
+        "duration": hours * 3600,
+        "active": False,
+    }
+
+
+def test_run_stores_only_changed_reports(fake_firebase):
+    root, db = fake_firebase
+    _session(root, _at(2025, 1, 7, 8), 4)
+    now = _at(2025, 1, 9, 12)
+
+    first = run_reports(now=now, kinds=("weekly",))
+    assert first["periods"] == ["2025-W01", "2025-W02"]
+    assert first["written"] == 2
+    assert load_report("helmet_01", "2025-W02")["hours_worked"] == 4.0
+
+    assert run_reports(now=now, kinds=("weekly",))["written"] == 0
+
+    _session(root, _at(2025, 1, 8, 8), 2)
+    assert run_reports(now=now, kinds=("weekly",))["written"] == 1
+    latest = load_report("helmet_01", "2025-W02")
+    assert (latest["version"], latest["hours_worked"]) == (2, 6.0)
+    assert load_report("helmet_01", "2025-W02", version=1)["hours_worked"] == 4.0
+
+
+def test_old_versions_are_pruned(fake_firebase, monkeypatch):
+    monkeypatch.setattr(reports, "REPORT_MAX_VERSIONS", 2)
+    root, db = fake_firebase
+    now = _at(2025, 1, 9, 12)
+
+    for day in (6, 7, 8):
+        _session(root, _at(2025, 1, day, 8), 1)
+        run_reports(now=now, kinds=("weekly",))
+
+    ref = db.collection("reports").document("helmet_01_2025-W02")
+    assert sorted(snap.id for snap in ref.collection("versions").stream()) == ["2", "3"]
+    assert load_report("helmet_01", "2025-W02", version=1) is None
+    assert load_report("helmet_01", "2025-W02")["version"] == 3
+
+
+def test_report_route_validates_version(fake_firebase):
+    root, _ = fake_firebase
+    _session(root, _at(2025, 1, 7, 8), 4)
+    run_reports(now=_at(2025, 1, 9, 12), kinds=("weekly",))
+
+    app = Flask(__name__)
+    app.register_blueprint(reports_bp)
+    client = app.test_client()
+
+    assert client.get("/reports/helmet_01/2025-W02?version=1").status_code == 200
+    assert client.get("/reports/helmet_01/2025-W02?version=abc").status_code == 400
+    assert client.get("/reports/helmet_01/2025-W02?version=0").status_code == 400
+    assert client.get("/reports/helmet_01/2025-W02?version=9").status_code == 404
+    assert client.get("/reports/helmet_01/not-a-period").status_code == 400
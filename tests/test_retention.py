@@ -0,0 +1,149 @@
+# backend/tests/test_retention.py
+
+from datetime import datetime, timezone
+
+import pytest
+
+from services import retention
+from services.retention import compact_collection, archive_device_sessions
+
+CUTOFF = datetime(2025, 2, 1, tzinfo=timezone.utc)
+OLD = datetime(2025, 1, 10, 8, 0, tzinfo=timezone.utc)
+RECENT = datetime(2025, 2, 5, 8, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def fast(monkeypatch):
+    monkeypatch.setattr(retention, "RETENTION_BATCH_PAUSE", 0)
+    monkeypatch.setattr(retention, "RETENTION_BATCH_SIZE", 2)
+
+
+def _alert(device_id, timestamp, alert_type="HEAD_DOWN", acknowledged=False):
+    return {"device_id": device_id, "type": alert_type, "timestamp": timestamp, "acknowledged": acknowledged}
+
+
+def _ms(dt):
+    return int(dt.timestamp() * 1000)
+
+
+def _session(start, minutes, active=False):
+    entry = {"startTime": _ms(start), "active": active}
+    if not active:
+        entry["endTime"] = _ms(start) + minutes * 60 * 1000
+    return entry
+
+
+# ===============================
+# Firestore Compaction
+# ===============================
+def test_alerts_are_summarized_deleted_and_uncounted(fake_firebase):
+    _, db = fake_firebase
+    alerts = {
+        "a1": _alert("helmet_01", OLD),
+        "a2": _alert("helmet_01", OLD, "HIGH_TEMP"),
+        "a3": _alert("helmet_01", OLD, acknowledged=True),
+        "a4": _alert("helmet_02", OLD),
+        "a5": _alert("helmet_01", RECENT),
+    }
+    for doc_id, alert in alerts.items():
+        db.collection("alerts").document(doc_id).set(alert)
+    db.collection("alert_counters").document("helmet_01").set(
+        {"device_id": "helmet_01", "unacknowledged": 3, "seeded": True}
+    )
+    db.collection("alert_counters").document("helmet_02").set(
+        {"device_id": "helmet_02", "unacknowledged": 1, "seeded": True}
+    )
+
+    # Three pages of RETENTION_BATCH_SIZE
+    assert compact_collection("alerts", CUTOFF) == 4
+
+    assert set(db.data("alerts")) == {"a5"}
+    summary = db.data("daily_summaries")["helmet_01_2025-01-10"]
+    assert summary["device_id"] == "helmet_01"
+    assert summary["date"] == "2025-01-10"
+    assert summary["alerts"] == {"total": 3, "acknowledged": 1, "by_type": {"HEAD_DOWN": 2, "HIGH_TEMP": 1}}
+    assert db.data("daily_summaries")["helmet_02_2025-01-10"]["alerts"]["total"] == 1
+
+    # Only the deleted unacknowledged alerts leave the badges
+    counters = db.data("alert_counters")
+    assert counters["helmet_01"]["unacknowledged"] == 1
+    assert counters["helmet_02"]["unacknowledged"] == 0
+
+
+def test_summaries_accumulate_across_runs(fake_firebase):
+    _, db = fake_firebase
+    db.collection("drowsy_events").document("e1").set({"device_id": "helmet_01", "timestamp": OLD})
+    assert compact_collection("drowsy_events", CUTOFF) == 1
+
+    # A spool replay lands another old event after the first run
+    db.collection("drowsy_events").document("e2").set({"device_id": "helmet_01", "timestamp": OLD})
+    db.collection("drowsy_events").document("e3").set({"device_id": "helmet_01", "timestamp": RECENT})
+    assert compact_collection("drowsy_events", CUTOFF) == 1
+
+    assert set(db.data("drowsy_events")) == {"e3"}
+    assert db.data("daily_summaries")["helmet_01_2025-01-10"]["drowsy_events"] == 2
+
+
+def test_nothing_to_compact(fake_firebase):
+    _, db = fake_firebase
+    db.collection("alerts").document("a1").set(_alert("helmet_01", RECENT))
+    assert compact_collection("alerts", CUTOFF) == 0
+    assert db.data("daily_summaries") == {}
+
+
+# ===============================
+# RTDB Session Archive
+# ===============================
+def _history(root):
+    return root["devices"]["helmet_01"]["history"]
+
+
+def test_archive_moves_closed_sessions_and_totals_them(fake_firebase):
+    root, _ = fake_firebase
+    root["devices"] = {"helmet_01": {"history": {
+        "-N1": _session(OLD, 60),
+        "-N2": _session(OLD, 30),
+        "-N3": _session(RECENT, 45),
+    }}}
+
+    archived, cursor = archive_device_sessions("helmet_01", CUTOFF)
+
+    assert (archived, cursor) == (2, "-N2")
+    assert set(_history(root)) == {"-N3"}
+    archive = root["archive"]["helmet_01"]
+    assert set(archive["history"]) == {"-N1", "-N2"}
+    assert archive["summary"]["worked_seconds"] == 90 * 60
+    assert archive["summary"]["daily"]["2025-01-10"] == {"sessions": 2, "worked_seconds": 90 * 60}
+
+
+def test_cursor_stops_before_an_open_session_so_it_is_revisited(fake_firebase):
+    root, _ = fake_firebase
+    root["devices"] = {"helmet_01": {"history": {
+        "-N1": _session(OLD, 60),
+        "-N2": _session(OLD, 0, active=True),
+        "-N3": _session(OLD, 30),
+        "-N4": _session(RECENT, 45),
+    }}}
+
+    archived, cursor = archive_device_sessions("helmet_01", CUTOFF)
+    assert (archived, cursor) == (2, "-N1")
+    assert set(_history(root)) == {"-N2", "-N4"}
+
+    # The open session ends later; the next run starts at the cursor and finds it
+    _history(root)["-N2"] = _session(OLD, 15)
+    archived, cursor = archive_device_sessions("helmet_01", CUTOFF, cursor)
+    assert (archived, cursor) == (1, "-N2")
+    assert set(_history(root)) == {"-N4"}
+
+    summary = root["archive"]["helmet_01"]["summary"]
+    assert summary["worked_seconds"] == (60 + 30 + 15) * 60
+    assert summary["daily"]["2025-01-10"]["sessions"] == 3
+
+
+def test_archive_without_count_moves_only(fake_firebase):
+    root, _ = fake_firebase
+    root["devices"] = {"helmet_01": {"history": {"-N1": _session(OLD, 60)}}}
+
+    assert archive_device_sessions("helmet_01", CUTOFF, count=False) == (1, "-N1")
+    assert "-N1" in root["archive"]["helmet_01"]["history"]
+    assert "summary" not in root["archive"]["helmet_01"]
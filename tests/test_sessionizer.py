@@ -0,0 +1,138 @@
+# backend/tests/test_sessionizer.py
+
+import pytest
+
+import services.firebase as firebase
+from services.sessionizer import Sessionizer, import_history, session_key
+
+T0 = 1736496000            # 2025-01-10 08:00 UTC
+GAP = 600
+
+
+@pytest.fixture
+def sessionizer():
+    return Sessionizer(gap=GAP)
+
+
+def _sessions(root, device_id="helmet_01"):
+    return root["devices"][device_id]["sessions"]
+
+
+def test_gap_closes_the_session_and_opens_a_new_one(fake_firebase, sessionizer):
+    root, _ = fake_firebase
+    sessionizer.observe("helmet_01", T0, drowsy=True, alerts=1)
+    sessionizer.observe("helmet_01", T0 + 60)
+    sessionizer.observe("helmet_01", T0 + 60 + GAP + 1, drowsy=True)
+    sessionizer.flush()
+
+    first = _sessions(root)[session_key(T0)]
+    assert first["startTime"] == T0 * 1000
+    assert first["endTime"] == (T0 + 60) * 1000
+    assert first["duration"] == 60
+    assert first["active"] is False
+    assert first["closeReason"] == "gap"
+    assert (first["frames"], first["drowsyEvents"], first["alerts"]) == (2, 1, 1)
+
+    second = _sessions(root)[session_key(T0 + 60 + GAP + 1)]
+    assert "endTime" not in second
+    assert (second["frames"], second["drowsyEvents"]) == (1, 1)
+    assert root["devices"]["helmet_01"]["current_session"] == session_key(T0 + 60 + GAP + 1)
+    assert sessionizer.stats["opened"] == 2
+    assert sessionizer.stats["closed"] == 1
+
+
+def test_late_frame_stays_in_the_current_session(fake_firebase, sessionizer):
+    root, _ = fake_firebase
+    sessionizer.observe("helmet_01", T0 + 100)
+    sessionizer.observe("helmet_01", T0 + 50)
+    sessionizer.flush()
+
+    assert list(_sessions(root)) == [session_key(T0 + 100)]
+    assert _sessions(root)[session_key(T0 + 100)]["frames"] == 2
+
+
+def test_stale_sweep_closes_the_session(fake_firebase, sessionizer):
+    root, _ = fake_firebase
+    sessionizer.observe("helmet_01", T0)
+    sessionizer.observe("helmet_01", T0 + 30)
+
+    assert sessionizer.expire(now=T0 + 30 + GAP) == []
+    assert sessionizer.expire(now=T0 + 31 + GAP) == [("helmet_01", T0, T0 + 30)]
+    sessionizer.flush()
+
+    summary = _sessions(root)[session_key(T0)]
+    assert summary["closeReason"] == "stale"
+    assert summary["endTime"] == (T0 + 30) * 1000
+    assert "current_session" not in root["devices"]["helmet_01"]
+
+    # The next frame starts a fresh session
+    sessionizer.observe("helmet_01", T0 + 40 + GAP)
+    sessionizer.flush()
+    assert root["devices"]["helmet_01"]["current_session"] == session_key(T0 + 40 + GAP)
+
+
+def test_failed_flush_is_requeued_without_losing_counts(fake_firebase, sessionizer, monkeypatch):
+    root, _ = fake_firebase
+    sessionizer.observe("helmet_01", T0, drowsy=True)
+    sessionizer.observe("helmet_01", T0 + 10, alerts=2)
+    sessionizer.flush()
+
+    sessionizer.observe("helmet_01", T0 + 20, drowsy=True)
+    sessionizer.observe("helmet_01", T0 + 20 + GAP + 1)
+
+    rtdb = firebase.get_rtdb()
+    update, down = rtdb.update, [True]
+
+    def flaky(updates):
+        if down[0]:
+            raise ConnectionError("RTDB unreachable")
+        update(updates)
+
+    monkeypatch.setattr(rtdb, "update", flaky)
+    with pytest.raises(ConnectionError):
+        sessionizer.flush()
+
+    # Frames keep arriving while the backend is down
+    sessionizer.observe("helmet_01", T0 + 30 + GAP, drowsy=True)
+    down[0] = False
+    sessionizer.flush()
+
+    first = _sessions(root)[session_key(T0)]
+    assert (first["frames"], first["drowsyEvents"], first["alerts"]) == (3, 2, 2)
+    assert first["closeReason"] == "gap"
+    second = _sessions(root)[session_key(T0 + 20 + GAP + 1)]
+    assert (second["frames"], second["drowsyEvents"]) == (2, 1)
+    assert second["lastSeen"] == (T0 + 30 + GAP) * 1000
+    assert sessionizer.status()["pending_sessions"] == 0
+
+
+def test_import_history_converts_helmet_sessions_once(fake_firebase):
+    root, _ = fake_firebase
+    root["devices"] = {"helmet_01": {"history": {
+        "-N1": {"startTime": T0 * 1000, "endTime": (T0 + 3600) * 1000, "active": False},
+        "-N2": {"startTime": (T0 + 7200) * 1000, "active": True, "duration": 900},
+    }}}
+
+    assert import_history("helmet_01") == 2
+    closed = _sessions(root)[session_key(T0)]
+    assert closed["duration"] == 3600
+    assert closed["closeReason"] == "imported"
+    assert closed["source"] == "-N1"
+    crashed = _sessions(root)[session_key(T0 + 7200)]
+    assert crashed["endTime"] == (T0 + 7200 + 900) * 1000
+    assert root["devices"]["helmet_01"]["sessions_imported"] is True
+
+    assert import_history("helmet_01") == 0
+
+
+def test_flush_imports_history_before_the_first_summary(fake_firebase, sessionizer):
+    root, _ = fake_firebase
+    root["devices"] = {"helmet_01": {"history": {
+        "-N1": {"startTime": T0 * 1000, "endTime": (T0 + 600) * 1000, "active": False},
+    }}}
+
+    sessionizer.observe("helmet_01", T0 + 86400)
+    sessionizer.flush()
+
+    assert set(_sessions(root)) == {session_key(T0), session_key(T0 + 86400)}
+    assert root["devices"]["helmet_01"]["sessions_imported"] is True
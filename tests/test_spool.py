@@ -0,0 +1,185 @@
+# backend/tests/test_spool.py
+
+import json
+import os
+import time
+
+import pytest
+
+import services.spool as spool_module
+from services.spool import TelemetrySpool, SpoolUnavailable, SPOOL_MAX_ATTEMPTS
+
+
+class Recorder:
+    """
+    forward() stand-in: records frames; `fail` maps a frame "n" to the
+    exception it raises
+    """
+
+    def __init__(self, fail=None):
+        self.forwarded = []
+        self.calls = 0
+        self.fail = fail or {}
+
+    def __call__(self, device_id, frame, key):
+        self.calls += 1
+        error = self.fail.get(frame["n"])
+        if error:
+            raise error
+        self.forwarded.append((device_id, frame["n"], key))
+
+
+def _spool(root, forward, **kwargs):
+    return TelemetrySpool(str(root), forward, segment_bytes=64 * 1024, group_commit_ms=0, **kwargs)
+
+
+def _crashed_worker(root, frames, slot=None):
+    """
+    A worker that spooled frames and died before replaying them
+    """
+    spool = _spool(root, Recorder(), slot=slot)
+    for n in frames:
+        spool.append("helmet_01", {"n": n}, sync=False)
+    spool.close()
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_replays_in_order_with_idempotency_keys(tmp_path):
+    forward = Recorder()
+    spool = _spool(tmp_path, forward).start()
+    try:
+        keys = [spool.append("helmet_01", {"n": n}) for n in range(5)]
+        _wait_for(lambda: len(forward.forwarded) == 5)
+    finally:
+        spool.stop()
+
+    assert [n for _, n, _ in forward.forwarded] == list(range(5))
+    assert [key for _, _, key in forward.forwarded] == keys
+    assert spool.status()["replayed"] == 5
+
+
+def test_restart_replays_what_the_previous_worker_left(tmp_path):
+    _crashed_worker(tmp_path, range(3))
+
+    forward = Recorder()
+    spool = _spool(tmp_path, forward)
+    assert spool.drain() == 3
+    assert [n for _, n, _ in forward.forwarded] == [0, 1, 2]
+
+    # The cursor was saved: a second restart forwards nothing again
+    spool.close()
+    again = Recorder()
+    assert _spool(tmp_path, again).drain() == 0
+
+
+def test_poison_frame_is_dead_lettered_and_does_not_block(tmp_path):
+    _crashed_worker(tmp_path, range(3))
+
+    forward = Recorder(fail={1: TypeError("'<' not supported between 'str' and 'int'")})
+    spool = _spool(tmp_path, forward)
+    assert spool.drain() == 3
+
+    assert [n for _, n, _ in forward.forwarded] == [0, 2]
+    assert forward.calls == 2 + SPOOL_MAX_ATTEMPTS
+    status = spool.status()
+    assert status["replayed"] == 2
+    assert status["dead_lettered"] == 1
+
+    with open(os.path.join(spool.path, "dead-letter.jsonl")) as f:
+        entries = [json.loads(line) for line in f]
+    assert len(entries) == 1
+    assert entries[0]["record"]["frame"] == {"n": 1}
+    assert entries[0]["attempts"] == SPOOL_MAX_ATTEMPTS
+    assert entries[0]["error"].startswith("TypeError")
+
+
+def test_backend_failure_is_retried_not_dead_lettered(tmp_path):
+    _crashed_worker(tmp_path, range(3))
+
+    spool = _spool(tmp_path, Recorder(fail={1: ConnectionError("backend down")}))
+    # Stops at the failing frame and keeps it for later
+    assert spool.drain() == 1
+    assert spool.status()["dead_lettered"] == 0
+
+    spool.forward = Recorder()
+    assert spool.drain() == 2
+    assert [n for _, n, _ in spool.forward.forwarded] == [1, 2]
+
+
+def test_orphaned_slot_is_drained_by_another_worker(tmp_path):
+    forward = Recorder()
+    live = _spool(tmp_path, forward)          # slot-0
+    _crashed_worker(tmp_path, range(4), slot=1)
+
+    assert live.drain_orphans() == 4
+    assert [n for _, n, _ in forward.forwarded] == [0, 1, 2, 3]
+    assert live.drain_orphans() == 0
+
+
+def test_orphan_scan_skips_slots_held_by_live_workers(tmp_path):
+    forward = Recorder()
+    live = _spool(tmp_path, forward)
+    other = _spool(tmp_path, Recorder())      # slot-1, still running
+    other.append("helmet_01", {"n": 7}, sync=False)
+
+    assert live.drain_orphans() == 0
+    assert forward.forwarded == []
+    other.close()
+
+
+def test_frame_too_large_for_a_segment_is_rejected(tmp_path):
+    spool = _spool(tmp_path, Recorder())
+    with pytest.raises(ValueError):
+        spool.append("helmet_01", {"n": 0, "blob": "x" * 70 * 1024}, sync=False)
+
+
+def test_msync_failure_makes_append_raise_instead_of_blocking(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool_module, "SPOOL_FLUSH_RETRY_SECONDS", 0.05)
+    spool = _spool(tmp_path, Recorder())
+
+    def eio(mm, offset=0, size=0):
+        raise OSError(5, "Input/output error")
+
+    spool._sync = eio
+    spool.start()
+    try:
+        started = time.monotonic()
+        with pytest.raises(SpoolUnavailable) as raised:
+            spool.append("helmet_01", {"n": 0})
+        assert time.monotonic() - started < spool_module.SPOOL_SYNC_TIMEOUT_SECONDS
+        # The record may still be replayed later, under this key
+        assert raised.value.key == spool._key(0)
+        assert "Input/output error" in spool.status()["failing"]
+
+        # While failing, new frames are refused without entering the spool
+        with pytest.raises(SpoolUnavailable) as raised:
+            spool.append("helmet_01", {"n": 1})
+        assert raised.value.key is None
+
+        # The flusher survived and recovers once msync works again
+        del spool._sync
+        _wait_for(lambda: spool.status()["failing"] is None)
+        spool.append("helmet_01", {"n": 2})
+    finally:
+        spool.stop()
+
+
+def test_sync_append_gives_up_when_nothing_flushes(tmp_path, monkeypatch):
+    monkeypatch.setattr(spool_module, "SPOOL_SYNC_TIMEOUT_SECONDS", 0.1)
+    spool = _spool(tmp_path, Recorder())   # flusher never started
+    with pytest.raises(SpoolUnavailable) as raised:
+        spool.append("helmet_01", {"n": 0})
+    assert raised.value.key == spool._key(0)
+
+
+def test_segments_are_allocated_up_front(tmp_path):
+    spool = _spool(tmp_path, Recorder())
+    segment = os.path.join(spool.path, "segment-000000000000.log")
+    assert os.stat(segment).st_blocks * 512 >= spool.segment_bytes
@@ -0,0 +1,135 @@
+# backend/tests/test_state_table.py
+
+import os
+import uuid
+import multiprocessing
+
+import pytest
+
+from services import state_table
+from services.state_table import StateTable
+
+
+@pytest.fixture
+def table(tmp_path):
+    table = StateTable(name=f"test_state_{uuid.uuid4().hex[:12]}", slots=64,
+                       lock_path=str(tmp_path / "state.lock"))
+    yield table
+    table.close(unlink=True)
+
+
+def _frame(i):
+    return {"pitch": float(i), "gyroY": float(i), "bodyTemp": float(i), "heartRate": float(i), "serverTime": i}
+
+
+def test_round_trip(table):
+    assert table.get("helmet_01") is None
+    table.update("helmet_01", {"pitch": -12.5, "serverTime": 1700000000, "isDrowsy": True})
+    table.update("helmet_01", motor="OFF")
+
+    state = table.get("helmet_01")
+    assert state["pitch"] == -12.5
+    assert state["gyroY"] is None
+    assert state["serverTime"] == 1700000000
+    assert state["isDrowsy"] is True
+    assert state["motor"] == "OFF"
+    assert state["seq"] % 2 == 0
+
+
+class _ReadDuringWrite:
+    """
+    SLOT stand-in that runs a reader right after the writer has stored
+    the fields, before it publishes the even sequence number
+    """
+
+    def __init__(self, slot, read):
+        self._slot = slot
+        self._read = read
+        self.seen = []
+
+    def pack_into(self, buf, offset, *values):
+        self._slot.pack_into(buf, offset, *values)
+        self.seen.append(self._read())
+
+    def __getattr__(self, name):
+        return getattr(self._slot, name)
+
+
+def test_reader_never_sees_a_slot_mid_write(table, monkeypatch):
+    table.update("helmet_01", _frame(1))
+    index = table._find("helmet_01")
+    probe = _ReadDuringWrite(state_table.SLOT, lambda: table._read_slot(index))
+
+    monkeypatch.setattr(state_table, "SLOT", probe)
+    table.update("helmet_01", _frame(2))
+    monkeypatch.undo()
+
+    assert probe.seen == [None]
+    assert table.get("helmet_01")["pitch"] == 2.0
+
+
+def _writer(name, lock_path, count):
+    table = StateTable(name=name, slots=64, lock_path=lock_path)
+    for i in range(1, count + 1):
+        table.update("helmet_01", _frame(i))
+    table.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_concurrent_writer_and_reader_stay_consistent(table):
+    table.update("helmet_01", _frame(1))
+    count = 20000
+    writer = multiprocessing.get_context("fork").Process(
+        target=_writer, args=(table.name, table.lock_path, count)
+    )
+    writer.start()
+
+    reads, last = 0, -1
+    while writer.is_alive() or last < count:
+        state = table.get("helmet_01")
+        if state is None:
+            continue
+        values = {state[f] for f in ("pitch", "gyroY", "bodyTemp", "heartRate")}
+        assert values == {float(state["serverTime"])}, state
+        assert state["serverTime"] >= last
+        last = state["serverTime"]
+        reads += 1
+    writer.join()
+
+    assert writer.exitcode == 0
+    assert last == count
+    assert reads
+
+
+def test_ids_sharing_a_32_byte_prefix_do_not_share_a_slot(table):
+    first = "site-north-warehouse-helmet-000001"
+    second = "site-north-warehouse-helmet-000002"
+    assert not table.update(first, {"isDrowsy": True, "serverTime": 1700000000})
+    assert table.get(first) is None
+    assert table.get(second) is None
+    assert table.advance_session(second, 1700000000, 60) is None
+
+    # Exactly 32 bytes still fits
+    table.update("h" * 32, {"isDrowsy": True, "serverTime": 1700000000})
+    assert table.get("h" * 32)["isDrowsy"] is True
+    assert table.device_ids() == ["h" * 32]
+
+
+def test_control_refresh_uses_its_own_pool_in_batches(table, monkeypatch):
+    for i in range(5):
+        table.update(f"helmet_{i:02d}", {"serverTime": 1700000000})
+
+    calls = []
+
+    def fan_out(tasks, executor=None):
+        calls.append((sorted(tasks), executor))
+        return {device_id: {"motor": "OFF"} for device_id in tasks}
+
+    monkeypatch.setattr(state_table, "fan_out", fan_out)
+    monkeypatch.setattr(state_table, "get_control_ref", lambda device_id: device_id)
+    monkeypatch.setattr(state_table, "STATE_CONTROL_BATCH", 2)
+    state_table._mirror_controls(table)
+
+    assert [len(ids) for ids, _ in calls] == [2, 2, 1]
+    assert {executor for _, executor in calls} == {state_table._control_executor}
+    assert all(table.get(f"helmet_{i:02d}")["motor"] == "OFF" for i in range(5))
@@ -0,0 +1,28 @@
+# backend/tests/test_telemetry.py
+
+import pytest
+
+from services.telemetry import normalize_frame
+
+
+def test_numeric_strings_are_coerced():
+    frame = normalize_frame({"pitch": "-12.5", "gyroY": 3, "bodyTemp": 36.6, "isDrowsy": "true"})
+    assert frame == {"pitch": -12.5, "gyroY": 3.0, "bodyTemp": 36.6, "isDrowsy": True}
+
+
+def test_null_reading_is_dropped():
+    assert normalize_frame({"pitch": None, "heartRate": 70}) == {"heartRate": 70.0}
+
+
+@pytest.mark.parametrize("frame", [
+    {"pitch": "bad"},
+    {"gyroY": [1]},
+    {"bodyTemp": True},
+    {"heartRate": float("nan")},
+    {"isDrowsy": "maybe"},
+    {"isDrowsy": {"x": 1}},
+    ["not", "an", "object"],
+])
+def test_malformed_frames_are_rejected(frame):
+    with pytest.raises(ValueError):
+        normalize_frame(frame)